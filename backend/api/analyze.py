@@ -1,27 +1,41 @@
-
-from fastapi import APIRouter, Body
-from backend.services import copilot_service, prontuario_service, staging_service
+import json
+from typing import AsyncIterator, List, Optional
+from fastapi import APIRouter, Body, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from backend.services import analysis_service, staging_service
 
 router = APIRouter(prefix="/patients", tags=["analyze"])
 
+class BatchAnalyzeRequest(BaseModel):
+    # Empty: every patient
+    patient_ids: List[str] = []
+    concurrency: Optional[int] = Field(None, ge=1, le=32)
+
 @router.post("/{patient_id}/analyze")
-def analyze_patient(patient_id: str):
-    prontuario = prontuario_service.get_prontuario(patient_id) or ""
-    staging = staging_service.get_staging(patient_id)
-    
-    full_text = prontuario + "\n\n---\n\n" + staging
-    
-    result = copilot_service.analyze_text(full_text)
+async def analyze_patient(patient_id: str):
+    try:
+        result = await analysis_service.analyze_patient(patient_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    result.pop("cached", None)
     return result
 
+async def _ndjson(patient_ids: List[str], concurrency: Optional[int]) -> AsyncIterator[str]:
+    async for item in analysis_service.analyze_batch(patient_ids, concurrency):
+        yield json.dumps(item, ensure_ascii=False) + "\n"
+
+@router.post("/analyze/batch")
+async def analyze_batch(payload: BatchAnalyzeRequest):
+    """Analyze a day's agenda; one NDJSON line per patient, in completion order."""
+    patient_ids = payload.patient_ids or analysis_service.all_patient_ids()
+    concurrency = payload.concurrency or min(analysis_service.batch_concurrency(), 32)
+    return StreamingResponse(_ndjson(patient_ids, concurrency), media_type="application/x-ndjson")
+
 @router.post("/{patient_id}/suggestions/{suggestion_id}/accept")
 def accept_suggestion(patient_id: str, suggestion_id: str, suggestion_text: str = Body(..., embed=True)):
-    # Append suggestion to staging
-    current_staging = staging_service.get_staging(patient_id)
-    if current_staging:
-        new_content = current_staging + "\n\n" + suggestion_text
-    else:
-        new_content = suggestion_text
-        
-    staging_service.update_staging(patient_id, new_content)
-    return {"status": "success"}
+    # Append suggestion to staging (an append op: no read-modify-write of the draft)
+    revision = staging_service.append_staging(patient_id, suggestion_text, separator="\n\n")
+    return {"status": "success", "revision": revision}
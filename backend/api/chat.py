@@ -1,11 +1,62 @@
-
+import asyncio
+import contextlib
+import json
+import logging
+from typing import AsyncIterator
 from fastapi import APIRouter, Body
-from backend.services import copilot_service, prontuario_service
+from fastapi.responses import StreamingResponse
+from backend.services import copilot_service, retrieval_service, summary_service
+import os
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/copilot", tags=["chat"])
 
+def _chat_context(patient_id: str, question: str) -> str:
+    # Reads and stats chart files: async handlers run it in a worker thread
+    budget = int(os.getenv("CHAT_PRONTUARIO_TOKENS", "6000"))
+    context = summary_service.prontuario_context(patient_id, budget) or ""
+    # Exams and other documents of the patient: only the chunks relevant to the question
+    chunks = retrieval_service.retrieve(
+        patient_id,
+        question,
+        k=int(os.getenv("CHAT_RETRIEVAL_TOP_K", "5")),
+        budget_tokens=int(os.getenv("CHAT_RETRIEVAL_TOKENS", "1500")),
+        skip_text=context,
+    )
+    if chunks:
+        context += "\n\nTrechos relevantes de outros documentos do paciente:\n\n" + retrieval_service.format_chunks(chunks)
+    return context
+
 @router.post("/chat")
-def chat(patient_id: str = Body(...), question: str = Body(...)):
-    prontuario = prontuario_service.get_prontuario(patient_id) or ""
-    response = copilot_service.chat_response(question, prontuario)
+async def chat(patient_id: str = Body(...), question: str = Body(...)):
+    prontuario = await asyncio.to_thread(_chat_context, patient_id, question)
+    response = await copilot_service.chat_response(question, prontuario)
     return {"response": response}
+
+def _sse(data: dict, event: str = None) -> str:
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _stream_events(question: str, prontuario: str) -> AsyncIterator[str]:
+    try:
+        # Closed explicitly when the client disconnects, so the scheduler slot and upstream stream are released
+        async with contextlib.aclosing(copilot_service.chat_response_stream(question, prontuario)) as deltas:
+            async for delta in deltas:
+                yield _sse({"delta": delta})
+    except Exception:
+        # Headers are already sent: report the failure in-band
+        logger.exception("chat stream failed")
+        yield _sse({"detail": "Erro na análise clínica"}, event="error")
+        return
+    yield _sse({}, event="done")
+
+@router.post("/chat/stream")
+async def chat_stream(patient_id: str = Body(...), question: str = Body(...)):
+    """Server-Sent Events: `data: {"delta": ...}` per token chunk, then `event: done` (or `event: error`)."""
+    prontuario = await asyncio.to_thread(_chat_context, patient_id, question)
+    return StreamingResponse(
+        _stream_events(question, prontuario),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
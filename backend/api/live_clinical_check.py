@@ -1,14 +1,29 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import List
-from openai import OpenAI
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
 import os
 import json
+import asyncio
+import logging
+from collections import OrderedDict
+from backend.services import llm_gateway, clinical_session_service, metrics, red_flags, summary_service
+from backend.services.result_cache import AsyncResultCache, content_key
 
 class LiveClinicalCheckRequest(BaseModel):
     patient_id: str
     prontuario: str
     transcript_partial: str
+    # Scopes the red-flag gate to one consultation; without it, the patient's current transcript is used
+    consultation_id: Optional[str] = None
+
+class TranscriptDelta(BaseModel):
+    seq: int
+    text: str
+
+class ClinicalSessionState(BaseModel):
+    patient_id: str
+    seq: int
+    transcript_chars: int
 
 class CriticalAlert(BaseModel):
     title: str
@@ -17,12 +32,60 @@ class CriticalAlert(BaseModel):
     urgency_level: str
     recommended_actions: List[str]
 
+class RedFlagAlert(BaseModel):
+    id: str
+    title: str
+    urgency: str
+    term: str
+    evidence: str = ""
+
 class LiveClinicalCheckResponse(BaseModel):
     critical_alerts: List[CriticalAlert]
     missing_questions: List[str]
     recommended_conducts: List[str]
+    # Provisional alerts of the local detector; the fields above come from the LLM check
+    red_flags: List[RedFlagAlert] = []
 
 router = APIRouter(prefix="/api", tags=["live_clinical"])
+logger = logging.getLogger(__name__)
+
+# Identical (model, prompt, prontuario, transcript window) requests share one upstream call
+_result_cache = AsyncResultCache(
+    max_entries=int(os.getenv("LIVE_CLINICAL_CACHE_SIZE", "256")),
+    ttl_s=float(os.getenv("LIVE_CLINICAL_CACHE_TTL_S", "60")),
+)
+
+def _with_red_flags(result: "LiveClinicalCheckResponse", flags: List[Dict[str, Any]]) -> "LiveClinicalCheckResponse":
+    return result.model_copy(update={"red_flags": [RedFlagAlert(**f) for f in flags]})
+
+def red_flag_gate() -> bool:
+    """Once a consultation has an LLM answer, re-run the check only when the local detector finds a
+    red flag not seen before in it; meanwhile the last answer is served again."""
+    return red_flags.enabled() and os.getenv("LIVE_CLINICAL_RED_FLAG_GATE", "1") == "1"
+
+class _GateState:
+    """Stateless endpoint: flags already escalated in a consultation and the LLM answer they got."""
+
+    __slots__ = ("escalated", "result", "prontuario_key", "transcript_chars", "transcript_key")
+
+    def __init__(self, escalated: Set[str], result: "LiveClinicalCheckResponse", prontuario: str, transcript: str):
+        self.escalated = escalated
+        self.result = result
+        self.prontuario_key = content_key(prontuario)
+        self.transcript_chars = len(transcript)
+        self.transcript_key = content_key(transcript)
+
+    def continues(self, prontuario: str, transcript: str) -> bool:
+        """Same chart, and the transcript grew from the one the answer was built on (same consultation)."""
+        return (
+            content_key(prontuario) == self.prontuario_key
+            and len(transcript) >= self.transcript_chars
+            and content_key(transcript[:self.transcript_chars]) == self.transcript_key
+        )
+
+# Structure: {consultation_id or patient_id: _GateState}
+_gate_state: "OrderedDict[str, _GateState]" = OrderedDict()
+_GATE_CONSULTATIONS = int(os.getenv("LIVE_CLINICAL_GATE_CONSULTATIONS", "1024"))
 
 SYSTEM_PROMPT = (
     "Você é um sistema de SEGURANÇA CLÍNICA EM TEMPO REAL para consultas médicas.\n"
@@ -58,6 +121,45 @@ def build_user_message(req: LiveClinicalCheckRequest) -> str:
         + f"Tarefa: avaliar segurança clínica da consulta em andamento para o paciente {req.patient_id}.\n"
     )
 
+async def run_clinical_check(patient_id: str, prontuario: str, transcript: str) -> LiveClinicalCheckResponse:
+    if not llm_gateway.is_configured():
+        raise HTTPException(status_code=500, detail="OPENAI_API_KEY not set")
+
+    req = LiveClinicalCheckRequest(
+        patient_id=patient_id,
+        prontuario=prontuario,
+        transcript_partial=transcript,
+    )
+    model = llm_gateway.default_chat_model()
+    user_message = build_user_message(req)
+
+    async def compute() -> LiveClinicalCheckResponse:
+        try:
+            raw = await llm_gateway.chat_completion(
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": user_message},
+                ],
+                model=model,
+                response_format={"type": "json_object"},
+                purpose="clinical_check",
+            )
+            data = json.loads(raw)
+            alerts = data.get("critical_alerts") or []
+            missing = data.get("missing_questions") or []
+            conducts = data.get("recommended_conducts") or []
+            return LiveClinicalCheckResponse(
+                critical_alerts=[CriticalAlert(**a) for a in alerts],
+                missing_questions=missing,
+                recommended_conducts=conducts,
+            )
+        except Exception:
+            logger.exception("live clinical check failed", extra={"patient_id": patient_id})
+            raise HTTPException(status_code=500, detail="Erro na análise clínica em tempo real")
+
+    key = content_key(model, SYSTEM_PROMPT, user_message)
+    return await _result_cache.get_or_compute(key, compute)
+
 @router.post("/live-clinical-check", response_model=LiveClinicalCheckResponse)
 async def live_clinical_check(payload: LiveClinicalCheckRequest):
     # if len(payload.transcript_partial.strip()) < 30:
@@ -67,40 +169,180 @@ async def live_clinical_check(payload: LiveClinicalCheckRequest):
     #         recommended_conducts=[],
     #     )
 
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise HTTPException(status_code=500, detail="OPENAI_API_KEY not set")
-
     max_chars = int(os.getenv("LIVE_CLINICAL_MAX_CHARS", "10000"))
-    prontuario = payload.prontuario[-max_chars:]
     transcript = payload.transcript_partial[-max_chars:]
-    req = LiveClinicalCheckRequest(
-        patient_id=payload.patient_id,
-        prontuario=prontuario,
-        transcript_partial=transcript,
+    flags = [m.to_dict(transcript) for m in red_flags.get_detector().affirmed(transcript)] if red_flags.enabled() else []
+    flag_ids = {f["id"] for f in flags}
+    gate_key = payload.consultation_id or payload.patient_id
+    state = _gate_state.get(gate_key)
+    if state is not None and not state.continues(payload.prontuario, payload.transcript_partial):
+        # Another consultation (or an edited draft): nothing from the old answer carries over
+        state = None
+    escalated = state.escalated if state is not None else set()
+    # Only an existing answer is reused: the first check of a consultation always runs
+    if red_flag_gate() and state is not None and flag_ids <= escalated:
+        metrics.registry.inc("live_clinical.gated_checks")
+        return _with_red_flags(state.result, flags)
+    # Section-aware: header, allergies and problem list survive even on long charts
+    prontuario = summary_service.context_from_text(
+        payload.prontuario, clinical_session_service.prontuario_budget_tokens()
     )
+    result = await run_clinical_check(payload.patient_id, prontuario, transcript)
+    if red_flag_gate():
+        _gate_state[gate_key] = _GateState(escalated | flag_ids, result, payload.prontuario, payload.transcript_partial)
+        _gate_state.move_to_end(gate_key)
+        while len(_gate_state) > _GATE_CONSULTATIONS:
+            _gate_state.popitem(last=False)
+    return _with_red_flags(result, flags)
+
+def _session_state(session: clinical_session_service.ConsultationSession) -> ClinicalSessionState:
+    return ClinicalSessionState(
+        patient_id=session.patient_id,
+        seq=session.seq,
+        transcript_chars=session.transcript_chars,
+    )
+
+def _require_session(patient_id: str) -> clinical_session_service.ConsultationSession:
+    session = clinical_session_service.get_session(patient_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
 
+def _apply_delta(session: clinical_session_service.ConsultationSession, delta: TranscriptDelta):
     try:
-        client = OpenAI(api_key=api_key)
-        completion = client.chat.completions.create(
-            model=os.getenv("OPENAI_CLINICAL_MODEL") or "gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": build_user_message(req)},
-            ],
-            response_format={"type": "json_object"},
-        )
-        raw = completion.choices[0].message.content
-        data = json.loads(raw)
-        alerts = data.get("critical_alerts") or []
-        missing = data.get("missing_questions") or []
-        conducts = data.get("recommended_conducts") or []
-        return LiveClinicalCheckResponse(
-            critical_alerts=[CriticalAlert(**a) for a in alerts],
-            missing_questions=missing,
-            recommended_conducts=conducts,
-        )
-    except Exception as e:
-        print("live_clinical_check error:", e)
-        raise HTTPException(status_code=500, detail="Erro na análise clínica em tempo real")
+        return session.append(delta.seq, delta.text)
+    except clinical_session_service.SequenceGapError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "expected_seq": e.expected})
+
+@router.post("/live-clinical-check/sessions/{patient_id}", response_model=ClinicalSessionState)
+def open_clinical_session(patient_id: str):
+    """Start a consultation session; the prontuario is loaded once on the server."""
+    session = clinical_session_service.open_session(patient_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return _session_state(session)
+
+@router.post("/live-clinical-check/sessions/{patient_id}/transcript", response_model=ClinicalSessionState)
+def append_clinical_transcript(patient_id: str, delta: TranscriptDelta):
+    """Append only the new transcript text, numbered by the session cursor."""
+    session = _require_session(patient_id)
+    _apply_delta(session, delta)
+    return _session_state(session)
+
+@router.post("/live-clinical-check/sessions/{patient_id}/check", response_model=LiveClinicalCheckResponse)
+async def check_clinical_session(patient_id: str, delta: Optional[TranscriptDelta] = None):
+    """Optionally append a delta, then run the safety check over the session window.
+
+    With the red-flag gate on, once the session has an answer the LLM only runs again for a new red
+    flag; otherwise the last answer is returned with the current provisional alerts.
+    """
+    session = _require_session(patient_id)
+    if delta is not None:
+        _apply_delta(session, delta)
+    pending = len(session.new_red_flags)
+    if red_flag_gate() and not pending and session.last_check is not None:
+        metrics.registry.inc("live_clinical.gated_checks")
+        return _with_red_flags(session.last_check, session.red_flag_alerts())
+    result = await run_clinical_check(session.patient_id, session.prontuario, session.transcript_window())
+    # Flags found while the check was running escalate the next one
+    del session.new_red_flags[:pending]
+    session.last_check = result
+    return _with_red_flags(result, session.red_flag_alerts())
+
+@router.get("/live-clinical-check/cache")
+def clinical_cache_stats():
+    """Hit, miss and coalesce counters of the live clinical check cache."""
+    return _result_cache.stats()
+
+@router.delete("/live-clinical-check/sessions/{patient_id}")
+def close_clinical_session(patient_id: str):
+    clinical_session_service.close_session(patient_id)
+    return {"status": "success"}
+
+
+class LiveClinicalTrigger:
+    """Re-runs the safety check as a realtime transcript grows and pushes `clinical_update` messages.
+
+    A new red flag (`escalate`) runs the check as soon as its text is final. Checks also run by transcript
+    size and sentence ends; with the red-flag gate on, only until the first answer was pushed.
+    """
+
+    SENTENCE_END = (".", "?", "!", "…")
+
+    def __init__(self, session: clinical_session_service.ConsultationSession, send: Callable[[Dict[str, Any]], Awaitable[None]],
+                 window: Optional[Callable[[], str]] = None):
+        self.session = session
+        self.send = send
+        # Optional external transcript source (e.g. a TranscriptStore); otherwise the session window is used
+        self.window = window
+        self.threshold_chars = int(os.getenv("LIVE_CLINICAL_TRIGGER_CHARS", "200"))
+        self.min_sentence_chars = int(os.getenv("LIVE_CLINICAL_TRIGGER_MIN_CHARS", "40"))
+        self._pending_chars = 0
+        self._fed = 0
+        self.gated = red_flag_gate()
+        self._escalated = False
+        self._answered = False
+        self._task: Optional[asyncio.Task] = None
+        self._rerun = False
+
+    @classmethod
+    def for_patient(cls, patient_id: str, send: Callable[[Dict[str, Any]], Awaitable[None]],
+                    window: Optional[Callable[[], str]] = None) -> Optional["LiveClinicalTrigger"]:
+        session = clinical_session_service.create_session(patient_id)
+        if session is None:
+            return None
+        return cls(session, send, window)
+
+    def escalate(self):
+        """A red flag appeared for the first time; the next finalized text runs the check."""
+        self._escalated = True
+
+    def feed(self, text: str):
+        """Add finalized transcript text; schedules a check past the size threshold or at a sentence end."""
+        if not text:
+            return
+        self._fed += 1
+        if self.window is None:
+            self.session.append(self.session.seq, text if text.endswith(" ") else text + " ")
+            if self.session.new_red_flags:
+                self.session.new_red_flags.clear()
+                self._escalated = True
+        if self._escalated:
+            self._escalated = False
+            self._pending_chars = 0
+            self._schedule()
+            return
+        if self.gated and self._answered:
+            return
+        self._pending_chars += len(text)
+        at_sentence_end = text.rstrip().endswith(self.SENTENCE_END) and self._pending_chars >= self.min_sentence_chars
+        if self._pending_chars >= self.threshold_chars or at_sentence_end:
+            self._pending_chars = 0
+            self._schedule()
+
+    def _schedule(self):
+        if self._task is not None and not self._task.done():
+            # A check is already running; run once more with the newer window when it ends
+            self._rerun = True
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            self._rerun = False
+            try:
+                fed = self._fed
+                transcript = self.window() if self.window is not None else self.session.transcript_window()
+                result = await run_clinical_check(self.session.patient_id, self.session.prontuario, transcript)
+                await self.send({"type": "clinical_update", "seq": fed, **result.model_dump()})
+                self._answered = True
+            except HTTPException as e:
+                await self.send({"type": "clinical_update_error", "detail": e.detail})
+            except Exception:
+                logger.exception("live clinical trigger failed", extra={"patient_id": self.session.patient_id})
+            if not self._rerun:
+                break
 
+    def close(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
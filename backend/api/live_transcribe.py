@@ -1,72 +1,163 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from fastapi.responses import JSONResponse
-from openai import OpenAI
-import os
+from typing import Optional
+from backend.services import llm_gateway, transcribe_pipeline, transcript_store
+import logging
 
 router = APIRouter(prefix="/api/transcribe-legacy", tags=["transcribe", "legacy"])
+logger = logging.getLogger(__name__)
+
+def _normalize_segments(segments_raw):
+    def _to_segment_dict(s):
+        if isinstance(s, dict):
+            return s
+        try:
+            return {
+                "id": getattr(s, "id", None),
+                "start": getattr(s, "start", None),
+                "end": getattr(s, "end", None),
+                "speaker": getattr(s, "speaker", None),
+                "text": getattr(s, "text", None),
+                "type": getattr(s, "type", None),
+            }
+        except Exception:
+            for attr in ("dict", "model_dump", "__dict__"):
+                try:
+                    converter = getattr(s, attr, None)
+                    if callable(converter):
+                        return converter()
+                    if isinstance(converter, dict):
+                        return converter
+                except Exception:
+                    pass
+            return str(s)
+
+    if isinstance(segments_raw, list):
+        return [_to_segment_dict(seg) for seg in segments_raw]
+    if isinstance(segments_raw, dict):
+        return [segments_raw]
+    return []
+
+def _seconds(value, default: float) -> float:
+    return float(value) if isinstance(value, (int, float)) else default
+
+def _offset_segments(segments, offset: float):
+    """Chunk-relative segment times shifted to consultation time."""
+    shifted = []
+    for seg in segments:
+        if not isinstance(seg, dict):
+            continue
+        start = _seconds(seg.get("start"), 0.0)
+        end = _seconds(seg.get("end"), start)
+        shifted.append({**seg, "start": offset + start, "end": offset + end})
+    return shifted
+
+def _chunk_end(segments, duration_s: Optional[float]) -> float:
+    if duration_s:
+        return duration_s
+    return max((_seconds(seg.get("end"), 0.0) for seg in segments if isinstance(seg, dict)), default=0.0)
+
+def _stitch(consultation_id: str, text: str, segments, offset: float):
+    """Append the chunk to the consultation store; returns the stored segments."""
+    store = transcript_store.get_store(consultation_id)
+    first = len(store)
+    for seg in _offset_segments(segments, offset):
+        store.append(seg["start"], seg["end"], seg.get("speaker"), seg.get("text") or "")
+    if len(store) == first and text:
+        store.append(offset, offset, None, text)
+    return store.segments(first)
 
 @router.post("/live")
-async def transcribe_live_chunk(file: UploadFile = File(...)):
+async def transcribe_live_chunk(
+    file: UploadFile = File(...),
+    patient_id: Optional[str] = Form(None),
+    session_id: Optional[str] = Form(None),
+    seq: Optional[int] = Form(None),
+    duration_ms: Optional[float] = Form(None),
+):
+    """Transcribe one recorded chunk.
+
+    With `session_id` and `seq`, chunks of a recording may be uploaded concurrently:
+    they are transcribed in parallel and answered in `seq` order, with timestamps
+    offset by the chunks before them (`duration_ms` gives a chunk's exact length).
+    The recording is one consultation: chunks are stitched into its transcript
+    (`consultation_id` in the answer) until the session is ended.
+    """
     try:
         if file is None:
             raise HTTPException(status_code=400, detail="Missing 'file' in multipart form-data")
 
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
+        if not llm_gateway.is_configured():
             raise HTTPException(status_code=500, detail="OPENAI_API_KEY not set")
 
-        file_bytes = await file.read()
-        client = OpenAI(api_key=api_key)
+        pipeline = None
+        if session_id is not None and seq is not None:
+            pipeline = transcribe_pipeline.get_pipeline(session_id, patient_id)
 
         # Call diarization transcription
-        # SDK expects a tuple: (filename, file_bytes, content_type)
-        resp = client.audio.transcriptions.create(
-            file=(file.filename or "chunk.webm", file_bytes, file.content_type or "audio/webm"),
-            model="gpt-4o-transcribe-diarize",
-            response_format="diarized_json",
-        )
-
-        # Normaliza resposta para tipos JSON-serializáveis
-        text = getattr(resp, "text", None) or (resp.get("text") if isinstance(resp, dict) else None) or ""
-        segments_raw = getattr(resp, "segments", None) or (resp.get("segments") if isinstance(resp, dict) else None) or []
-
-        def _to_segment_dict(s):
-            if isinstance(s, dict):
-                return s
-            try:
-                return {
-                    "id": getattr(s, "id", None),
-                    "start": getattr(s, "start", None),
-                    "end": getattr(s, "end", None),
-                    "speaker": getattr(s, "speaker", None),
-                    "text": getattr(s, "text", None),
-                    "type": getattr(s, "type", None),
-                }
-            except Exception:
-                for attr in ("dict", "model_dump", "__dict__"):
-                    try:
-                        converter = getattr(s, attr, None)
-                        if callable(converter):
-                            return converter()
-                        if isinstance(converter, dict):
-                            return converter
-                    except Exception:
-                        pass
-                return str(s)
-
-        segments = []
-        if isinstance(segments_raw, list):
-            segments = [_to_segment_dict(seg) for seg in segments_raw]
-        elif isinstance(segments_raw, dict):
-            segments = [segments_raw]
-        else:
-            segments = []
-
-        print(f'>>>>>>>>>>>{text}')
-
-        return JSONResponse({"text": text, "segments": segments})
+        # The spooled upload is handed to the SDK as a file object and streamed into the
+        # multipart request, instead of being read into one bytes object first
+        error = None
+        text, segments = "", []
+        try:
+            async with transcribe_pipeline.transcribe_slot():
+                resp = await llm_gateway.transcribe(
+                    file=(file.filename or "chunk.webm", file.file, file.content_type or "audio/webm"),
+                    model="gpt-4o-transcribe-diarize",
+                    response_format="diarized_json",
+                )
+            # Normaliza resposta para tipos JSON-serializáveis
+            text = getattr(resp, "text", None) or (resp.get("text") if isinstance(resp, dict) else None) or ""
+            segments_raw = getattr(resp, "segments", None) or (resp.get("segments") if isinstance(resp, dict) else None) or []
+            segments = _normalize_segments(segments_raw)
+        except Exception as e:
+            if pipeline is None:
+                raise
+            error = e
+
+        duration_s = duration_ms / 1000.0 if duration_ms else None
+        if pipeline is None:
+            # Without a session there is no consultation to stitch into: timestamps stay chunk-relative
+            logger.debug("legacy chunk transcribed", extra={"chars": len(text), "segments": len(segments)})
+            return JSONResponse({"text": text, "segments": segments})
+
+        # Released in seq order: a failed chunk still takes its turn so later ones are not held back
+        async with pipeline.turn(seq):
+            offset = pipeline.offset_s
+            # A retried chunk, or one arriving after its gap was skipped, is answered but neither
+            # re-stored nor re-counted
+            duplicate = pipeline.already_released(seq)
+            if error is None:
+                chunk_len = _chunk_end(segments, duration_s)
+                if not duplicate:
+                    segments = _stitch(pipeline.consultation_id, text, segments, offset)
+                else:
+                    segments = _offset_segments(segments, offset)
+                if not duplicate:
+                    pipeline.offset_s = offset + chunk_len
+            elif duration_s and not duplicate:
+                pipeline.offset_s = offset + duration_s
+
+        if error is not None:
+            raise error
+        logger.debug("legacy chunk transcribed", extra={
+            "chars": len(text), "segments": len(segments), "session_id": session_id, "seq": seq,
+        })
+        return JSONResponse({
+            "text": text, "segments": segments, "seq": seq, "offset_s": offset,
+            "consultation_id": pipeline.consultation_id,
+        })
     except HTTPException as e:
         raise e
     except Exception as e:
         # Keep recording even if chunk fails: return error JSON
-        return JSONResponse({"error": str(e)}, status_code=500)
+        logger.warning("legacy chunk transcription failed", extra={"error": str(e)})
+        return JSONResponse({"error": str(e), "seq": seq}, status_code=500)
+
+@router.delete("/live/{session_id}")
+def end_live_session(session_id: str):
+    """End a chunked recording: its consultation transcript is persisted and released from memory."""
+    consultation_id = transcribe_pipeline.close_pipeline(session_id)
+    if consultation_id is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"status": "success", "consultation_id": consultation_id}
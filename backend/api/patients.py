@@ -1,64 +1,146 @@
-
-from fastapi import APIRouter, HTTPException
-from typing import List
+import json
+from fastapi import APIRouter, BackgroundTasks, Header, HTTPException, Query, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Iterator, List, Optional
 from backend.models.patient import Patient
-from backend.models.staging import StagingData
-from backend.services import prontuario_service, staging_service
+from backend.models.staging import StagingData, StagingOps
+from backend.services import prontuario_service, staging_service, clinical_session_service, retrieval_service, summary_service
 
 router = APIRouter(prefix="/patients", tags=["patients"])
 
 @router.get("/", response_model=List[Patient])
-def get_patients():
-    """Get list of all patients."""
-    return prontuario_service.list_patients()
+def get_patients(
+    response: Response,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    q: Optional[str] = None,
+    prefix: Optional[str] = None,
+):
+    """Get list of patients (paginated; `q` = substring, `prefix` = prefix on name or id)."""
+    patients, total = prontuario_service.page_patients(offset=offset, limit=limit, q=q, prefix=prefix)
+    response.headers["X-Total-Count"] = str(total)
+    return patients
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def _stream_file_envelope(path: str, full_path: str) -> Iterator[str]:
+    # Same {"path", "content"} body as the small-file response, produced chunk by chunk
+    yield '{"path": ' + json.dumps(path) + ', "content": "'
+    for chunk in prontuario_service.iter_file_text(full_path):
+        yield json.dumps(chunk)[1:-1]
+    yield '"}'
 
 @router.get("/{patient_id}/files")
-def get_patient_files(patient_id: str):
+def get_patient_files(patient_id: str, if_none_match: Optional[str] = Header(None)):
     """Get file tree structure for a patient."""
-    tree = prontuario_service.get_patient_file_tree(patient_id)
-    if tree is None:
+    result = prontuario_service.get_patient_file_tree_with_etag(patient_id)
+    if result is None:
         raise HTTPException(status_code=404, detail="Patient not found")
-    return tree
+    tree, etag = result
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(tree, headers={"ETag": etag})
 
 @router.get("/{patient_id}/file")
-def get_patient_file(patient_id: str, path: str):
+def get_patient_file(patient_id: str, path: str, if_none_match: Optional[str] = Header(None)):
     """Get content of a specific file."""
+    found = prontuario_service.stat_patient_file(patient_id, path)
+    if found is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    full_path, st = found
+    etag = prontuario_service.file_etag(st)
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    if st.st_size > prontuario_service.stream_threshold_bytes():
+        return StreamingResponse(
+            _stream_file_envelope(path, full_path), media_type="application/json", headers={"ETag": etag}
+        )
     content = prontuario_service.get_file_content(patient_id, path)
     if content is None:
         raise HTTPException(status_code=404, detail="File not found")
-    return {"path": path, "content": content}
+    return JSONResponse({"path": path, "content": content}, headers={"ETag": etag})
 
 @router.get("/{patient_id}/prontuario")
-def get_patient_prontuario(patient_id: str):
-    """Get prontuario content."""
-    content = prontuario_service.get_prontuario(patient_id)
-    if content is None:
+def get_patient_prontuario(patient_id: str, since: Optional[int] = Query(None, ge=0)):
+    """Get prontuario content, or with `since` only what was appended after that version."""
+    if since is not None:
+        tail = prontuario_service.get_prontuario_since(patient_id, since)
+        if tail is None:
+            raise HTTPException(status_code=404, detail="Patient not found")
+        return tail
+    found = prontuario_service.get_prontuario_with_version(patient_id)
+    if found is None:
         raise HTTPException(status_code=404, detail="Patient not found")
-    return {"content": content}
+    content, version = found
+    return {"content": content, "version": version}
 
 @router.get("/{patient_id}/staging")
-def get_patient_staging(patient_id: str):
-    """Get staging content."""
-    content = staging_service.get_staging(patient_id)
-    return {"content": content}
+def get_patient_staging(patient_id: str, since_revision: Optional[int] = Query(None, ge=0)):
+    """Get staging content, or with `since_revision` only the ops applied after it.
+
+    When the op log no longer reaches back to `since_revision`, the full content is
+    returned with `reset: true`.
+    """
+    if since_revision is not None:
+        revision, ops = staging_service.get_staging_ops_since(patient_id, since_revision)
+        if ops is not None:
+            return {"revision": revision, "ops": [{"revision": r, **op} for r, op in ops]}
+    content, revision = staging_service.get_staging_with_revision(patient_id)
+    if since_revision is not None:
+        return {"revision": revision, "reset": True, "content": content}
+    return {"content": content, "revision": revision}
 
 @router.post("/{patient_id}/staging")
 def update_patient_staging(patient_id: str, data: StagingData):
     """Update staging content."""
-    staging_service.update_staging(patient_id, data.content)
-    return {"status": "success"}
+    revision = staging_service.update_staging(patient_id, data.content)
+    return {"status": "success", "revision": revision}
+
+@router.post("/{patient_id}/staging/ops")
+def apply_patient_staging_ops(patient_id: str, data: StagingOps):
+    """Apply edit ops made against `base_revision` (409 if stale, unless they are all appends).
+
+    Appends on a stale base are rebased onto the current draft; the answer then carries the
+    ops from `base_revision` to the new revision (the client's own included, as applied), or
+    the whole content with `reset: true` if the op log no longer reaches back that far.
+    """
+    try:
+        revision = staging_service.apply_staging_ops(
+            patient_id, data.base_revision, [op.model_dump(exclude_none=True) for op in data.ops]
+        )
+    except staging_service.StagingConflict as e:
+        raise HTTPException(status_code=409, detail={"message": "Staging changed", "revision": e.revision})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if revision == data.base_revision + len(data.ops):
+        return {"status": "success", "revision": revision}
+    # Logged ops never change, so the ones up to our revision are exactly what happened up to it
+    _, ops = staging_service.get_staging_ops_since(patient_id, data.base_revision)
+    if ops is not None:
+        return {"status": "success", "revision": revision, "rebased": True,
+                "ops": [{"revision": r, **op} for r, op in ops if r <= revision]}
+    content, current = staging_service.get_staging_with_revision(patient_id)
+    return {"status": "success", "revision": current, "rebased": True, "reset": True, "content": content}
 
 @router.delete("/{patient_id}/staging")
 def clear_patient_staging(patient_id: str):
     """Clear staging content."""
-    staging_service.clear_staging(patient_id)
-    return {"status": "success"}
+    revision = staging_service.clear_staging(patient_id)
+    return {"status": "success", "revision": revision}
 
 @router.post("/{patient_id}/prontuario/append")
-def append_to_prontuario(patient_id: str, data: StagingData):
+def append_to_prontuario(patient_id: str, data: StagingData, background_tasks: BackgroundTasks):
     """Append content to prontuario."""
-    success = prontuario_service.append_to_prontuario(patient_id, data.content)
-    if not success:
+    appended = prontuario_service.append_to_prontuario(patient_id, data.content)
+    if appended is None:
         raise HTTPException(status_code=404, detail="Patient not found")
+    version, offset = appended
     staging_service.clear_staging(patient_id)
-    return {"status": "success"}
+    clinical_session_service.reload_prontuario(patient_id)
+    background_tasks.add_task(summary_service.refresh_summary, patient_id)
+    background_tasks.add_task(retrieval_service.refresh, patient_id)
+    return {"status": "success", "version": version, "offset": offset}
@@ -0,0 +1,572 @@
+from fastapi import APIRouter, WebSocket
+from typing import Any, Dict, List, Optional
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed, WebSocketException
+from backend.api import live_clinical_check
+from backend.services import audio_dsp, metrics, red_flags, transcript_store
+from backend.services.audio_outbox import AudioOutbox
+from backend.services.transcript_store import TranscriptStore
+from collections import deque
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import os
+import random
+import time
+
+router = APIRouter(tags=["transcribe"])
+logger = logging.getLogger(__name__)
+
+DEFAULT_REALTIME_URL = "wss://api.openai.com/v1/realtime?intent=transcription"
+
+
+def to_segment_dict(s):
+    if isinstance(s, dict):
+        return {
+            "id": s.get("id"),
+            "start": s.get("start"),
+            "end": s.get("end"),
+            "speaker": s.get("speaker"),
+            "text": s.get("text"),
+            "type": s.get("type"),
+        }
+    try:
+        return {
+            "id": getattr(s, "id", None),
+            "start": getattr(s, "start", None),
+            "end": getattr(s, "end", None),
+            "speaker": getattr(s, "speaker", None),
+            "text": getattr(s, "text", None),
+            "type": getattr(s, "type", None),
+        }
+    except Exception:
+        return {"text": str(s)}
+
+
+def vad_enabled() -> bool:
+    return os.getenv("VAD_ENABLED", "1") == "1"
+
+
+def vad_commit_pause_ms() -> int:
+    return int(os.getenv("VAD_COMMIT_PAUSE_MS", "700"))
+
+
+def replay_buffer_bytes() -> int:
+    return int(float(os.getenv("RELAY_REPLAY_BUFFER_S", "10")) * audio_dsp.UPSTREAM_BYTES_PER_SECOND)
+
+
+def reconnect_max_attempts() -> int:
+    return int(os.getenv("RELAY_RECONNECT_MAX_ATTEMPTS", "6"))
+
+
+def reconnect_delay_s(failures: int) -> float:
+    """Exponential backoff with jitter: base * 2^failures, capped, times 0.5-1."""
+    base = float(os.getenv("RELAY_RECONNECT_BASE_S", "0.25"))
+    cap = float(os.getenv("RELAY_RECONNECT_MAX_S", "8"))
+    return min(cap, base * 2 ** failures) * random.uniform(0.5, 1.0)
+
+
+def session_update_message() -> str:
+    return json.dumps({
+        "type": "transcription_session.update",
+        "session": {
+            "input_audio_format": "pcm16",
+            "input_audio_transcription": {
+                "model": os.getenv("OPENAI_TRANSCRIBE_MODEL") or "gpt-4o-transcribe",
+                "language": "en"
+            },
+            "input_audio_noise_reduction": {"type": "near_field"},
+            # Turns are detected by the relay (EnergyVAD), which commits the buffer itself
+            "turn_detection": None
+        }
+    })
+
+
+class RealtimeRelay:
+    """Relays one client socket to the upstream realtime API with event-driven pump tasks.
+
+    Client audio goes through a bounded outbox drained by its own sender task, so a
+    stalled upstream costs at most RELAY_OUTBOX_MAX_BYTES per session. The client
+    pump outlives the upstream connection: when upstream drops, the relay
+    reconnects with backoff and replays, from a ring buffer, the audio whose
+    transcript had not arrived yet. Timestamps are consultation time kept here,
+    so they stay continuous across reconnects.
+    """
+
+    def __init__(self, ws: WebSocket, api_key: str):
+        self.ws = ws
+        self.api_key = api_key
+        self.url = os.getenv("OPENAI_REALTIME_URL") or DEFAULT_REALTIME_URL
+        self.upstream = None
+        self.session_ready = asyncio.Event()
+        self.client_meta: Dict[str, Any] = {"sample_rate_hz": 16000, "codec": "pcm16", "patient_id": None}
+        self.clinical_trigger: Optional[live_clinical_check.LiveClinicalTrigger] = None
+        # Local red-flag detector over deltas and finals: provisional alerts without an LLM round-trip
+        self.red_flags = red_flags.RedFlagTracker() if red_flags.enabled() else None
+        # Finalized segments live in a compact store; only the current item's deltas are kept as text
+        self.store = TranscriptStore()
+        # Set at init: the socket is one consultation, unless the client resumes an earlier one
+        self.consultation_id: Optional[str] = None
+        self._complete_from = 0
+        self._partial: List[str] = []
+        # Consultation time reached by the client's audio (sent upstream or dropped as silence),
+        # and the point covered by the last commit
+        self.audio_sent_s = 0.0
+        self._committed_until_s = 0.0
+        self._uncommitted_bytes = 0
+        self.resampler = audio_dsp.PCM16Resampler(self.client_meta["sample_rate_hz"])
+        self.vad: Optional[audio_dsp.EnergyVAD] = audio_dsp.EnergyVAD.from_env() if vad_enabled() else None
+        self.commit_pause_ms = vad_commit_pause_ms()
+        self.metrics = metrics.SessionMetrics("realtime")
+        # (send time, audio start, audio end, ring start, ring end) of commits still waiting for their transcription
+        self._commits: deque = deque()
+        # Audio sent upstream and not yet transcribed, by absolute byte position
+        self.ring = audio_dsp.AudioRingBuffer(replay_buffer_bytes())
+        self._committed_pos = 0
+        self._has_streamed = False
+        self._upstream_established = False
+        self._first_delta_seen = False
+        self._send_lock = asyncio.Lock()
+        self.outbox = AudioOutbox()
+        self._overflow_logged = False
+
+    async def send_client(self, obj: Dict[str, Any]):
+        # Upstream pump and clinical trigger both write to the client socket
+        async with self._send_lock:
+            await self.ws.send_text(json.dumps(obj))
+
+    async def run(self):
+        client = asyncio.create_task(self.client_pump())
+        failures = 0
+        try:
+            while True:
+                error = await self._run_upstream(client)
+                if client.done():
+                    break
+                failures = 0 if self._upstream_established else failures + 1
+                if failures > reconnect_max_attempts():
+                    logger.warning("realtime upstream unavailable, giving up", extra={
+                        "session": self.metrics.id, "error": error,
+                    })
+                    await self._notify({"type": "error", "error": error or "upstream closed"})
+                    break
+                delay = reconnect_delay_s(failures)
+                logger.warning("realtime upstream lost, reconnecting", extra={
+                    "session": self.metrics.id, "error": error, "attempt": failures + 1, "delay_s": round(delay, 2),
+                })
+                self.metrics.inc("realtime.upstream_reconnects")
+                await self._notify({"type": "upstream_reconnecting", "attempt": failures + 1, "delay_s": round(delay, 2)})
+                # Client audio keeps flowing into the outbox and the ring while we wait
+                await asyncio.wait([client], timeout=delay)
+        finally:
+            client.cancel()
+            await asyncio.gather(client, return_exceptions=True)
+            if self.clinical_trigger is not None:
+                self.clinical_trigger.close()
+            if self.consultation_id is not None:
+                transcript_store.close_store(self.consultation_id)
+            self.metrics.close()
+            logger.info("realtime session closed", extra={"session": self.metrics.id})
+
+    async def _run_upstream(self, client: asyncio.Task) -> Optional[str]:
+        """One upstream connection, until it drops or the client leaves; returns why it failed, if it did."""
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "openai-beta": "realtime=v1",
+        }
+        self._upstream_established = False
+        self.session_ready.clear()
+        tasks: List[asyncio.Task] = []
+        try:
+            async with connect(self.url, additional_headers=headers, max_size=None, compression=None) as upstream:
+                self.upstream = upstream
+                await upstream.send(session_update_message())
+                tasks.append(asyncio.create_task(self.upstream_pump()))
+                ready = asyncio.create_task(self.session_ready.wait())
+                await asyncio.wait([ready, client, tasks[0]], return_when=asyncio.FIRST_COMPLETED)
+                ready.cancel()
+                if not self.session_ready.is_set():
+                    return None if client.done() else "upstream closed before the session was ready"
+                if self._has_streamed:
+                    replayed = self._replay()
+                    await self._notify({
+                        "type": "upstream_restored",
+                        "replayed_ms": round(1000 * replayed / audio_dsp.UPSTREAM_BYTES_PER_SECOND),
+                    })
+                self._has_streamed = self._upstream_established = True
+                logger.info("realtime session opened", extra={"session": self.metrics.id})
+                tasks.append(asyncio.create_task(self.upstream_sender()))
+                await asyncio.wait([client, *tasks], return_when=asyncio.FIRST_COMPLETED)
+                for task in tasks:
+                    if task.done() and task.exception() is not None:
+                        return str(task.exception()) or type(task.exception()).__name__
+                return None if client.done() else "upstream closed"
+        except (OSError, WebSocketException) as e:
+            return str(e) or type(e).__name__
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _notify(self, obj: Dict[str, Any]):
+        try:
+            await self.send_client(obj)
+        except Exception:
+            pass
+
+    def _replay(self) -> int:
+        """Queue, for a fresh upstream session, the audio the lost one had not transcribed yet; returns its bytes."""
+        # Whatever was still queued is also in the ring, so the outbox is rebuilt from there
+        self.outbox.clear()
+        pending = list(self._commits)
+        self._commits.clear()
+        replayed = 0
+        for entry in pending:
+            pcm = self.ring.read(entry[3], entry[4])
+            if not pcm:
+                # Overwritten in the ring: this stretch of audio is lost
+                self.metrics.inc("realtime.replay_lost_commits")
+                continue
+            self._queue_pcm(pcm)
+            self._queue_commit_messages()
+            self._commits.append(entry)
+            replayed += len(pcm)
+        tail = self.ring.read(self._committed_pos, self.ring.end)
+        self._queue_pcm(tail)
+        replayed += len(tail)
+        self._partial = []
+        self._first_delta_seen = False
+        self.metrics.inc("realtime.replayed_bytes", replayed)
+        self.metrics.set_gauge("realtime.pending_commits", len(self._commits))
+        logger.info("realtime upstream restored", extra={
+            "session": self.metrics.id, "replayed_bytes": replayed, "pending_commits": len(self._commits),
+        })
+        return replayed
+
+    def _queue_pcm(self, pcm: bytes):
+        step = self.outbox.frame_bytes * 3 // 4
+        step -= step % 6
+        for i in range(0, len(pcm), step):
+            piece = pcm[i:i + step]
+            self.outbox.put_audio(base64.b64encode(piece).decode("ascii"), len(piece))
+
+    async def upstream_pump(self):
+        """Forward upstream events to the client as soon as they arrive; returns when upstream closes."""
+        try:
+            async for msg in self.upstream:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("upstream message", extra={"session": self.metrics.id, "head": str(msg)[:200]})
+                try:
+                    evt = json.loads(msg)
+                except Exception:
+                    evt = None
+                if evt:
+                    await self.handle_upstream_event(evt)
+        except ConnectionClosed as e:
+            logger.info("realtime upstream closed", extra={"session": self.metrics.id, "reason": str(e)})
+
+    async def handle_upstream_event(self, evt: Dict[str, Any]):
+        et = evt.get("type")
+        if et == "transcription_session.created" or et == "transcription_session.updated":
+            self.session_ready.set()
+        elif et == "input_audio_buffer.speech_started":
+            await self.send_client({"type": "speech_started"})
+        elif et == "input_audio_buffer.speech_stopped":
+            await self.send_client({"type": "speech_stopped"})
+        elif et == "conversation.item.input_audio_transcription.delta":
+            self._observe_first_delta()
+            d = evt.get("delta") or ""
+            if isinstance(d, str) and d:
+                self._partial.append(d)
+                await self.send_client({
+                    "type": "transcription_update",
+                    "text_delta": d,
+                    "segments": [],
+                    "is_final": False,
+                })
+                if self.red_flags is not None:
+                    await self._raise_red_flags(self.red_flags.feed(d))
+        elif et == "conversation.item.input_audio_transcription.completed":
+            audio_start, audio_end = self._observe_completed()
+            tr = evt.get("transcript") or evt.get("text")
+            if not (isinstance(tr, str) and tr):
+                tr = "".join(self._partial)
+            self._partial = []
+            segs_raw = evt.get("segments") or []
+            segs = self._store_segments(segs_raw if isinstance(segs_raw, list) else [], tr, audio_start, audio_end)
+            if self.red_flags is not None:
+                await self._raise_red_flags(self.red_flags.end_utterance(tr or ""))
+            if tr and self.clinical_trigger is not None:
+                self.clinical_trigger.feed(tr)
+            await self.send_client({
+                "type": "transcription_update",
+                "text_delta": tr or "",
+                "segments": segs,
+                "is_final": True,
+            })
+        elif et == "response.delta" or et == "response.output_text.delta":
+            d = evt.get("delta") or (evt.get("output_text", {}).get("delta") if isinstance(evt.get("output_text"), dict) else None)
+            if isinstance(d, str) and d:
+                self._partial.append(d)
+                await self.send_client({
+                    "type": "transcription_update",
+                    "text_delta": d,
+                    "segments": [],
+                    "is_final": False,
+                })
+                if self.red_flags is not None:
+                    await self._raise_red_flags(self.red_flags.feed(d))
+        elif et == "response.completed" or et == "response.output_text.done":
+            if self._partial:
+                self._store_segments([], "".join(self._partial), self._committed_until_s, self._committed_until_s)
+                self._partial = []
+            await self.send_client({
+                "type": "transcription_complete",
+                "full_text": self.store.text(self._complete_from),
+                "segments": self.store.segments(self._complete_from),
+            })
+            self._complete_from = len(self.store)
+        elif et == "error":
+            logger.warning("realtime upstream error", extra={"session": self.metrics.id, "error": evt.get("error")})
+            await self.send_client(evt)
+
+    def _store_segments(self, segs_raw: List[Any], text: str, audio_start: float, audio_end: float) -> List[dict]:
+        """Append finalized segments to the store with consultation-relative timestamps."""
+        first = len(self.store)
+        segs = [to_segment_dict(s) for s in segs_raw]
+        if segs:
+            for s in segs:
+                start = s.get("start") if isinstance(s.get("start"), (int, float)) else 0.0
+                end = s.get("end") if isinstance(s.get("end"), (int, float)) else start
+                self.store.append(audio_start + start, audio_start + end, s.get("speaker"), s.get("text") or "")
+        elif text:
+            self.store.append(audio_start, audio_end, None, text)
+        return self.store.segments(first)
+
+    async def _raise_red_flags(self, alerts: List[Dict[str, Any]]):
+        """Push new red flags to the client at once; the LLM check follows once their text is final."""
+        if not alerts:
+            return
+        self.metrics.inc("realtime.red_flags", len(alerts))
+        if self.clinical_trigger is not None:
+            self.clinical_trigger.escalate()
+        await self.send_client({"type": "red_flag_alert", "provisional": True, "alerts": alerts})
+
+    def _observe_first_delta(self):
+        if self._commits and not self._first_delta_seen:
+            self._first_delta_seen = True
+            self.metrics.observe("realtime.time_to_first_delta_s", time.perf_counter() - self._commits[0][0])
+
+    def _observe_completed(self):
+        """Pop the oldest pending commit; returns the audio span it covered."""
+        span = (self._committed_until_s, self.audio_sent_s)
+        if self._commits:
+            sent_at, audio_start, audio_end, _, ring_end = self._commits.popleft()
+            self.ring.release(ring_end)
+            self.metrics.observe("realtime.commit_to_completed_s", time.perf_counter() - sent_at)
+            span = (audio_start, audio_end)
+        self._first_delta_seen = False
+        self.metrics.set_gauge("realtime.pending_commits", len(self._commits))
+        return span
+
+    async def send_upstream_audio(self, audio_b64: str, n_bytes: int, pcm: audio_dsp.BytesLike):
+        """Queue audio for upstream (and keep it for replay); overflow drops the oldest queued audio."""
+        self.metrics.inc("realtime.audio_bytes_out", n_bytes)
+        self.metrics.observe("realtime.audio_frame_bytes_out", n_bytes, metrics.SIZE_BUCKETS_BYTES)
+        self.audio_sent_s += n_bytes / audio_dsp.UPSTREAM_BYTES_PER_SECOND
+        self._uncommitted_bytes += n_bytes
+        self.ring.write(pcm)
+        dropped = self.outbox.put_audio(audio_b64, n_bytes)
+        if dropped:
+            self.metrics.inc("realtime.outbox_dropped_bytes", dropped)
+            if not self._overflow_logged:
+                # Once per backpressure episode, not once per dropped chunk
+                self._overflow_logged = True
+                logger.warning("realtime outbox overflow, dropping oldest audio", extra={
+                    "session": self.metrics.id, "max_bytes": self.outbox.max_bytes,
+                })
+        await self._outbox_changed()
+
+    async def upstream_sender(self):
+        """Drain the outbox to the upstream socket, merging audio appends queued behind a slow send."""
+        while True:
+            frame, merged = await self.outbox.get()
+            await self.upstream.send(frame)
+            self.metrics.observe("realtime.outbox_frames_merged", merged, metrics.DEPTH_BUCKETS)
+            await self._outbox_changed()
+
+    async def _outbox_changed(self):
+        self.metrics.set_gauge("realtime.outbox_bytes", self.outbox.queued_bytes)
+        throttled = self.outbox.watermark_crossed()
+        if throttled is None:
+            return
+        self.metrics.inc("realtime.backpressure_signals")
+        if not throttled:
+            self._overflow_logged = False
+        try:
+            await self.send_client({
+                "type": "backpressure",
+                "state": "slow_down" if throttled else "resume",
+                "queued_ms": round(1000 * self.outbox.queued_pcm_bytes / audio_dsp.UPSTREAM_BYTES_PER_SECOND),
+            })
+        except Exception:
+            pass
+
+    async def client_pump(self):
+        """Forward client messages upstream; blocks on the socket instead of polling."""
+        while True:
+            message = await self.ws.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            data = message.get("bytes")
+            if data is not None:
+                # Binary frame: raw pcm16 at the rate announced in `init`
+                self._observe_audio_in(len(data))
+                await self.handle_client_audio(data)
+                continue
+            text = message.get("text")
+            if not text:
+                continue
+            try:
+                obj = json.loads(text)
+            except ValueError:
+                continue
+            if not isinstance(obj, dict):
+                continue
+            if await self.handle_client_message(obj) is False:
+                return
+
+    async def handle_client_audio(self, pcm: audio_dsp.BytesLike):
+        if self.client_meta["codec"] not in audio_dsp.PCM16_CODECS:
+            await self.send_client({"type": "error", "error": f"codec não suportado: {self.client_meta['codec']}"})
+            return
+        pcm = self.resampler.process(pcm)
+        if self.vad is not None:
+            pcm, dropped = self.vad.process(pcm)
+            if dropped:
+                self._skip_silence(dropped)
+        if len(pcm):
+            await self.send_upstream_audio(base64.b64encode(pcm).decode("ascii"), len(pcm), pcm)
+        if self.vad is not None and self._uncommitted_bytes and self.vad.silence_ms >= self.commit_pause_ms:
+            self.metrics.inc("realtime.vad_auto_commits")
+            await self.commit()
+
+    def _skip_silence(self, n_bytes: int):
+        """Account for silence the VAD dropped: it still advances consultation time."""
+        self.metrics.inc("realtime.vad_dropped_bytes", n_bytes)
+        seconds = n_bytes / audio_dsp.UPSTREAM_BYTES_PER_SECOND
+        self.audio_sent_s += seconds
+        if not self._uncommitted_bytes:
+            # Nothing buffered upstream yet, so the next commit starts after this silence
+            self._committed_until_s += seconds
+
+    async def commit(self):
+        self._queue_commit_messages()
+        self._uncommitted_bytes = 0
+        self._commits.append((time.perf_counter(), self._committed_until_s, self.audio_sent_s,
+                              self._committed_pos, self.ring.end))
+        self._committed_until_s = self.audio_sent_s
+        self._committed_pos = self.ring.end
+        self.metrics.set_gauge("realtime.pending_commits", len(self._commits))
+        self.metrics.observe("realtime.pending_commits_depth", len(self._commits), metrics.DEPTH_BUCKETS)
+
+    def _queue_commit_messages(self):
+        # Through the outbox, so the commit lands after the audio queued before it
+        self.outbox.put_message(json.dumps({"type": "input_audio_buffer.commit"}))
+        self.outbox.put_message(json.dumps({
+            "type": "response.create",
+            "response": {
+                "conversation": "none",
+                "instructions": "Transcreva o último áudio em português.",
+                "input_audio": [{"buffer": "default"}]
+            }
+        }))
+
+    def _observe_audio_in(self, n_bytes: int):
+        self.metrics.inc("realtime.audio_bytes_in", n_bytes)
+        self.metrics.observe("realtime.audio_frame_bytes_in", n_bytes, metrics.SIZE_BUCKETS_BYTES)
+
+    async def handle_client_message(self, obj: Dict[str, Any]) -> Optional[bool]:
+        typ = obj.get("type")
+        if typ == "init":
+            logger.info("realtime client init", extra={
+                "session": self.metrics.id,
+                "sample_rate_hz": obj.get("sample_rate_hz") or obj.get("sample_rate"),
+                "codec": obj.get("codec"),
+                "patient_id": obj.get("patient_id"),
+            })
+            sr = obj.get("sample_rate_hz") or obj.get("sample_rate")
+            if isinstance(sr, int) and sr > 0:
+                self.client_meta["sample_rate_hz"] = sr
+                if sr != self.resampler.src_rate:
+                    self.resampler = audio_dsp.PCM16Resampler(sr)
+            if isinstance(obj.get("vad"), bool) and obj["vad"] != (self.vad is not None):
+                self.vad = audio_dsp.EnergyVAD.from_env() if obj["vad"] else None
+            self.client_meta["codec"] = obj.get("codec") or self.client_meta["codec"]
+            self.client_meta["patient_id"] = obj.get("patient_id") or self.client_meta["patient_id"]
+            self.metrics.labels["patient_id"] = self.client_meta["patient_id"]
+            if self.consultation_id is None:
+                # A reconnecting client may pass back its `consultation_id` to continue that transcript
+                resume = obj.get("consultation_id")
+                self.consultation_id = (
+                    os.path.basename(resume) if isinstance(resume, str) and resume
+                    else transcript_store.new_consultation_id(self.client_meta["patient_id"])
+                )
+                self.metrics.labels["consultation_id"] = self.consultation_id
+                self.store = transcript_store.get_store(self.consultation_id)
+                self._complete_from = len(self.store)
+                self.audio_sent_s = self._committed_until_s = self.store.duration
+                await self.send_client({"type": "consultation", "consultation_id": self.consultation_id})
+            # Avaliação clínica empurrada pelo servidor (mensagens `clinical_update`)
+            push_enabled = obj.get("clinical_updates", os.getenv("LIVE_CLINICAL_PUSH", "1") == "1")
+            if self.clinical_trigger is None and push_enabled and self.client_meta["patient_id"]:
+                self.clinical_trigger = live_clinical_check.LiveClinicalTrigger.for_patient(
+                    self.client_meta["patient_id"], self.send_client, window=self.clinical_window
+                )
+        elif typ == "input_audio_buffer.append":
+            audio_b64 = obj.get("audio") or ""
+            self._observe_audio_in(len(audio_b64) * 3 // 4)
+            # Always decoded: the replay ring keeps the samples. A malformed frame is dropped,
+            # never allowed to end the session
+            try:
+                pcm = base64.b64decode(audio_b64, validate=True)
+            except (binascii.Error, ValueError):
+                self.metrics.inc("realtime.malformed_frames")
+                return None
+            if not self.resampler.passthrough or self.vad is not None:
+                await self.handle_client_audio(pcm)
+                return None
+            # Same-rate audio without VAD goes upstream as received, without re-encoding.
+            # Enfileirado até a sessão upstream ficar pronta, em vez de descartar o áudio inicial
+            await self.send_upstream_audio(audio_b64, len(pcm), pcm)
+        elif typ == "commit":
+            logger.debug("realtime client commit", extra={"session": self.metrics.id})
+            # With the VAD on, the buffer may already have been committed at the last pause
+            if self.vad is None or self._uncommitted_bytes:
+                await self.commit()
+        elif typ == "close":
+            return False
+        return None
+
+    def clinical_window(self) -> str:
+        """Tail of the finalized transcript sized for the clinical check prompt."""
+        return self.store.last_tokens(int(os.getenv("LIVE_CLINICAL_WINDOW_TOKENS", "2500")))
+
+
+@router.websocket("/ws/transcribe")
+async def ws_transcribe(ws: WebSocket):
+    await ws.accept()
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        await ws.close(code=1011)
+        return
+    relay = RealtimeRelay(ws, api_key)
+    try:
+        await relay.run()
+    finally:
+        try:
+            await ws.close()
+        except Exception:
+            pass
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, HTTPException
+from typing import Optional
+from backend.services import transcript_store
+
+router = APIRouter(prefix="/api/transcripts", tags=["transcripts"])
+
+@router.get("/{consultation_id}")
+def get_transcript(
+    consultation_id: str,
+    speaker: Optional[str] = None,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    last_seconds: Optional[float] = None,
+    last_tokens: Optional[int] = None,
+):
+    """Query a consultation transcript by speaker and time range, or get its last N seconds / tokens."""
+    store = transcript_store.get_store(consultation_id, create=False)
+    if store is None:
+        raise HTTPException(status_code=404, detail="Transcript not found")
+    if last_seconds is not None:
+        return {"text": store.last_seconds(last_seconds)}
+    if last_tokens is not None:
+        return {"text": store.last_tokens(last_tokens)}
+    return {
+        "duration": store.duration,
+        "speakers": store.speakers(),
+        "segments": store.query(speaker, start, end),
+    }
@@ -0,0 +1,282 @@
+"""Load and latency benchmark of the main endpoints against local upstream stand-ins.
+
+Starts the stub OpenAI HTTP API (chat completions, transcriptions) and the
+stub realtime WebSocket in this process, writes synthetic `bench_` patients
+into DATA_DIR, runs the app under uvicorn pointed at the stubs, then drives
+each scenario with N closed-loop clients for a fixed time:
+
+    patients           GET  /patients/
+    prontuario         GET  /patients/{id}/prontuario
+    chat               POST /copilot/chat
+    live_check         POST /api/live-clinical-check
+    legacy_transcribe  POST /api/transcribe-legacy/live
+    ws_transcribe      WS   /ws/transcribe (real-time audio, commit -> final)
+
+Results (p50/p95/p99, throughput, server RSS and CPU per scenario and
+concurrency) are printed as JSON; --baseline compares against an earlier run.
+
+    python -m backend.bench.bench_load --concurrency 1,10,50 --duration 10 --output load.json
+    python -m backend.bench.bench_load --scenarios chat,live_check --baseline load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from backend.bench import synthetic_patients
+from backend.bench.bench_realtime import SessionStats, run_session
+from backend.bench.common import REPO_ROOT, app_server, latency_summary, process_tree_cpu_seconds, process_tree_rss_bytes
+from backend.bench.stub_openai import StubOpenAIServer
+from backend.bench.stub_realtime import StubRealtimeServer
+
+SCENARIOS = ("patients", "prontuario", "chat", "live_check", "legacy_transcribe", "ws_transcribe")
+
+QUESTIONS = ["Quais as alergias do paciente?", "Qual o último valor de creatinina?",
+             "Há contraindicação para AINEs?", "Resuma a evolução dos últimos dias.",
+             "Qual a hemoglobina mais recente?"]
+TRANSCRIPT = ("Médico: bom dia, o que trouxe o senhor aqui hoje? Paciente: estou com dor na barriga desde ontem "
+              "e tive febre à noite. Médico: tem alguma alergia a medicamento? Paciente: acho que a dipirona. ")
+AUDIO_CHUNK = bytes(16000)
+
+
+class Driver:
+    """Request functions of each HTTP scenario; each raises on a failed request."""
+
+    def __init__(self, client: httpx.AsyncClient, patient_ids: List[str]):
+        self.client = client
+        self.patient_ids = patient_ids
+        self._charts: Dict[str, str] = {}
+        self._seq: Dict[str, int] = {}
+
+    def _chart(self, patient_id: str) -> str:
+        if patient_id not in self._charts:
+            path = os.path.join(synthetic_patients.DATA_DIR, patient_id, "Prontuario.md")
+            with open(path, encoding="utf-8") as f:
+                self._charts[patient_id] = f.read()
+        return self._charts[patient_id]
+
+    async def patients(self, rng: random.Random, worker: int, i: int):
+        offset = rng.randrange(max(1, len(self.patient_ids) - 50))
+        r = await self.client.get("/patients/", params={"offset": offset, "limit": 50})
+        r.raise_for_status()
+
+    async def prontuario(self, rng: random.Random, worker: int, i: int):
+        r = await self.client.get(f"/patients/{rng.choice(self.patient_ids)}/prontuario")
+        r.raise_for_status()
+
+    async def chat(self, rng: random.Random, worker: int, i: int):
+        r = await self.client.post("/copilot/chat", json={
+            "patient_id": rng.choice(self.patient_ids), "question": rng.choice(QUESTIONS),
+        })
+        r.raise_for_status()
+
+    async def live_check(self, rng: random.Random, worker: int, i: int):
+        patient_id = rng.choice(self.patient_ids)
+        # A growing transcript, as during a consultation (identical requests would only hit the cache)
+        r = await self.client.post("/api/live-clinical-check", json={
+            "patient_id": patient_id,
+            "prontuario": self._chart(patient_id),
+            "transcript_partial": TRANSCRIPT * (1 + i % 8) + f"[{worker}:{i}]",
+        })
+        r.raise_for_status()
+
+    async def legacy_transcribe(self, rng: random.Random, worker: int, i: int):
+        session_id = f"bench-{worker}"
+        seq = self._seq.get(session_id, 0)
+        self._seq[session_id] = seq + 1
+        r = await self.client.post(
+            "/api/transcribe-legacy/live",
+            files={"file": ("chunk.webm", AUDIO_CHUNK, "audio/webm")},
+            data={"session_id": session_id, "seq": str(seq), "duration_ms": "1000"},
+        )
+        r.raise_for_status()
+
+
+async def _sample_server(pid: int, stop: asyncio.Event, peak: List[int]):
+    while not stop.is_set():
+        peak[0] = max(peak[0], process_tree_rss_bytes(pid) or 0)
+        try:
+            await asyncio.wait_for(stop.wait(), 0.25)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _closed_loop(request: Callable[[random.Random, int, int], Awaitable[None]], concurrency: int,
+                       duration_s: float, latencies: List[float], errors: List[str]):
+    deadline = time.perf_counter() + duration_s
+
+    async def worker(n: int):
+        rng = random.Random(n)
+        i = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                await request(rng, n, i)
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors.append(type(e).__name__)
+            i += 1
+
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+
+
+async def _ws_sessions(url: str, concurrency: int, duration_s: float, latencies: List[float], errors: List[str]):
+    stats = [SessionStats() for _ in range(concurrency)]
+    await asyncio.gather(*(run_session(url, duration_s, 100, 2.0, st) for st in stats))
+    for st in stats:
+        latencies.extend(st.latencies)
+        errors.extend(["ConnectionError"] * st.errors + ["Incomplete"] * (st.commits - st.completed))
+
+
+async def run_scenario(name: str, concurrency: int, args, driver: Driver, port: int, pid: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors: List[str] = []
+    stop = asyncio.Event()
+    peak = [0]
+    sampler = asyncio.create_task(_sample_server(pid, stop, peak))
+    cpu_before = process_tree_cpu_seconds(pid)
+    start = time.perf_counter()
+    if name == "ws_transcribe":
+        await _ws_sessions(f"ws://127.0.0.1:{port}/ws/transcribe", concurrency, args.duration, latencies, errors)
+    else:
+        await _closed_loop(getattr(driver, name), concurrency, args.duration, latencies, errors)
+    wall = time.perf_counter() - start
+    cpu_after = process_tree_cpu_seconds(pid)
+    stop.set()
+    await sampler
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "error_types": sorted(set(errors)),
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "latency": latency_summary(latencies),
+        "server_rss_peak_bytes": peak[0] or None,
+        "server_rss_end_bytes": process_tree_rss_bytes(pid),
+        "server_cpu_percent": None if cpu_before is None or cpu_after is None
+        else round(100.0 * (cpu_after - cpu_before) / wall, 1),
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """p95 and throughput of each (scenario, concurrency) relative to the baseline run."""
+    before = {(r["scenario"], r["concurrency"]): r for r in baseline.get("results", [])}
+    rows = []
+    for r in results:
+        b = before.get((r["scenario"], r["concurrency"]))
+        if b is None:
+            continue
+        p95, p95_before = r["latency"]["p95_ms"], b["latency"]["p95_ms"]
+        rows.append({
+            "scenario": r["scenario"],
+            "concurrency": r["concurrency"],
+            "p95_ms": p95,
+            "p95_ms_baseline": p95_before,
+            "p95_change_percent": round(100.0 * (p95 - p95_before) / p95_before, 1) if p95 and p95_before else None,
+            "throughput_rps": r["throughput_rps"],
+            "throughput_rps_baseline": b["throughput_rps"],
+            "throughput_change_percent": round(100.0 * (r["throughput_rps"] - b["throughput_rps"]) / b["throughput_rps"], 1)
+            if b["throughput_rps"] else None,
+        })
+    return rows
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args) -> Dict[str, Any]:
+    patient_ids = synthetic_patients.generate(args.patients, args.chart_kb, seed=args.seed)
+    openai_stub = await StubOpenAIServer(chat_latency_ms=args.chat_latency_ms,
+                                         transcribe_latency_ms=args.transcribe_latency_ms).start()
+    realtime_stub = await StubRealtimeServer(latency_ms=args.realtime_latency_ms).start()
+    env = {
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": openai_stub.url,
+        "OPENAI_REALTIME_URL": realtime_stub.url,
+        "LLM_BACKEND": "openai",
+        "LIVE_CLINICAL_PUSH": "0",
+    }
+    results = []
+    loop = asyncio.get_running_loop()
+    cm = app_server(env, workers=args.workers)
+    proc = await loop.run_in_executor(None, cm.__enter__)
+    try:
+        limits = httpx.Limits(max_connections=max(args.concurrency) + 10)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{proc.port}", timeout=60.0, limits=limits) as client:
+            driver = Driver(client, patient_ids)
+            for name in args.scenarios:
+                for concurrency in args.concurrency:
+                    result = await run_scenario(name, concurrency, args, driver, proc.port, proc.pid)
+                    results.append(result)
+                    print(json.dumps(result), file=sys.stderr)
+    finally:
+        await loop.run_in_executor(None, cm.__exit__, None, None, None)
+        await realtime_stub.stop()
+        await openai_stub.stop()
+        if not args.keep_patients:
+            synthetic_patients.cleanup()
+    output: Dict[str, Any] = {
+        "benchmark": "load",
+        "git_commit": _git_commit(),
+        "timestamp": int(time.time()),
+        "config": {
+            "scenarios": args.scenarios,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "workers": args.workers,
+            "patients": args.patients,
+            "chart_kb": args.chart_kb,
+            "chat_latency_ms": args.chat_latency_ms,
+            "transcribe_latency_ms": args.transcribe_latency_ms,
+            "realtime_latency_ms": args.realtime_latency_ms,
+        },
+        "upstream_calls": dict(openai_stub.calls),
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        output["baseline_commit"] = baseline.get("git_commit")
+        output["comparison"] = compare(results, baseline)
+    return output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", type=lambda s: s.split(","), default=list(SCENARIOS),
+                        help="comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=lambda s: [int(x) for x in s.split(",")], default=[1, 10])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario and concurrency level")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--patients", type=int, default=200, help="synthetic patients to generate")
+    parser.add_argument("--chart-kb", type=float, default=8.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=300.0)
+    parser.add_argument("--transcribe-latency-ms", type=float, default=500.0)
+    parser.add_argument("--realtime-latency-ms", type=float, default=80.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep-patients", action="store_true", help="leave the bench_ patients in DATA_DIR")
+    parser.add_argument("--baseline", help="earlier JSON result to compare against")
+    parser.add_argument("--output", help="write the JSON result to this file")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    result = asyncio.run(main(args))
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,181 @@
+"""Concurrent-session capacity of /ws/transcribe against a local stub realtime server.
+
+Each simulated client streams real-time paced PCM16 audio (base64 JSON
+frames, or raw binary frames with --binary), commits every few seconds and
+measures commit -> completed latency.
+The session count is ramped until the worker can no longer keep up.
+
+    python -m backend.bench.bench_realtime --sessions 10,50,100,200 --duration 15
+"""
+import argparse
+import asyncio
+import base64
+import json
+import time
+from collections import deque
+from typing import Any, Dict, List
+
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+from backend.bench.common import app_server, latency_summary, process_cpu_seconds, process_rss_bytes
+from backend.bench.stub_realtime import StubRealtimeServer
+
+SAMPLE_RATE = 24000
+
+
+class SessionStats:
+    def __init__(self):
+        self.commits = 0
+        self.completed = 0
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.bytes_sent_per_chunk = 0
+
+
+async def run_session(url: str, duration_s: float, chunk_ms: int, commit_every_s: float, stats: SessionStats,
+                      binary: bool = False, sample_rate: int = SAMPLE_RATE):
+    pcm = bytes(sample_rate * 2 * chunk_ms // 1000)
+    if binary:
+        append_msg = pcm
+    else:
+        append_msg = json.dumps({"type": "input_audio_buffer.append", "audio": base64.b64encode(pcm).decode("ascii")})
+    stats.bytes_sent_per_chunk = len(append_msg)
+    commits: deque = deque()
+    try:
+        async with connect(url, max_size=None, compression=None) as ws:
+            # The audio is digital silence, which the relay's VAD would drop entirely
+            await ws.send(json.dumps({"type": "init", "sample_rate_hz": sample_rate, "codec": "pcm16", "vad": False}))
+
+            async def reader():
+                async for msg in ws:
+                    evt = json.loads(msg)
+                    if evt.get("type") == "transcription_update" and evt.get("is_final") and commits:
+                        stats.latencies.append(time.perf_counter() - commits.popleft())
+                        stats.completed += 1
+
+            reader_task = asyncio.create_task(reader())
+            start = time.perf_counter()
+            next_commit = start + commit_every_s
+            tick = 0
+            while time.perf_counter() - start < duration_s:
+                await ws.send(append_msg)
+                now = time.perf_counter()
+                if now >= next_commit:
+                    commits.append(now)
+                    stats.commits += 1
+                    await ws.send(json.dumps({"type": "commit"}))
+                    next_commit += commit_every_s
+                tick += 1
+                # Real-time pacing against the session clock (no drift accumulation)
+                await asyncio.sleep(max(0.0, start + tick * chunk_ms / 1000.0 - time.perf_counter()))
+            # Give in-flight commits time to complete
+            deadline = time.perf_counter() + 5.0
+            while commits and time.perf_counter() < deadline:
+                await asyncio.sleep(0.05)
+            reader_task.cancel()
+            await ws.send(json.dumps({"type": "close"}))
+    except (OSError, ConnectionClosed):
+        stats.errors += 1
+
+
+async def run_level(app_port: int, pid: int, sessions: int, args) -> Dict[str, Any]:
+    url = f"ws://127.0.0.1:{app_port}/ws/transcribe"
+    stats = [SessionStats() for _ in range(sessions)]
+    cpu_before = process_cpu_seconds(pid)
+    wall_start = time.perf_counter()
+    tasks = []
+    for i, st in enumerate(stats):
+        tasks.append(asyncio.create_task(run_session(url, args.duration, args.chunk_ms, args.commit_every, st,
+                                                       binary=args.binary, sample_rate=args.sample_rate)))
+        # Stagger connects so commits do not all line up
+        await asyncio.sleep(args.commit_every / max(1, sessions) / 4)
+    rss_peak = 0
+    while not all(t.done() for t in tasks):
+        rss_peak = max(rss_peak, process_rss_bytes(pid) or 0)
+        await asyncio.sleep(0.5)
+    wall = time.perf_counter() - wall_start
+    cpu_after = process_cpu_seconds(pid)
+
+    latencies = [v for st in stats for v in st.latencies]
+    commits = sum(st.commits for st in stats)
+    completed = sum(st.completed for st in stats)
+    summary = latency_summary(latencies)
+    sustained = (
+        commits > 0
+        and completed >= 0.99 * commits
+        and summary["p95_ms"] is not None
+        and summary["p95_ms"] <= args.p95_budget_ms
+        and sum(st.errors for st in stats) == 0
+    )
+    return {
+        "sessions": sessions,
+        "commits": commits,
+        "completed": completed,
+        "errors": sum(st.errors for st in stats),
+        "commit_to_completed": summary,
+        "client_bytes_per_audio_second": stats[0].bytes_sent_per_chunk * 1000 // args.chunk_ms if stats else None,
+        "server_cpu_percent": None if cpu_before is None or cpu_after is None else round(100.0 * (cpu_after - cpu_before) / wall, 1),
+        "server_rss_peak_bytes": rss_peak or None,
+        "sustained": sustained,
+    }
+
+
+async def main(args) -> Dict[str, Any]:
+    stub = await StubRealtimeServer(latency_ms=args.upstream_latency_ms).start()
+    env = {
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_REALTIME_URL": stub.url,
+        "LLM_BACKEND": "stub",
+        "LIVE_CLINICAL_PUSH": "0",
+    }
+    levels = []
+    # The app runs in a child process; the stub and the clients share this loop
+    cm = app_server(env)
+    proc = await asyncio.get_running_loop().run_in_executor(None, cm.__enter__)
+    try:
+        for n in args.sessions:
+            result = await run_level(proc.port, proc.pid, n, args)
+            levels.append(result)
+            print(json.dumps(result))
+            if not result["sustained"] and args.stop_on_failure:
+                break
+    finally:
+        await asyncio.get_running_loop().run_in_executor(None, cm.__exit__, None, None, None)
+        await stub.stop()
+    sustained = [lvl["sessions"] for lvl in levels if lvl["sustained"]]
+    return {
+        "benchmark": "realtime_relay",
+        "config": {
+            "duration_s": args.duration,
+            "chunk_ms": args.chunk_ms,
+            "commit_every_s": args.commit_every,
+            "upstream_latency_ms": args.upstream_latency_ms,
+            "binary": args.binary,
+            "sample_rate": args.sample_rate,
+            "p95_budget_ms": args.p95_budget_ms,
+        },
+        "levels": levels,
+        "max_sustained_sessions": max(sustained) if sustained else 0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=lambda s: [int(x) for x in s.split(",")], default=[10, 50, 100])
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds of audio per session")
+    parser.add_argument("--chunk-ms", type=int, default=100)
+    parser.add_argument("--commit-every", type=float, default=2.0)
+    parser.add_argument("--binary", action="store_true", help="send raw pcm16 binary frames")
+    parser.add_argument("--sample-rate", type=int, default=SAMPLE_RATE, help="client sample rate (resampled server-side)")
+    parser.add_argument("--upstream-latency-ms", type=float, default=80.0)
+    parser.add_argument("--p95-budget-ms", type=float, default=500.0)
+    parser.add_argument("--stop-on-failure", action="store_true")
+    parser.add_argument("--output", help="write the JSON result to this file")
+    args = parser.parse_args()
+    result = asyncio.run(main(args))
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
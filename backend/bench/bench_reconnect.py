@@ -0,0 +1,102 @@
+"""Realtime relay recovery against an upstream that drops connections at random.
+
+Streams a synthetic consultation through /ws/transcribe while the stub
+upstream aborts every connection after a random lifetime (mean --kill-every
+seconds). The relay must reconnect, replay the untranscribed audio and keep
+going: the run fails (exit code 1) if a turn never gets a final transcript,
+if segment timestamps overlap or go backwards, or if a session errors out.
+
+    python -m backend.bench.bench_reconnect --kill-every 3 --duration 30 --speed 2
+    python -m backend.bench.bench_reconnect --no-vad --commit-every 2
+"""
+import argparse
+import asyncio
+import json
+import sys
+from typing import Any, Dict, List, Tuple
+
+from backend.bench.bench_vad import SAMPLE_RATE, replay, synthetic_consultation
+from backend.bench.common import app_server
+from backend.bench.stub_realtime import StubRealtimeServer
+
+
+def timestamp_problems(segments: List[Tuple[float, float]]) -> List[str]:
+    """Segments must come in consultation order, without overlaps."""
+    problems = []
+    previous_end = 0.0
+    for start, end in segments:
+        if end < start:
+            problems.append(f"segment ends before it starts: {start:.2f}-{end:.2f}")
+        if start < previous_end - 1e-6:
+            problems.append(f"segment {start:.2f}-{end:.2f} overlaps the previous one (ended {previous_end:.2f})")
+        previous_end = max(previous_end, end)
+    return problems
+
+
+async def main(args) -> Dict[str, Any]:
+    pcm, ends = synthetic_consultation(args.duration, args.pause_ms, SAMPLE_RATE, seed=args.seed)
+    stub = await StubRealtimeServer(latency_ms=args.upstream_latency_ms, kill_every_s=args.kill_every,
+                                    seed=args.seed).start()
+    env = {
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_REALTIME_URL": stub.url,
+        "LLM_BACKEND": "stub",
+        "LIVE_CLINICAL_PUSH": "0",
+        "VAD_COMMIT_PAUSE_MS": str(args.pause_ms),
+    }
+    cm = app_server(env)
+    proc = await asyncio.get_running_loop().run_in_executor(None, cm.__enter__)
+    try:
+        url = f"ws://127.0.0.1:{proc.port}/ws/transcribe"
+        result = await replay(url, pcm, SAMPLE_RATE, args.chunk_ms, args.speed, not args.no_vad,
+                              args.commit_every, ends, settle_s=args.settle)
+    finally:
+        await asyncio.get_running_loop().run_in_executor(None, cm.__exit__, None, None, None)
+        await stub.stop()
+    segments = result.pop("segments")
+    problems = timestamp_problems(segments)
+    if result["uncovered"]:
+        problems.append(f"{result['uncovered']} turn(s) never got a final transcript")
+    client_bytes = len(pcm)
+    return {
+        "benchmark": "realtime_reconnect",
+        "config": {
+            "audio_s": args.duration,
+            "speed": args.speed,
+            "kill_every_s": args.kill_every,
+            "vad": not args.no_vad,
+            "upstream_latency_ms": args.upstream_latency_ms,
+        },
+        "upstream_connections": stub.connections,
+        "upstream_kills": stub.kills,
+        "client_audio_bytes": client_bytes,
+        "upstream_audio_bytes": stub.audio_bytes,
+        "segments": len(segments),
+        "last_segment_end_s": round(max((e for _, e in segments), default=0.0), 2),
+        **result,
+        "problems": problems,
+        "ok": not problems,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of synthetic audio")
+    parser.add_argument("--speed", type=float, default=2.0, help="replay faster than real time")
+    parser.add_argument("--kill-every", type=float, default=3.0, help="mean upstream connection lifetime (s)")
+    parser.add_argument("--chunk-ms", type=int, default=100)
+    parser.add_argument("--no-vad", action="store_true", help="client commits instead of VAD auto-commit")
+    parser.add_argument("--commit-every", type=float, default=2.0, help="client commit cadence with --no-vad")
+    parser.add_argument("--pause-ms", type=int, default=700)
+    parser.add_argument("--upstream-latency-ms", type=float, default=80.0)
+    parser.add_argument("--settle", type=float, default=15.0, help="seconds to wait for the last finals")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write the JSON result to this file")
+    args = parser.parse_args()
+    result = asyncio.run(main(args))
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+    sys.exit(0 if result["ok"] else 1)
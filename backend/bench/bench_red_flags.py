@@ -0,0 +1,155 @@
+"""Time to first alert and LLM checks per consultation, with and without the red-flag gate.
+
+A synthetic consultation (routine sentences, negated red flags and a few
+affirmed ones) is streamed word by word through the realtime relay's
+upstream event handler, with the live clinical check pointed at the stub
+OpenAI API. Reports the detector's cost per delta, the time from the start of
+each flagged utterance to its provisional alert and to the first LLM answer
+whose transcript window covered it, and how many LLM checks each mode ran.
+
+    python -m backend.bench.bench_red_flags --utterances 60 --flags 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+from backend.bench.common import latency_summary
+from backend.bench.stub_openai import StubOpenAIServer
+
+ROUTINE = [
+    "Paciente relata cansaço leve há uma semana.",
+    "Refere tosse seca principalmente à noite.",
+    "Está em uso regular de losartana e metformina.",
+    "Dorme bem e mantém a alimentação de costume.",
+    "Relata dor lombar ao carregar peso.",
+    "Sem alterações urinárias ou intestinais.",
+    "Conta que a pressão em casa fica em torno de treze por oito.",
+]
+NEGATED = [
+    "Nega dor no peito.",
+    "Não tem falta de ar.",
+    "Nega desmaio ou convulsão.",
+    "Sem febre e sem rigidez de nuca.",
+]
+AFFIRMED = [
+    "Mas ontem teve uma dor no peito forte enquanto subia a escada.",
+    "Hoje de manhã sentiu falta de ar ao deitar.",
+    "Conta que desmaiou no banheiro na semana passada.",
+    "Diz que às vezes tem vontade de morrer.",
+]
+
+
+def synthetic_transcript(utterances: int, flags: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    text = [rng.choice(ROUTINE if rng.random() < 0.8 else NEGATED) for _ in range(utterances)]
+    for i, sentence in enumerate(AFFIRMED[:flags]):
+        text[(i + 1) * utterances // (flags + 1)] = sentence
+    return text
+
+
+class _Socket:
+    def __init__(self):
+        self.events: List[Tuple[float, Dict[str, Any]]] = []
+
+    async def send_text(self, text: str):
+        self.events.append((time.perf_counter(), json.loads(text)))
+
+
+async def run(utterances: List[str], gated: bool, delta_gap_s: float) -> Dict[str, Any]:
+    from backend.api import live_clinical_check, realtime_transcribe
+    from backend.services import red_flags
+
+    os.environ["LIVE_CLINICAL_RED_FLAG_GATE"] = "1" if gated else "0"
+    # Both modes see the same windows; start each from an empty answer cache
+    live_clinical_check._result_cache.clear()
+    ws = _Socket()
+    relay = realtime_transcribe.RealtimeRelay(ws, "bench")
+    relay.clinical_trigger = live_clinical_check.LiveClinicalTrigger(
+        live_clinical_check.clinical_session_service.ConsultationSession("bench", "Paciente hipertenso.", 10000),
+        relay.send_client, window=relay.clinical_window,
+    )
+    scan_s: List[float] = []
+    # Time scanning deltas apart from the relay, with the same tracker logic
+    tracker = red_flags.RedFlagTracker()
+    # Structure: [(first delta sent at, trigger feed count once the utterance is final)]
+    spoken: List[Tuple[float, int]] = []
+    for utterance in utterances:
+        words = utterance.split(" ")
+        started = time.perf_counter()
+        for i, word in enumerate(words):
+            delta = word if i == len(words) - 1 else word + " "
+            start = time.perf_counter()
+            tracker.feed(delta)
+            scan_s.append(time.perf_counter() - start)
+            await relay.handle_upstream_event({"type": "conversation.item.input_audio_transcription.delta", "delta": delta})
+            await asyncio.sleep(delta_gap_s)
+        await relay.handle_upstream_event({"type": "conversation.item.input_audio_transcription.completed",
+                                           "transcript": utterance})
+        spoken.append((started, relay.clinical_trigger._fed))
+    while relay.clinical_trigger._task is not None and not relay.clinical_trigger._task.done():
+        await asyncio.sleep(0.05)
+    alerts = [(t, e) for t, e in ws.events if e["type"] == "red_flag_alert"]
+    updates = [(t, e["seq"]) for t, e in ws.events if e["type"] == "clinical_update"]
+    to_alert, to_llm = [], []
+    for t, _ in alerts:
+        started, fed = [u for u in spoken if u[0] <= t][-1]
+        to_alert.append(t - started)
+        # The first answer from a check started with the flagged utterance in its window
+        answered = next((u for u, seq in updates if seq >= fed), None)
+        if answered is not None:
+            to_llm.append(answered - started)
+    return {
+        "gated": gated,
+        "llm_checks": len(updates),
+        "red_flag_alerts": [a["id"] for _, e in alerts for a in e["alerts"]],
+        "scan_per_delta": latency_summary(scan_s),
+        "utterance_to_alert": latency_summary(to_alert),
+        "utterance_to_llm_answer": latency_summary(to_llm),
+    }
+
+
+async def main(args) -> Dict[str, Any]:
+    stub = await StubOpenAIServer(chat_latency_ms=args.upstream_latency_ms).start()
+    os.environ.update({"LLM_BACKEND": "openai", "OPENAI_API_KEY": "bench", "OPENAI_BASE_URL": stub.url})
+    from backend.services import llm_gateway
+
+    await llm_gateway.startup()
+    utterances = synthetic_transcript(args.utterances, args.flags, args.seed)
+    runs = []
+    try:
+        for gated in (False, True):
+            before = stub.calls["chat"]
+            result = await run(utterances, gated, args.delta_gap_ms / 1000.0)
+            result["upstream_calls"] = stub.calls["chat"] - before
+            runs.append(result)
+            print(json.dumps(result))
+    finally:
+        await llm_gateway.shutdown()
+        await stub.stop()
+    return {
+        "benchmark": "red_flags",
+        "config": {"utterances": args.utterances, "flags": args.flags,
+                   "upstream_latency_ms": args.upstream_latency_ms, "delta_gap_ms": args.delta_gap_ms},
+        "runs": runs,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--utterances", type=int, default=60)
+    parser.add_argument("--flags", type=int, default=3, choices=range(0, len(AFFIRMED) + 1))
+    parser.add_argument("--upstream-latency-ms", type=float, default=300.0)
+    parser.add_argument("--delta-gap-ms", type=float, default=40.0, help="pause between streamed words")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON result to this file")
+    args = parser.parse_args()
+    result = asyncio.run(main(args))
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,115 @@
+"""Safety-check latency under upstream overload, with and without the LLM scheduler.
+
+Runs the gateway in this process against the stub OpenAI API capped at
+--upstream-capacity concurrent requests (429 beyond). A flood of batch
+analyses and chat questions competes with periodic live clinical checks; each
+run reports end-to-end latency and failures per purpose, plus how many 429s
+the upstream had to send.
+
+    python -m backend.bench.bench_scheduler --duration 15 --batch-clients 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from backend.bench.common import latency_summary
+from backend.bench.stub_openai import StubOpenAIServer
+from backend.services import llm_gateway, llm_scheduler
+
+MESSAGES = [{"role": "user", "content": "Paciente com dor torácica e dispneia."}]
+
+
+async def _client(purpose: str, deadline: float, latencies: Dict[str, List[float]], errors: Dict[str, int],
+                  interval_s: float = 0.0):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            await llm_gateway.chat_completion(
+                MESSAGES, purpose=purpose,
+                response_format={"type": "json_object"} if purpose == "clinical_check" else None,
+            )
+            latencies[purpose].append(time.perf_counter() - start)
+        except Exception:
+            errors[purpose] += 1
+        if interval_s:
+            await asyncio.sleep(max(0.0, interval_s - (time.perf_counter() - start)))
+
+
+async def run(args, scheduler: bool, stub: StubOpenAIServer) -> Dict[str, Any]:
+    os.environ["LLM_SCHEDULER"] = "1" if scheduler else "0"
+    llm_scheduler._scheduler = None
+    await llm_gateway.shutdown()
+    await llm_gateway.startup()
+    before = stub.calls["rate_limited"]
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    deadline = time.perf_counter() + args.duration
+    clients = (
+        [_client("batch", deadline, latencies, errors) for _ in range(args.batch_clients)]
+        + [_client("chat", deadline, latencies, errors) for _ in range(args.chat_clients)]
+        + [_client("clinical_check", deadline, latencies, errors, interval_s=args.safety_interval)]
+    )
+    await asyncio.gather(*clients)
+    return {
+        "scheduler": scheduler,
+        "upstream_429s": stub.calls["rate_limited"] - before,
+        "concurrency_limit_end": round(llm_scheduler.get_scheduler().limit, 1) if scheduler else None,
+        "purposes": {
+            purpose: {"completed": len(latencies[purpose]), "failed": errors[purpose],
+                      "latency": latency_summary(latencies[purpose])}
+            for purpose in ("clinical_check", "chat", "batch")
+        },
+    }
+
+
+async def main(args) -> Dict[str, Any]:
+    stub = await StubOpenAIServer(chat_latency_ms=args.upstream_latency_ms,
+                                  max_concurrency=args.upstream_capacity).start()
+    os.environ.update({
+        "LLM_BACKEND": "openai",
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": stub.url,
+    })
+    runs = []
+    try:
+        for scheduler in (False, True):
+            result = await run(args, scheduler, stub)
+            runs.append(result)
+            print(json.dumps(result))
+    finally:
+        await llm_gateway.shutdown()
+        await stub.stop()
+    return {
+        "benchmark": "llm_scheduler",
+        "config": {
+            "duration_s": args.duration,
+            "upstream_capacity": args.upstream_capacity,
+            "upstream_latency_ms": args.upstream_latency_ms,
+            "batch_clients": args.batch_clients,
+            "chat_clients": args.chat_clients,
+            "safety_interval_s": args.safety_interval,
+        },
+        "runs": runs,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--upstream-capacity", type=int, default=8, help="concurrent requests before 429")
+    parser.add_argument("--upstream-latency-ms", type=float, default=300.0)
+    parser.add_argument("--batch-clients", type=int, default=32)
+    parser.add_argument("--chat-clients", type=int, default=8)
+    parser.add_argument("--safety-interval", type=float, default=0.5, help="seconds between clinical checks")
+    parser.add_argument("--output", help="write the JSON result to this file")
+    args = parser.parse_args()
+    result = asyncio.run(main(args))
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,156 @@
+"""Staging store throughput across N worker processes.
+
+Each worker process runs a read/write mix (get, update, and every tenth op a
+clear) over a shared set of patient ids for a fixed duration. By default the
+workers call the staging backend directly; with --http they drive the API of
+a uvicorn app started with the same number of workers.
+
+    python -m backend.bench.bench_staging --processes 1,2,4,8 --duration 5
+    python -m backend.bench.bench_staging --backend sqlite --http --processes 1,4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+from backend.bench.common import app_server, latency_summary
+
+
+def _op_mix(rng: random.Random, n_patients: int) -> Tuple[str, str]:
+    patient_id = f"bench_{rng.randrange(n_patients)}"
+    r = rng.random()
+    if r < 0.1:
+        return "clear", patient_id
+    if r < 0.5:
+        return "update", patient_id
+    return "get", patient_id
+
+
+def _direct_worker(args) -> Dict[str, Any]:
+    seed, duration, n_patients, payload_bytes = args
+    # Imported in the child so each process builds its own connection from the environment
+    from backend.services import staging_service
+
+    rng = random.Random(seed)
+    payload = "x" * payload_bytes
+    latencies: List[float] = []
+    errors = 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        op, patient_id = _op_mix(rng, n_patients)
+        t = time.perf_counter()
+        try:
+            if op == "get":
+                staging_service.get_staging(patient_id)
+            elif op == "update":
+                staging_service.update_staging(patient_id, payload)
+            else:
+                staging_service.clear_staging(patient_id)
+        except Exception:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - t)
+    return {"latencies": latencies, "errors": errors}
+
+
+def _http_worker(args) -> Dict[str, Any]:
+    seed, duration, n_patients, payload_bytes, port = args
+    import httpx
+
+    rng = random.Random(seed)
+    payload = "x" * payload_bytes
+    latencies: List[float] = []
+    errors = 0
+    base = f"http://127.0.0.1:{port}/patients"
+    with httpx.Client(timeout=10.0) as client:
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            op, patient_id = _op_mix(rng, n_patients)
+            t = time.perf_counter()
+            try:
+                if op == "get":
+                    r = client.get(f"{base}/{patient_id}/staging")
+                elif op == "update":
+                    r = client.post(f"{base}/{patient_id}/staging", json={"patient_id": patient_id, "content": payload})
+                else:
+                    r = client.delete(f"{base}/{patient_id}/staging")
+                r.raise_for_status()
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - t)
+    return {"latencies": latencies, "errors": errors}
+
+
+def run_level(n: int, args, port: int = 0) -> Dict[str, Any]:
+    if args.http:
+        jobs = [(i, args.duration, args.patients, args.payload_bytes, port) for i in range(n * args.clients_per_worker)]
+        worker = _http_worker
+    else:
+        jobs = [(i, args.duration, args.patients, args.payload_bytes) for i in range(n)]
+        worker = _direct_worker
+    # spawn: children import the backend fresh instead of inheriting this process's connection
+    ctx = multiprocessing.get_context("spawn")
+    start = time.perf_counter()
+    with ctx.Pool(len(jobs)) as pool:
+        results = pool.map(worker, jobs)
+    elapsed = time.perf_counter() - start
+    latencies = [v for r in results for v in r["latencies"]]
+    return {
+        "processes": n,
+        "ops": len(latencies),
+        "errors": sum(r["errors"] for r in results),
+        "ops_per_s": round(len(latencies) / args.duration, 1),
+        "wall_s": round(elapsed, 2),
+        "latency": latency_summary(latencies),
+    }
+
+
+def main(args) -> Dict[str, Any]:
+    db_dir = tempfile.mkdtemp(prefix="bench_staging_")
+    os.environ["STAGING_BACKEND"] = args.backend
+    os.environ["STAGING_DB_PATH"] = os.path.join(db_dir, "staging.db")
+    levels = []
+    for n in args.processes:
+        if args.http:
+            env = {"STAGING_BACKEND": args.backend, "STAGING_DB_PATH": os.environ["STAGING_DB_PATH"], "LLM_BACKEND": "stub"}
+            with app_server(env, workers=n) as proc:
+                result = run_level(n, args, proc.port)
+        else:
+            result = run_level(n, args)
+        levels.append(result)
+        print(json.dumps(result))
+    return {
+        "benchmark": "staging_store",
+        "config": {
+            "backend": args.backend,
+            "http": args.http,
+            "duration_s": args.duration,
+            "patients": args.patients,
+            "payload_bytes": args.payload_bytes,
+        },
+        "levels": levels,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=lambda s: [int(x) for x in s.split(",")], default=[1, 2, 4])
+    parser.add_argument("--backend", choices=["sqlite", "memory"], default="sqlite")
+    parser.add_argument("--http", action="store_true", help="go through the API (uvicorn --workers N)")
+    parser.add_argument("--clients-per-worker", type=int, default=2, help="client processes per app worker (--http)")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--patients", type=int, default=100)
+    parser.add_argument("--payload-bytes", type=int, default=2048)
+    parser.add_argument("--output", help="write the JSON result to this file")
+    args = parser.parse_args()
+    result = main(args)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
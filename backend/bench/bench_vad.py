@@ -0,0 +1,230 @@
+"""Upstream bytes saved and commit latency of the relay's VAD auto-commit.
+
+Replays PCM16 audio (a raw mono file, or a synthetic consultation of tone
+bursts over background noise) through /ws/transcribe twice: once with the
+VAD off and the client committing every --commit-every seconds (the previous
+behaviour), once with the VAD on and no client commits. For every turn end (speech followed by at
+least the commit pause) it measures the time until a final transcript
+covering it arrives, and compares the audio bytes the stub upstream received.
+
+    python -m backend.bench.bench_vad --speed 2
+    python -m backend.bench.bench_vad --pcm consulta.pcm --sample-rate 16000
+    python -m backend.bench.bench_vad --offline --pcm consulta.pcm
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from websockets.asyncio.client import connect
+
+from backend.bench.common import app_server, latency_summary
+from backend.bench.stub_realtime import StubRealtimeServer
+from backend.services import audio_dsp
+
+SAMPLE_RATE = 24000
+
+
+def synthetic_consultation(seconds: float, pause_ms: int, sample_rate: int = SAMPLE_RATE,
+                           seed: int = 7) -> Tuple[bytes, List[float]]:
+    """Alternating utterances (0.8-4 s) and pauses (0.3-3 s) over low noise.
+
+    Returns (pcm, turn ends): utterance ends followed by at least `pause_ms` of silence.
+    """
+    rng = np.random.default_rng(seed)
+    total = int(seconds * sample_rate)
+    audio = rng.normal(0, 30, total).astype(np.float32)
+    ends: List[float] = []
+    pos = int(rng.uniform(0.5, 1.5) * sample_rate)
+    while pos < total:
+        length = min(int(rng.uniform(0.8, 4.0) * sample_rate), total - pos)
+        t = np.arange(length) / sample_rate
+        f0 = rng.uniform(100, 220)
+        voiced = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6))
+        # Syllable-rate envelope, so the level dips briefly inside an utterance like real speech
+        envelope = 0.55 + 0.45 * np.sin(2 * np.pi * rng.uniform(3, 5) * t)
+        audio[pos:pos + length] += (3000 * voiced * envelope).astype(np.float32)
+        gap = rng.uniform(0.3, 3.0)
+        if gap * 1000 >= pause_ms or pos + length >= total:
+            ends.append((pos + length) / sample_rate)
+        pos += length + int(gap * sample_rate)
+    return np.clip(audio, -32768, 32767).astype("<i2").tobytes(), ends
+
+
+def detected_utterance_ends(pcm: bytes, sample_rate: int, pause_ms: int) -> List[float]:
+    """Turn ends of recorded audio, as the VAD sees them (speech followed by >= pause_ms)."""
+    vad = audio_dsp.EnergyVAD.from_env()
+    pcm = audio_dsp.PCM16Resampler(sample_rate).process(pcm)
+    ends: List[float] = []
+    frame_s = vad.frame_ms / 1000.0
+    position = 0.0
+    last_speech = None
+    for i in range(0, len(pcm), vad.frame_bytes):
+        vad.process(pcm[i:i + vad.frame_bytes])
+        position += frame_s
+        if vad.silent_frames == 0:
+            last_speech = position
+        elif last_speech is not None and vad.silence_ms >= pause_ms:
+            ends.append(last_speech)
+            last_speech = None
+    if last_speech is not None:
+        ends.append(last_speech)
+    return ends
+
+
+def offline(pcm: bytes, sample_rate: int, chunk_ms: int) -> Dict[str, Any]:
+    """VAD only, no servers: bytes kept vs dropped and processing cost."""
+    resampler = audio_dsp.PCM16Resampler(sample_rate)
+    vad = audio_dsp.EnergyVAD.from_env()
+    chunk = sample_rate * 2 * chunk_ms // 1000
+    kept = dropped = 0
+    start = time.perf_counter()
+    for i in range(0, len(pcm), chunk):
+        out, n = vad.process(resampler.process(pcm[i:i + chunk]))
+        kept += len(out)
+        dropped += n
+    elapsed = time.perf_counter() - start
+    total = kept + dropped
+    return {
+        "audio_s": round(len(pcm) / (sample_rate * 2), 2),
+        "upstream_bytes": kept,
+        "dropped_bytes": dropped,
+        "bytes_saved_percent": round(100.0 * dropped / total, 1) if total else None,
+        "realtime_factor": round((len(pcm) / (sample_rate * 2)) / elapsed, 1) if elapsed else None,
+    }
+
+
+async def replay(url: str, pcm: bytes, sample_rate: int, chunk_ms: int, speed: float, vad: bool,
+                 commit_every_s: float, utterance_ends: List[float], settle_s: float = 5.0) -> Dict[str, Any]:
+    """Stream `pcm` paced at `speed` x real time; the result also lists the final segments' (start, end)."""
+    chunk = sample_rate * 2 * chunk_ms // 1000
+    chunk_s = chunk_ms / 1000.0
+    # Wall time at which the chunk containing each utterance end was sent
+    end_sent_at: Dict[int, float] = {}
+    latencies: List[float] = []
+    segments: List[Tuple[float, float]] = []
+    finals = 0
+    async with connect(url, max_size=None, compression=None) as ws:
+        await ws.send(json.dumps({"type": "init", "sample_rate_hz": sample_rate, "codec": "pcm16", "vad": vad}))
+
+        async def reader():
+            nonlocal finals
+            async for msg in ws:
+                evt = json.loads(msg)
+                if evt.get("type") != "transcription_update" or not evt.get("is_final"):
+                    continue
+                finals += 1
+                now = time.perf_counter()
+                segments.extend((s.get("start") or 0.0, s.get("end") or 0.0) for s in evt.get("segments") or [])
+                covered = max((s.get("end") or 0.0 for s in evt.get("segments") or []), default=0.0)
+                for i in [i for i in end_sent_at if utterance_ends[i] <= covered + chunk_s]:
+                    latencies.append(now - end_sent_at.pop(i))
+
+        reader_task = asyncio.create_task(reader())
+        start = time.perf_counter()
+        next_commit = commit_every_s
+        next_end = 0
+        tick = 0
+        for offset in range(0, len(pcm), chunk):
+            await ws.send(pcm[offset:offset + chunk])
+            audio_t = (offset + chunk) / (sample_rate * 2)
+            while next_end < len(utterance_ends) and utterance_ends[next_end] <= audio_t:
+                end_sent_at[next_end] = time.perf_counter()
+                next_end += 1
+            if not vad and audio_t >= next_commit:
+                await ws.send(json.dumps({"type": "commit"}))
+                next_commit += commit_every_s
+            tick += 1
+            await asyncio.sleep(max(0.0, start + tick * chunk_s / speed - time.perf_counter()))
+        # Flush whatever is still buffered (ignored by the VAD relay when already committed)
+        await ws.send(json.dumps({"type": "commit"}))
+        deadline = time.perf_counter() + settle_s
+        while end_sent_at and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        reader_task.cancel()
+        await ws.send(json.dumps({"type": "close"}))
+    return {
+        "finals": finals,
+        "turns": len(utterance_ends),
+        "uncovered": len(end_sent_at),
+        "turn_end_to_final": latency_summary(latencies),
+        "segments": segments,
+    }
+
+
+async def main(args) -> Dict[str, Any]:
+    if args.pcm:
+        with open(args.pcm, "rb") as f:
+            pcm = f.read()
+        sample_rate = args.sample_rate
+        ends = detected_utterance_ends(pcm, sample_rate, args.pause_ms)
+    else:
+        sample_rate = SAMPLE_RATE
+        pcm, ends = synthetic_consultation(args.duration, args.pause_ms, sample_rate)
+    config = {
+        "source": args.pcm or "synthetic",
+        "audio_s": round(len(pcm) / (sample_rate * 2), 2),
+        "sample_rate": sample_rate,
+        "chunk_ms": args.chunk_ms,
+        "speed": args.speed,
+        "commit_every_s": args.commit_every,
+        "vad_commit_pause_ms": args.pause_ms,
+        "upstream_latency_ms": args.upstream_latency_ms,
+    }
+    if args.offline:
+        return {"benchmark": "realtime_vad_offline", "config": config, "result": offline(pcm, sample_rate, args.chunk_ms)}
+
+    stub = await StubRealtimeServer(latency_ms=args.upstream_latency_ms).start()
+    env = {
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_REALTIME_URL": stub.url,
+        "LLM_BACKEND": "stub",
+        "LIVE_CLINICAL_PUSH": "0",
+        "VAD_COMMIT_PAUSE_MS": str(args.pause_ms),
+    }
+    runs: Dict[str, Any] = {}
+    cm = app_server(env)
+    proc = await asyncio.get_running_loop().run_in_executor(None, cm.__enter__)
+    try:
+        url = f"ws://127.0.0.1:{proc.port}/ws/transcribe"
+        for name, vad in (("client_commits", False), ("vad_auto_commit", True)):
+            before = stub.audio_bytes
+            result = await replay(url, pcm, sample_rate, args.chunk_ms, args.speed, vad, args.commit_every, ends)
+            result.pop("segments")
+            result["upstream_bytes"] = stub.audio_bytes - before
+            runs[name] = result
+            print(json.dumps({name: result}))
+    finally:
+        await asyncio.get_running_loop().run_in_executor(None, cm.__exit__, None, None, None)
+        await stub.stop()
+    base, gated = runs["client_commits"]["upstream_bytes"], runs["vad_auto_commit"]["upstream_bytes"]
+    return {
+        "benchmark": "realtime_vad",
+        "config": config,
+        "runs": runs,
+        "bytes_saved_percent": round(100.0 * (base - gated) / base, 1) if base else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pcm", help="raw mono pcm16 little-endian file (default: synthetic audio)")
+    parser.add_argument("--sample-rate", type=int, default=SAMPLE_RATE, help="sample rate of --pcm")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of synthetic audio")
+    parser.add_argument("--chunk-ms", type=int, default=100)
+    parser.add_argument("--speed", type=float, default=1.0, help="replay faster than real time")
+    parser.add_argument("--commit-every", type=float, default=2.0, help="client commit cadence without VAD")
+    parser.add_argument("--pause-ms", type=int, default=int(os.getenv("VAD_COMMIT_PAUSE_MS", "700")))
+    parser.add_argument("--upstream-latency-ms", type=float, default=80.0)
+    parser.add_argument("--offline", action="store_true", help="run only the VAD over the audio, no servers")
+    parser.add_argument("--output", help="write the JSON result to this file")
+    args = parser.parse_args()
+    result = asyncio.run(main(args))
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
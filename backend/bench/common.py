@@ -0,0 +1,122 @@
+"""Helpers shared by the benchmark scripts (app process control, percentiles, RSS/CPU)."""
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile; None for an empty sample."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def latency_summary(values_s: List[float]) -> Dict[str, Optional[float]]:
+    def ms(v):
+        return None if v is None else round(v * 1000.0, 3)
+    return {
+        "count": len(values_s),
+        "p50_ms": ms(percentile(values_s, 50)),
+        "p95_ms": ms(percentile(values_s, 95)),
+        "p99_ms": ms(percentile(values_s, 99)),
+        "max_ms": ms(max(values_s) if values_s else None),
+    }
+
+
+def process_rss_bytes(pid: int) -> Optional[int]:
+    """Resident set size from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def process_cpu_seconds(pid: int) -> Optional[float]:
+    """User + system CPU time from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = os.sysconf("SC_CLK_TCK")
+        return (int(fields[11]) + int(fields[12])) / ticks
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def process_tree(pid: int) -> List[int]:
+    """`pid` and all its descendants (uvicorn workers), from /proc (Linux only)."""
+    pids = [pid]
+    i = 0
+    while i < len(pids):
+        try:
+            for task in os.listdir(f"/proc/{pids[i]}/task"):
+                with open(f"/proc/{pids[i]}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+        i += 1
+    return pids
+
+
+def process_tree_rss_bytes(pid: int) -> Optional[int]:
+    values = [v for v in (process_rss_bytes(p) for p in process_tree(pid)) if v is not None]
+    return sum(values) if values else None
+
+
+def process_tree_cpu_seconds(pid: int) -> Optional[float]:
+    values = [v for v in (process_cpu_seconds(p) for p in process_tree(pid)) if v is not None]
+    return sum(values) if values else None
+
+
+@contextlib.contextmanager
+def app_server(env: Dict[str, str], port: Optional[int] = None, workers: int = 1) -> Iterator[subprocess.Popen]:
+    """Run `backend.main:app` under uvicorn in a child process until the block exits."""
+    port = port or free_port()
+    child_env = dict(os.environ)
+    child_env.update(env)
+    child_env["PYTHONPATH"] = REPO_ROOT + os.pathsep + child_env.get("PYTHONPATH", "")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app",
+         "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=REPO_ROOT,
+        env=child_env,
+    )
+    proc.port = port  # type: ignore[attr-defined]
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError("app server exited during startup")
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/", timeout=1.0)
+                break
+            except httpx.HTTPError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError("app server did not start in time")
+                time.sleep(0.2)
+        yield proc
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
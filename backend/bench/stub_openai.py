@@ -0,0 +1,161 @@
+"""Local stand-in for the OpenAI HTTP API (chat completions and audio transcriptions).
+
+The app talks to it through the real SDK path by setting
+OPENAI_BASE_URL=<stub url> and any OPENAI_API_KEY. Every answer comes after an
+artificial latency; streamed chat sends one chunk per word after the first.
+JSON-mode completions carry every key the app's prompts ask for, so the
+clinical check, analysis and summary paths all parse. With `max_concurrency`
+requests beyond that many in flight get a 429, like a rate-limited account.
+
+    python -m backend.bench.stub_openai --port 8766 --chat-latency-ms 300
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from backend.bench.common import free_port
+
+CHAT_TEXT = "Resposta simulada do servidor de benchmark para o copiloto clínico."
+JSON_ANSWER = {
+    "critical_alerts": [],
+    "missing_questions": ["Perguntar sobre alergias."],
+    "recommended_conducts": ["Reavaliar sinais vitais."],
+    "alerts": [{"type": "info", "message": "Revisar medicações em uso."}],
+    "suggestions": [{"text": "Solicitar hemograma completo."}],
+}
+
+
+class StubOpenAIServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, chat_latency_ms: float = 300.0,
+                 token_interval_ms: float = 20.0, transcribe_latency_ms: float = 500.0, max_concurrency: int = 0):
+        self.host = host
+        self.port = port or free_port()
+        self.chat_latency_s = chat_latency_ms / 1000.0
+        self.token_interval_s = token_interval_ms / 1000.0
+        self.transcribe_latency_s = transcribe_latency_ms / 1000.0
+        self.max_concurrency = max_concurrency
+        self.inflight = 0
+        # Structure: {"chat": n, "chat_stream": n, "transcriptions": n, "rate_limited": n}
+        self.calls: Counter = Counter()
+        self._ids = itertools.count(1)
+        self._server = None
+        self._task = None
+        self.app = self._build_app()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self):
+        config = uvicorn.Config(self.app, host=self.host, port=self.port, log_level="warning", lifespan="off")
+        self._server = uvicorn.Server(config)
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            if self._task.done():
+                self._task.result()
+            await asyncio.sleep(0.02)
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            await self._task
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.middleware("http")
+        async def concurrency_cap(request: Request, call_next):
+            if self.max_concurrency and self.inflight >= self.max_concurrency:
+                self.calls["rate_limited"] += 1
+                return JSONResponse(status_code=429, headers={"retry-after-ms": "200"}, content={
+                    "error": {"message": "Rate limit reached (stub)", "type": "requests", "code": "rate_limit_exceeded"},
+                })
+            self.inflight += 1
+            try:
+                return await call_next(request)
+            finally:
+                self.inflight -= 1
+
+        @app.post("/v1/chat/completions")
+        async def chat_completions(request: Request):
+            body = await request.json()
+            model = body.get("model") or "stub"
+            completion_id = f"chatcmpl-{next(self._ids)}"
+            if body.get("stream"):
+                self.calls["chat_stream"] += 1
+                return StreamingResponse(self._stream(completion_id, model), media_type="text/event-stream")
+            self.calls["chat"] += 1
+            await asyncio.sleep(self.chat_latency_s)
+            json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+            content = json.dumps(JSON_ANSWER, ensure_ascii=False) if json_mode else CHAT_TEXT
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+
+        @app.post("/v1/audio/transcriptions")
+        async def transcriptions(request: Request):
+            self.calls["transcriptions"] += 1
+            # Consume the upload like the real API would, without parsing the form
+            await request.body()
+            await asyncio.sleep(self.transcribe_latency_s)
+            text = "Transcrição simulada do servidor de benchmark."
+            return JSONResponse({
+                "text": text,
+                "duration": 1.0,
+                "segments": [{
+                    "id": "seg_0", "start": 0.0, "end": 1.0, "speaker": "A",
+                    "text": text, "type": "transcript.text.segment",
+                }],
+            })
+
+        return app
+
+    async def _stream(self, completion_id: str, model: str):
+        await asyncio.sleep(self.chat_latency_s)
+        for i, word in enumerate(CHAT_TEXT.split(" ")):
+            if i:
+                await asyncio.sleep(self.token_interval_s)
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word if not i else " " + word}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+
+
+async def _main(args):
+    server = await StubOpenAIServer(args.host, args.port, args.chat_latency_ms, args.token_interval_ms,
+                                    args.transcribe_latency_ms, args.max_concurrency).start()
+    print(f"stub openai listening on {server.url}")
+    await asyncio.Future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--chat-latency-ms", type=float, default=300.0)
+    parser.add_argument("--token-interval-ms", type=float, default=20.0)
+    parser.add_argument("--transcribe-latency-ms", type=float, default=500.0)
+    parser.add_argument("--max-concurrency", type=int, default=0, help="answer 429 beyond this many in flight")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,124 @@
+"""Local stand-in for the upstream realtime transcription WebSocket.
+
+Speaks the subset of the protocol the relay uses: session created/updated,
+audio appends, commits answered with transcription deltas and a completed
+event after an artificial latency. With `kill_every_s` it also aborts each
+connection after a random (exponential) lifetime, like a flaky network path.
+
+    python -m backend.bench.stub_realtime --port 8765 --latency-ms 80
+    python -m backend.bench.stub_realtime --kill-every 5
+"""
+import argparse
+import asyncio
+import json
+import itertools
+import random
+
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+BYTES_PER_SECOND = 24000 * 2  # pcm16 mono @ 24 kHz
+
+
+class StubRealtimeServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 80.0, deltas: int = 3,
+                 kill_every_s: float = 0.0, seed: int = 0):
+        self.host = host
+        self.port = port
+        self.latency_s = latency_ms / 1000.0
+        self.deltas = deltas
+        self.kill_every_s = kill_every_s
+        self.server = None
+        self.connections = 0
+        self.kills = 0
+        self.audio_bytes = 0
+        self._rng = random.Random(seed)
+        self._item_ids = itertools.count(1)
+
+    async def start(self):
+        self.server = await serve(self.handler, self.host, self.port, max_size=None, compression=None)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}/v1/realtime?intent=transcription"
+
+    async def handler(self, conn):
+        self.connections += 1
+        buffered = 0
+        pending = set()
+        if self.kill_every_s > 0:
+            killer = asyncio.create_task(self._kill_later(conn, self._rng.expovariate(1.0 / self.kill_every_s)))
+            pending.add(killer)
+        try:
+            await conn.send(json.dumps({"type": "transcription_session.created"}))
+            async for msg in conn:
+                evt = json.loads(msg)
+                typ = evt.get("type")
+                if typ == "transcription_session.update":
+                    await conn.send(json.dumps({"type": "transcription_session.updated", "session": evt.get("session")}))
+                elif typ == "input_audio_buffer.append":
+                    # base64 length * 3/4 ~= decoded PCM bytes, without paying for the decode
+                    n = len(evt.get("audio") or "") * 3 // 4
+                    buffered += n
+                    self.audio_bytes += n
+                elif typ == "input_audio_buffer.commit":
+                    item_id = f"item_{next(self._item_ids)}"
+                    await conn.send(json.dumps({"type": "input_audio_buffer.committed", "item_id": item_id}))
+                    task = asyncio.create_task(self._complete(conn, item_id, buffered))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+                    buffered = 0
+        except ConnectionClosed:
+            pass
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _kill_later(self, conn, after_s: float):
+        await asyncio.sleep(after_s)
+        self.kills += 1
+        # No close frame: the relay sees the connection die mid-stream
+        conn.transport.abort()
+
+    async def _complete(self, conn, item_id: str, audio_bytes: int):
+        await asyncio.sleep(self.latency_s)
+        seconds = audio_bytes / BYTES_PER_SECOND
+        words = ["palavra"] * max(1, int(seconds * 2.5))
+        transcript = " ".join(words) + "."
+        step = max(1, len(words) // max(1, self.deltas))
+        try:
+            for i in range(0, len(words), step):
+                await conn.send(json.dumps({
+                    "type": "conversation.item.input_audio_transcription.delta",
+                    "item_id": item_id,
+                    "delta": " ".join(words[i:i + step]) + " ",
+                }))
+            await conn.send(json.dumps({
+                "type": "conversation.item.input_audio_transcription.completed",
+                "item_id": item_id,
+                "transcript": transcript,
+            }))
+        except ConnectionClosed:
+            pass
+
+
+async def _main(args):
+    server = await StubRealtimeServer(args.host, args.port, args.latency_ms, kill_every_s=args.kill_every).start()
+    print(f"stub realtime listening on {server.url}")
+    await asyncio.Future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--kill-every", type=float, default=0.0, help="mean seconds before aborting a connection")
+    asyncio.run(_main(parser.parse_args()))
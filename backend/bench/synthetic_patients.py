@@ -0,0 +1,126 @@
+"""Synthetic patient folders for load tests.
+
+Patients are written under DATA_DIR with a `bench_` id prefix, in the same
+layout as the real ones (Prontuario.md with numbered sections, plus exam
+documents under exames/), so only they are removed by `cleanup`.
+
+    python -m backend.bench.synthetic_patients --count 1000 --chart-kb 16
+    python -m backend.bench.synthetic_patients --cleanup
+"""
+import argparse
+import os
+import random
+import shutil
+from typing import List
+
+from backend.services.prontuario_service import DATA_DIR
+
+PREFIX = "bench_"
+
+FIRST_NAMES = ["Ana", "Bruno", "Carla", "Diego", "Elisa", "Fábio", "Gabriela", "Hugo", "Íris", "João",
+               "Larissa", "Marcos", "Natália", "Otávio", "Paula", "Rafael", "Sofia", "Tiago", "Vera", "Wagner"]
+SURNAMES = ["Almeida", "Barbosa", "Cardoso", "Dias", "Esteves", "Ferreira", "Gomes", "Lima", "Moura", "Souza"]
+COMPLAINTS = ["dor abdominal difusa", "dispneia aos esforços", "cefaleia holocraniana", "febre há três dias",
+              "dor torácica atípica", "tosse produtiva", "lombalgia mecânica", "tontura rotatória"]
+ALLERGIES = ["dipirona", "penicilina", "sulfa", "AINEs", "látex", "iodo"]
+PROBLEMS = ["hipertensão arterial sistêmica", "diabetes mellitus tipo 2", "DPOC", "hipotireoidismo",
+            "insuficiência cardíaca", "doença renal crônica estágio 3", "fibrilação atrial"]
+EVOLUTION = [
+    "Paciente em regular estado geral, lúcido e orientado, hidratado, afebril.",
+    "Refere melhora parcial da dor após analgesia, aceitando dieta por via oral.",
+    "Ao exame: abdome flácido, doloroso à palpação profunda, sem sinais de peritonite.",
+    "Ausculta pulmonar com murmúrio vesicular presente, sem ruídos adventícios.",
+    "Mantém diurese adequada, sem queixas urinárias. Glicemias capilares controladas.",
+    "Conduta: manter antibioticoterapia, reavaliar exames laboratoriais amanhã.",
+]
+EXAMS = {
+    "hemograma.md": "Hemoglobina: {hb} g/dL\nLeucócitos: {leuco}/mm³\nPlaquetas: {plaq}/mm³\n",
+    "bioquimica.md": "Creatinina: {cr} mg/dL\nUreia: {ur} mg/dL\nSódio: {na} mEq/L\nPotássio: {k} mEq/L\n",
+    "pcr.md": "Proteína C reativa: {pcr} mg/L\n",
+}
+
+
+def patient_id(i: int) -> str:
+    return f"{PREFIX}{i:06d}"
+
+
+def _chart(rng: random.Random, pid: str, name: str, chart_bytes: int) -> str:
+    allergies = rng.sample(ALLERGIES, rng.randint(0, 2))
+    lines = [
+        f"# Prontuário - {name} ({pid})",
+        "",
+        f"Paciente: {name}",
+        f"Idade: {rng.randint(18, 92)} anos",
+        f"Sexo: {rng.choice(['Masculino', 'Feminino'])}",
+        f"Data: {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2025",
+        "",
+        "1. Motivo da Admissão",
+        "",
+        f"{rng.choice(COMPLAINTS).capitalize()}.",
+        "",
+        "2. Alergias",
+        "",
+        ", ".join(allergies) if allergies else "Nega alergias conhecidas.",
+        "",
+        "3. Lista de Problemas",
+        "",
+        *[f"- {p}" for p in rng.sample(PROBLEMS, rng.randint(1, 3))],
+        "",
+        "4. Evolução",
+        "",
+    ]
+    text = "\n".join(lines)
+    day = 1
+    while len(text.encode("utf-8")) < chart_bytes:
+        entry = " ".join(rng.sample(EVOLUTION, 3))
+        text += f"\nDia {day}: {entry}\n"
+        day += 1
+    return text
+
+
+def generate(count: int, chart_kb: float = 8.0, exams: int = 2, seed: int = 0) -> List[str]:
+    """Write `count` synthetic patients (existing bench_ folders are overwritten); returns their ids."""
+    rng = random.Random(seed)
+    ids = []
+    for i in range(count):
+        pid = patient_id(i)
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(SURNAMES)}"
+        folder = os.path.join(DATA_DIR, pid)
+        os.makedirs(os.path.join(folder, "exames"), exist_ok=True)
+        with open(os.path.join(folder, "Prontuario.md"), "w", encoding="utf-8") as f:
+            f.write(_chart(rng, pid, name, int(chart_kb * 1024)))
+        for exam_name in list(EXAMS)[:exams]:
+            with open(os.path.join(folder, "exames", exam_name), "w", encoding="utf-8") as f:
+                f.write(f"# {exam_name[:-3].capitalize()}\n\n" + EXAMS[exam_name].format(
+                    hb=round(rng.uniform(8, 16), 1), leuco=rng.randint(3000, 22000), plaq=rng.randint(90, 450) * 1000,
+                    cr=round(rng.uniform(0.6, 3.5), 2), ur=rng.randint(15, 120), na=rng.randint(128, 148),
+                    k=round(rng.uniform(3.0, 6.0), 1), pcr=round(rng.uniform(1, 250), 1),
+                ))
+        ids.append(pid)
+    return ids
+
+
+def cleanup() -> int:
+    """Remove every bench_ patient folder; returns how many were removed."""
+    removed = 0
+    if not os.path.isdir(DATA_DIR):
+        return 0
+    for name in os.listdir(DATA_DIR):
+        if name.startswith(PREFIX):
+            shutil.rmtree(os.path.join(DATA_DIR, name), ignore_errors=True)
+            removed += 1
+    return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--chart-kb", type=float, default=8.0)
+    parser.add_argument("--exams", type=int, default=2, choices=range(0, len(EXAMS) + 1))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cleanup", action="store_true", help="remove the bench_ patients and exit")
+    args = parser.parse_args()
+    if args.cleanup:
+        print(f"removed {cleanup()} synthetic patients")
+    else:
+        print(f"wrote {len(generate(args.count, args.chart_kb, args.exams, args.seed))} synthetic patients to {DATA_DIR}")
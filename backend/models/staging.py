@@ -1,7 +1,18 @@
 
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Literal, Optional
 
 class StagingData(BaseModel):
     patient_id: str
     content: str
+
+class StagingOp(BaseModel):
+    op: Literal["append", "insert", "delete", "replace"]
+    text: Optional[str] = None
+    offset: Optional[int] = None
+    length: Optional[int] = None
+    separator: Optional[str] = None
+
+class StagingOps(BaseModel):
+    base_revision: int
+    ops: List[StagingOp]
@@ -0,0 +1,145 @@
+"""Pre-visit analysis of patients, one at a time or for a whole agenda.
+
+Results are content-addressed: the key covers the prompt, the model and the
+exact prontuario context and staging text sent, so a new chart version or a
+staging edit gets a new analysis while anything unchanged is served from
+memory or from disk (backend/data/cache/analysis). A batch runs with bounded
+concurrency and yields each patient's result as soon as it is ready.
+
+    python -m backend.services.analysis_service --all --concurrency 8
+    python -m backend.services.analysis_service pac_001 pac_002
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional
+from backend.services import copilot_service, llm_gateway, prontuario_service, staging_service, summary_service
+from backend.services.result_cache import AsyncResultCache, content_key
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "data", "cache", "analysis"
+)
+
+# In-memory layer in front of the disk cache; also coalesces concurrent requests for the same key
+_memory = AsyncResultCache(
+    max_entries=int(os.getenv("ANALYSIS_CACHE_SIZE", "512")),
+    ttl_s=float(os.getenv("ANALYSIS_CACHE_TTL_S", "86400")),
+)
+
+
+def _prontuario_tokens() -> int:
+    return int(os.getenv("ANALYZE_PRONTUARIO_TOKENS", "6000"))
+
+
+def batch_concurrency() -> int:
+    return max(1, int(os.getenv("ANALYZE_BATCH_CONCURRENCY", "4")))
+
+
+def _path_for(key: str) -> str:
+    return os.path.join(ANALYSIS_CACHE_DIR, f"{key}.json")
+
+
+def _load(key: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_path_for(key), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save(key: str, result: Dict[str, Any]):
+    try:
+        os.makedirs(ANALYSIS_CACHE_DIR, exist_ok=True)
+        tmp = _path_for(key) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp, _path_for(key))
+    except OSError:
+        logger.warning("could not persist analysis %s", key[:12], exc_info=True)
+
+
+def build_analysis_text(prontuario: str, staging: str) -> str:
+    return prontuario + "\n\n---\n\n" + staging
+
+
+async def analyze_patient(patient_id: str, purpose: str = "analyze") -> Optional[Dict[str, Any]]:
+    """Analysis of the patient's current chart and staging; None if the patient does not exist."""
+    prontuario = summary_service.prontuario_context(patient_id, _prontuario_tokens())
+    if prontuario is None:
+        return None
+    staging = staging_service.get_staging(patient_id)
+    text = build_analysis_text(prontuario, staging)
+    key = content_key(copilot_service.ANALYZE_SYSTEM_PROMPT, llm_gateway.default_chat_model(), text)
+    computed = False
+
+    async def compute() -> Dict[str, Any]:
+        nonlocal computed
+        stored = _load(key)
+        if stored is not None:
+            return stored
+        result = await copilot_service.analyze_text(text, purpose=purpose)
+        _save(key, result)
+        computed = True
+        return result
+
+    result = await _memory.get_or_compute(key, compute)
+    return {**result, "cached": not computed}
+
+
+async def analyze_batch(patient_ids: List[str], concurrency: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Analyze many patients, at most `concurrency` at a time, yielding results in completion order."""
+    semaphore = asyncio.Semaphore(concurrency or batch_concurrency())
+
+    async def run(patient_id: str) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                result = await analyze_patient(patient_id, purpose="batch")
+            except Exception as e:
+                logger.exception("batch analysis failed", extra={"patient_id": patient_id})
+                return {"patient_id": patient_id, "status": "error", "detail": str(e) or type(e).__name__}
+        if result is None:
+            return {"patient_id": patient_id, "status": "not_found"}
+        cached = result.pop("cached")
+        return {"patient_id": patient_id, "status": "ok", "cached": cached, "result": result}
+
+    tasks = [asyncio.ensure_future(run(pid)) for pid in dict.fromkeys(patient_ids)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Client went away mid-batch: do not keep paying for the remaining patients
+        for task in tasks:
+            task.cancel()
+
+
+def all_patient_ids() -> List[str]:
+    patients, _ = prontuario_service.page_patients()
+    return [p.id for p in patients]
+
+
+async def _main(args) -> int:
+    await llm_gateway.startup()
+    try:
+        patient_ids = all_patient_ids() if args.all else args.patient_ids
+        failures = 0
+        async for item in analyze_batch(patient_ids, args.concurrency):
+            failures += item["status"] != "ok"
+            print(json.dumps(item, ensure_ascii=False), flush=True)
+        return 1 if failures else 0
+    finally:
+        await llm_gateway.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch pre-visit analysis (NDJSON on stdout).")
+    parser.add_argument("patient_ids", nargs="*")
+    parser.add_argument("--all", action="store_true", help="every patient in DATA_DIR")
+    parser.add_argument("--concurrency", type=int, default=None)
+    args = parser.parse_args()
+    if not args.all and not args.patient_ids:
+        parser.error("pass patient ids or --all")
+    raise SystemExit(asyncio.run(_main(args)))
@@ -0,0 +1,240 @@
+"""PCM16 audio helpers for the realtime relay.
+
+Resampling to the upstream rate, an energy voice-activity gate that drops long
+silences, and a ring buffer of recent audio replayed after a reconnect.
+"""
+from collections import deque
+from typing import List, Optional, Tuple, Union
+import numpy as np
+import os
+
+# The realtime transcription API expects mono pcm16 at 24 kHz
+UPSTREAM_SAMPLE_RATE = 24000
+UPSTREAM_BYTES_PER_SECOND = UPSTREAM_SAMPLE_RATE * 2
+PCM16_CODECS = ("pcm16", "s16le", "pcm_s16le")
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+class PCM16Resampler:
+    """Streaming linear-interpolation resampler for mono little-endian PCM16 chunks.
+
+    State is carried across calls (last input sample, fractional read position
+    and a dangling odd byte), so chunk boundaries do not produce clicks or drift.
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int = UPSTREAM_SAMPLE_RATE):
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.step = src_rate / dst_rate
+        self._t = 0.0
+        self._last: Optional[np.ndarray] = None
+        self._odd = b""
+
+    @property
+    def passthrough(self) -> bool:
+        return self.src_rate == self.dst_rate
+
+    def process(self, data: BytesLike) -> BytesLike:
+        """Resample one chunk. Same-rate input is returned as is, without copying."""
+        if self.passthrough and not self._odd and len(data) % 2 == 0:
+            return data
+        if self._odd:
+            data = self._odd + bytes(data)
+            self._odd = b""
+        if len(data) % 2:
+            self._odd = bytes(data[-1:])
+            data = memoryview(data)[:-1]
+        if not len(data):
+            return b""
+        if self.passthrough:
+            return data
+
+        # Zero-copy view over the incoming frame
+        x = np.frombuffer(data, dtype="<i2").astype(np.float32)
+        src = x if self._last is None else np.concatenate((self._last, x))
+        last_index = len(src) - 1
+        if last_index < self._t:
+            self._last = src[-1:]
+            self._t -= last_index
+            return b""
+
+        n_out = int(np.floor((last_index - self._t) / self.step)) + 1
+        pos = self._t + self.step * np.arange(n_out, dtype=np.float64)
+        idx = np.minimum(pos.astype(np.int64), max(last_index - 1, 0))
+        frac = (pos - idx).astype(np.float32)
+        nxt = np.minimum(idx + 1, last_index)
+        out = src[idx] + (src[nxt] - src[idx]) * frac
+
+        # The last input sample becomes index 0 of the next chunk
+        self._t = pos[-1] + self.step - last_index
+        self._last = src[-1:]
+        return np.clip(np.rint(out), -32768, 32767).astype("<i2").tobytes()
+
+
+class EnergyVAD:
+    """Streaming energy / zero-crossing voice activity gate for mono PCM16.
+
+    Audio is classified in fixed frames. A frame is speech when its level is
+    `snr_db` above the tracked noise floor, or half that with a high
+    zero-crossing rate (unvoiced consonants such as "s" and "f"). Speech keeps
+    the gate open for `hangover_ms`; after that, silent frames are dropped, except
+    for the last `padding_ms`, which are released in front of the next onset.
+
+    The noise floor follows the minimum frame level over the last
+    `noise_window_ms` (minimum statistics), on every frame: it falls at once and
+    rises slowly, so it recovers when the room gets louder even if every frame
+    was classified as speech. It never goes below `min_noise_dbfs`.
+    """
+
+    NOISE_BLOCKS = 6
+
+    def __init__(self, sample_rate: int = UPSTREAM_SAMPLE_RATE, frame_ms: int = 20, snr_db: float = 9.0,
+                 min_speech_dbfs: float = -50.0, zcr_threshold: float = 0.25,
+                 hangover_ms: int = 300, padding_ms: int = 200,
+                 noise_window_ms: int = 3000, min_noise_dbfs: float = -90.0):
+        self.frame_bytes = sample_rate * frame_ms // 1000 * 2
+        self.frame_ms = frame_ms
+        self.snr_db = snr_db
+        self.min_speech_dbfs = min_speech_dbfs
+        self.zcr_threshold = zcr_threshold
+        self.hangover_frames = max(0, hangover_ms // frame_ms)
+        self.padding_frames = max(0, padding_ms // frame_ms)
+        self.noise_dbfs = -60.0
+        self.min_noise_dbfs = min_noise_dbfs
+        # The window minimum is kept per block, so each frame costs O(1)
+        self._block_frames = max(1, noise_window_ms // frame_ms // self.NOISE_BLOCKS)
+        self._block_mins: deque = deque(maxlen=self.NOISE_BLOCKS - 1)
+        self._block_min = float("inf")
+        self._block_len = 0
+        # Consecutive non-speech frames up to the current position (audio time, not wall time)
+        self.silent_frames = 0
+        self.speech_seen = False
+        self._rest = b""
+        self._padding: deque = deque()
+
+    @classmethod
+    def from_env(cls) -> "EnergyVAD":
+        return cls(
+            snr_db=float(os.getenv("VAD_SNR_DB", "9")),
+            min_speech_dbfs=float(os.getenv("VAD_MIN_SPEECH_DBFS", "-50")),
+            zcr_threshold=float(os.getenv("VAD_ZCR_THRESHOLD", "0.25")),
+            hangover_ms=int(os.getenv("VAD_HANGOVER_MS", "300")),
+            padding_ms=int(os.getenv("VAD_PADDING_MS", "200")),
+            noise_window_ms=int(os.getenv("VAD_NOISE_WINDOW_MS", "3000")),
+        )
+
+    @property
+    def silence_ms(self) -> int:
+        return self.silent_frames * self.frame_ms
+
+    def _classify(self, frames: np.ndarray) -> np.ndarray:
+        x = frames.astype(np.float32)
+        rms = np.sqrt(np.mean(x * x, axis=1)) + 1e-9
+        level_db = 20.0 * np.log10(rms / 32768.0)
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        speech = np.empty(len(frames), dtype=bool)
+        # The floor adapts frame by frame, so the threshold is applied sequentially
+        for i, (level, crossings) in enumerate(zip(level_db.tolist(), zcr.tolist())):
+            above = level - self.noise_dbfs
+            is_speech = level >= self.min_speech_dbfs and (
+                above >= self.snr_db or (above >= self.snr_db / 2 and crossings >= self.zcr_threshold)
+            )
+            self._track_noise(level)
+            speech[i] = is_speech
+        return speech
+
+    def _track_noise(self, level: float):
+        self._block_min = min(self._block_min, level)
+        self._block_len += 1
+        target = min(self._block_min, min(self._block_mins, default=self._block_min))
+        if self._block_len >= self._block_frames:
+            self._block_mins.append(self._block_min)
+            self._block_min = float("inf")
+            self._block_len = 0
+        # Falls fast, rises slowly: the window minimum only rises once louder audio fills the whole window
+        floor = target if target < self.noise_dbfs else self.noise_dbfs + 0.05 * (target - self.noise_dbfs)
+        self.noise_dbfs = max(self.min_noise_dbfs, floor)
+
+    def process(self, data: BytesLike) -> Tuple[bytes, int]:
+        """Gate one chunk: (audio to forward, number of bytes dropped).
+
+        A trailing partial frame is held until the next call.
+        """
+        if self._rest:
+            data = self._rest + bytes(data)
+        n_frames = len(data) // self.frame_bytes
+        whole = n_frames * self.frame_bytes
+        self._rest = bytes(data[whole:])
+        if not n_frames:
+            return b"", 0
+        view = memoryview(data)[:whole]
+        frames = np.frombuffer(view, dtype="<i2").reshape(n_frames, -1)
+        out: List[BytesLike] = []
+        dropped = 0
+        for i, is_speech in enumerate(self._classify(frames).tolist()):
+            frame = view[i * self.frame_bytes:(i + 1) * self.frame_bytes]
+            if is_speech:
+                self.speech_seen = True
+                self.silent_frames = 0
+                out.extend(self._padding)
+                self._padding.clear()
+                out.append(frame)
+                continue
+            self.silent_frames += 1
+            if self.speech_seen and self.silent_frames <= self.hangover_frames:
+                out.append(frame)
+                continue
+            self._padding.append(bytes(frame))
+            if len(self._padding) > self.padding_frames:
+                dropped += len(self._padding.popleft())
+        return b"".join(out), dropped
+
+
+class AudioRingBuffer:
+    """The last `capacity` bytes of an audio stream, in a preallocated buffer.
+
+    Bytes are addressed by absolute stream position (`end` counts every byte
+    ever written); `start` is the oldest position still held, either because
+    older bytes were overwritten or because they were released.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity - capacity % 2
+        self._buf = bytearray(self.capacity)
+        self.start = 0
+        self.end = 0
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def write(self, data: BytesLike):
+        n = len(data)
+        if not n or not self.capacity:
+            self.end += n
+            self.start = self.end
+            return
+        view = memoryview(data)
+        if n > self.capacity:
+            view = view[n - self.capacity:]
+        i = (self.end + n - len(view)) % self.capacity
+        first = min(len(view), self.capacity - i)
+        self._buf[i:i + first] = view[:first]
+        self._buf[:len(view) - first] = view[first:]
+        self.end += n
+        self.start = max(self.start, self.end - self.capacity)
+
+    def release(self, position: int):
+        """Forget everything before `position` (e.g. audio whose transcript arrived)."""
+        self.start = max(self.start, min(position, self.end))
+
+    def read(self, begin: int, stop: int) -> bytes:
+        """Bytes in [begin, stop), clipped to what is still held."""
+        begin, stop = max(begin, self.start), min(stop, self.end)
+        if begin >= stop:
+            return b""
+        i, j = begin % self.capacity, stop % self.capacity
+        if i < j:
+            return bytes(self._buf[i:j])
+        return bytes(self._buf[i:]) + bytes(self._buf[:j])
@@ -0,0 +1,111 @@
+"""Bounded, coalescing queue between a relay session and its upstream socket.
+
+The client pump only enqueues; a sender task drains the queue, merging the
+audio appends that piled up behind a slow upstream into larger frames.
+Control messages (commits) keep their place relative to the audio. The queue
+holds at most `max_bytes` of base64 audio: on overflow the oldest audio is
+dropped (a live transcript is worth more than a late one), and crossing the
+high / low watermark flips `throttled` so the relay can tell the client.
+"""
+import asyncio
+import os
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+AUDIO = "audio"
+MESSAGE = "message"
+
+
+def outbox_max_bytes() -> int:
+    # ~10 s of 24 kHz pcm16 once base64-encoded
+    return int(os.getenv("RELAY_OUTBOX_MAX_BYTES", "640000"))
+
+
+def upstream_frame_bytes() -> int:
+    return int(os.getenv("RELAY_UPSTREAM_FRAME_BYTES", "64000"))
+
+
+class AudioOutbox:
+    def __init__(self, max_bytes: Optional[int] = None, frame_bytes: Optional[int] = None,
+                 high_watermark: float = 0.5, low_watermark: float = 0.2):
+        self.max_bytes = max_bytes or outbox_max_bytes()
+        self.frame_bytes = frame_bytes or upstream_frame_bytes()
+        self.high_bytes = int(self.max_bytes * high_watermark)
+        self.low_bytes = int(self.max_bytes * low_watermark)
+        # Structure: deque[(kind, payload, pcm_bytes)]; payload is base64 audio or a JSON message
+        self._items: Deque[Tuple[str, str, int]] = deque()
+        self._ready = asyncio.Event()
+        self.queued_bytes = 0
+        self.queued_pcm_bytes = 0
+        self.dropped_pcm_bytes = 0
+        self.throttled = False
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put_audio(self, audio_b64: str, pcm_bytes: int) -> int:
+        """Queue one append; returns the PCM bytes dropped to stay under the cap."""
+        dropped = 0
+        if len(audio_b64) > self.max_bytes:
+            self.dropped_pcm_bytes += pcm_bytes
+            return pcm_bytes
+        while self.queued_bytes + len(audio_b64) > self.max_bytes:
+            dropped += self._drop_oldest_audio()
+        self._items.append((AUDIO, audio_b64, pcm_bytes))
+        self.queued_bytes += len(audio_b64)
+        self.queued_pcm_bytes += pcm_bytes
+        self._ready.set()
+        return dropped
+
+    def put_message(self, text: str):
+        """Queue a control message behind the audio already queued (never dropped)."""
+        self._items.append((MESSAGE, text, 0))
+        self._ready.set()
+
+    def clear(self):
+        self._items.clear()
+        self.queued_bytes = 0
+        self.queued_pcm_bytes = 0
+
+    def _drop_oldest_audio(self) -> int:
+        for i, (kind, payload, pcm_bytes) in enumerate(self._items):
+            if kind == AUDIO:
+                del self._items[i]
+                self.queued_bytes -= len(payload)
+                self.queued_pcm_bytes -= pcm_bytes
+                self.dropped_pcm_bytes += pcm_bytes
+                return pcm_bytes
+        return 0
+
+    async def get(self) -> Tuple[str, int]:
+        """Next upstream frame: (text, number of queued items merged into it)."""
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        kind, payload, pcm_bytes = self._items.popleft()
+        if kind == MESSAGE:
+            return payload, 1
+        parts: List[str] = [payload]
+        size = len(payload)
+        self.queued_bytes -= len(payload)
+        self.queued_pcm_bytes -= pcm_bytes
+        # base64 pieces concatenate cleanly only when the previous one carries no padding
+        while (self._items and self._items[0][0] == AUDIO and not parts[-1].endswith("=")
+               and size + len(self._items[0][1]) <= self.frame_bytes):
+            _, payload, pcm_bytes = self._items.popleft()
+            parts.append(payload)
+            size += len(payload)
+            self.queued_bytes -= len(payload)
+            self.queued_pcm_bytes -= pcm_bytes
+        # base64 is JSON-safe, so the frame is assembled directly instead of going through json.dumps
+        return '{"type":"input_audio_buffer.append","audio":"' + "".join(parts) + '"}', len(parts)
+
+    def watermark_crossed(self) -> Optional[bool]:
+        """New `throttled` state when a watermark was just crossed, else None."""
+        if not self.throttled and self.queued_bytes >= self.high_bytes:
+            self.throttled = True
+            return True
+        if self.throttled and self.queued_bytes <= self.low_bytes:
+            self.throttled = False
+            return False
+        return None
@@ -0,0 +1,135 @@
+
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from backend.services import red_flags, summary_service
+
+# In-memory consultation sessions for the live clinical check
+# Structure: {patient_id: ConsultationSession}
+_sessions: Dict[str, "ConsultationSession"] = {}
+
+
+def _max_chars() -> int:
+    return int(os.getenv("LIVE_CLINICAL_MAX_CHARS", "10000"))
+
+
+def prontuario_budget_tokens() -> int:
+    """Token budget of the prontuario context in clinical check prompts."""
+    return int(os.getenv("LIVE_CLINICAL_PRONTUARIO_TOKENS", str(_max_chars() // 4)))
+
+
+def _session_ttl_s() -> float:
+    return float(os.getenv("LIVE_SESSION_TTL_S", "7200"))
+
+
+class SequenceGapError(ValueError):
+    """Raised when a transcript delta skips ahead of the session cursor."""
+
+    def __init__(self, expected: int, received: int):
+        super().__init__(f"expected seq {expected}, received {received}")
+        self.expected = expected
+        self.received = received
+
+
+class ConsultationSession:
+    """Server-side state of one consultation: chart context built once, transcript fed by deltas."""
+
+    def __init__(self, patient_id: str, prontuario: str, max_chars: int):
+        self.patient_id = patient_id
+        self.max_chars = max_chars
+        # Already assembled to the prompt budget by the context builder
+        self.prontuario = prontuario
+        self.seq = 0
+        self.transcript_chars = 0
+        self.updated_at = time.monotonic()
+        # Tail window of transcript parts; only whole parts that fall out of the window are dropped
+        self._window: Deque[str] = deque()
+        self._window_chars = 0
+        # Local red-flag detection over the appended text; flags not yet escalated to an LLM check
+        self.red_flags = red_flags.RedFlagTracker() if red_flags.enabled() else None
+        self.new_red_flags: List[Dict[str, Any]] = []
+        # Last LLM check, served again while nothing new needs one
+        self.last_check: Optional[Any] = None
+
+    def set_prontuario(self, prontuario: str):
+        self.prontuario = prontuario
+
+    def append(self, seq: int, text: str) -> bool:
+        """Append the delta numbered `seq`. Returns False for an already applied (duplicate) delta."""
+        if seq < self.seq:
+            return False
+        if seq > self.seq:
+            raise SequenceGapError(expected=self.seq, received=seq)
+        self.seq += 1
+        self.updated_at = time.monotonic()
+        if not text:
+            return True
+        self._window.append(text)
+        self._window_chars += len(text)
+        if self.red_flags is not None:
+            # Deltas arrive whole, so a term at the very end is not waiting for more letters
+            self.new_red_flags.extend(self.red_flags.feed(text, partial=False))
+        self.transcript_chars += len(text)
+        while self._window and self._window_chars - len(self._window[0]) >= self.max_chars:
+            self._window_chars -= len(self._window.popleft())
+        return True
+
+    def red_flag_alerts(self) -> List[Dict[str, Any]]:
+        """Every red flag affirmed in the consultation so far, first occurrence each."""
+        return list(self.red_flags.alerts) if self.red_flags is not None else []
+
+    def transcript_window(self) -> str:
+        """Last `max_chars` characters of the transcript; cost is bounded by the window size."""
+        text = "".join(self._window)
+        if len(text) > self.max_chars:
+            text = text[-self.max_chars:]
+        return text
+
+
+def _evict_idle():
+    now = time.monotonic()
+    ttl = _session_ttl_s()
+    for patient_id in [pid for pid, s in _sessions.items() if now - s.updated_at > ttl]:
+        del _sessions[patient_id]
+
+
+def create_session(patient_id: str) -> Optional[ConsultationSession]:
+    """Build a session without registering it (e.g. owned by a single WebSocket)."""
+    prontuario = summary_service.prontuario_context(patient_id, prontuario_budget_tokens())
+    if prontuario is None:
+        return None
+    return ConsultationSession(patient_id, prontuario, _max_chars())
+
+
+def open_session(patient_id: str) -> Optional[ConsultationSession]:
+    """Start (or restart) a consultation session, loading the prontuario once."""
+    _evict_idle()
+    session = create_session(patient_id)
+    if session is None:
+        return None
+    _sessions[patient_id] = session
+    return session
+
+
+def get_session(patient_id: str) -> Optional[ConsultationSession]:
+    return _sessions.get(patient_id)
+
+
+def close_session(patient_id: str):
+    if patient_id in _sessions:
+        del _sessions[patient_id]
+
+
+def reload_prontuario(patient_id: str):
+    """Refresh the cached prontuario of an open session after the chart changes."""
+    session = _sessions.get(patient_id)
+    if session is None:
+        return
+    prontuario = summary_service.prontuario_context(patient_id, prontuario_budget_tokens())
+    if prontuario is not None:
+        session.set_prontuario(prontuario)
+
+
+# Sessions opened before the chart summary existed switch to it once it is ready
+summary_service.on_summary_ready(reload_prontuario)
@@ -0,0 +1,220 @@
+
+import hashlib
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from backend.services import prontuario_service
+from backend.services.tokens import chars_for_tokens, estimate_tokens
+
+# Sections always kept (matched against the accent-free, lowercased title)
+DEFAULT_PRIORITY_KEYWORDS = (
+    "alergi", "problema", "comorbidade", "medica", "diagnost", "hipotese", "antecedente", "identificacao",
+)
+OMITTED_MARKER = "[...]"
+
+_NUMBERED_HEADING = re.compile(r"^\d+(\.\d+)*\.?\s+\S")
+
+
+class Section:
+    __slots__ = ("title", "start", "end", "tokens", "priority")
+
+    def __init__(self, title: str, start: int, end: int, tokens: int, priority: bool):
+        self.title = title
+        self.start = start
+        self.end = end
+        self.tokens = tokens
+        self.priority = priority
+
+
+class SectionIndex:
+    """Markdown sections of one prontuario version, as offsets into its text."""
+
+    __slots__ = ("text", "sections", "built")
+
+    def __init__(self, text: str, sections: List[Section]):
+        self.text = text
+        self.sections = sections
+        # Assembled contexts of this version, per token budget
+        self.built: Dict[int, str] = {}
+
+    @property
+    def tokens(self) -> int:
+        return sum(s.tokens for s in self.sections)
+
+
+def _normalize(title: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", title.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def _priority_keywords() -> Tuple[str, ...]:
+    raw = os.getenv("CONTEXT_PRIORITY_SECTIONS")
+    if not raw:
+        return DEFAULT_PRIORITY_KEYWORDS
+    return tuple(_normalize(k.strip()) for k in raw.split(",") if k.strip())
+
+
+def _is_heading(line: str, prev_blank: bool) -> bool:
+    stripped = line.strip()
+    if not stripped:
+        return False
+    if stripped.startswith("#"):
+        return True
+    if len(stripped) > 80 or "\t" in stripped or "|" in stripped or stripped.endswith((".", ":", ";", ",")):
+        return False
+    if _NUMBERED_HEADING.match(stripped):
+        return True
+    # Plain-line titles ("Exame Físico"): short, capitalized, no "campo: valor" pairs, after a blank line
+    return prev_blank and ":" not in stripped and stripped[0].isupper() and len(stripped.split()) <= 8
+
+
+def parse_sections(text: str) -> SectionIndex:
+    """Split a prontuario into sections; the text before the first heading is the header section."""
+    return SectionIndex(text, _parse_from(text, 0, _priority_keywords()))
+
+
+def _parse_from(text: str, start: int, keywords: Tuple[str, ...]) -> List[Section]:
+    """Sections of text[start:], where `start` is the beginning of a section (or 0)."""
+    sections: List[Section] = []
+    title = ""
+    offset = start
+    prev_blank = True
+    for line in text[start:].splitlines(keepends=True):
+        is_heading = _is_heading(line, prev_blank) and not (offset == 0 and line.lstrip().startswith("# "))
+        if is_heading and offset > start:
+            sections.append(_make_section(text, title, start, offset, keywords))
+            start = offset
+        if is_heading:
+            title = line.strip().lstrip("#").strip()
+        prev_blank = not line.strip()
+        offset += len(line)
+    if offset > start or not sections:
+        sections.append(_make_section(text, title, start, offset, keywords))
+    return sections
+
+
+def extend_sections(index: SectionIndex, text: str) -> SectionIndex:
+    """Index of `text`, which extends `index.text` by an append: only the last section onwards is reparsed."""
+    last = index.sections[-1] if index.sections else None
+    if last is None or last.start == 0 or not text.startswith(index.text):
+        return parse_sections(text)
+    # Appended text either continues the last section or opens new ones after it
+    return SectionIndex(text, index.sections[:-1] + _parse_from(text, last.start, _priority_keywords()))
+
+
+def _make_section(text: str, title: str, start: int, end: int, keywords: Tuple[str, ...]) -> Section:
+    normalized = _normalize(title)
+    # The header (identification block before the first heading) is always a priority
+    priority = not title or any(k in normalized for k in keywords)
+    return Section(title, start, end, estimate_tokens(text[start:end]), priority)
+
+
+def build_context(index: SectionIndex, budget_tokens: int) -> str:
+    """Assemble sections within `budget_tokens`: priority sections first, then the most recent others.
+
+    Output keeps document order; skipped stretches are replaced by an omission marker.
+    """
+    if index.tokens <= budget_tokens:
+        return index.text
+    cached = index.built.get(budget_tokens)
+    if cached is not None:
+        return cached
+
+    chosen: Dict[int, Tuple[int, int]] = {}
+    remaining = budget_tokens
+
+    def take(i: int, tail: bool):
+        nonlocal remaining
+        s = index.sections[i]
+        if remaining <= 0:
+            return
+        if s.tokens <= remaining:
+            chosen[i] = (s.start, s.end)
+            remaining -= s.tokens
+            return
+        # Partially fits: keep the head of a priority section, the tail of a chronological one,
+        # cut at a line boundary when there is one
+        n = chars_for_tokens(remaining)
+        if tail:
+            cut = index.text.find("\n", s.end - n, s.end)
+            chosen[i] = (cut + 1 if cut != -1 else s.end - n, s.end)
+        else:
+            cut = index.text.rfind("\n", s.start, s.start + n)
+            chosen[i] = (s.start, cut + 1 if cut > s.start else s.start + n)
+        remaining = 0
+
+    for i, s in enumerate(index.sections):
+        if s.priority:
+            take(i, tail=False)
+    for i in range(len(index.sections) - 1, -1, -1):
+        if i not in chosen and not index.sections[i].priority:
+            take(i, tail=True)
+
+    parts: List[str] = []
+    last_end = 0
+    for i in sorted(chosen):
+        start, end = chosen[i]
+        if start > last_end:
+            parts.append(f"\n{OMITTED_MARKER}\n\n")
+        parts.append(index.text[start:end])
+        last_end = end
+    if last_end < len(index.text):
+        parts.append(f"\n{OMITTED_MARKER}\n")
+    context = "".join(parts)
+    index.built[budget_tokens] = context
+    return context
+
+
+# Section index per prontuario file version
+# Structure: {path: ((mtime_ns, size), SectionIndex)}
+_file_indexes: Dict[str, Tuple[Tuple[int, int], SectionIndex]] = {}
+
+# Indexes of prontuario texts posted by clients, keyed by content hash
+_text_indexes: "OrderedDict[str, SectionIndex]" = OrderedDict()
+_TEXT_INDEX_CAPACITY = 128
+
+
+def get_section_index(patient_id: str) -> Optional[SectionIndex]:
+    """Section index of a patient's Prontuario.md, reparsed only when the file changes."""
+    path = os.path.join(prontuario_service.DATA_DIR, patient_id, "Prontuario.md")
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    version = (st.st_mtime_ns, st.st_size)
+    cached = _file_indexes.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    text = prontuario_service.get_prontuario(patient_id)
+    if text is None:
+        return None
+    # Charts only grow through appends: reuse the sections before the append point
+    index = extend_sections(cached[1], text) if cached is not None and len(text) > len(cached[1].text) else parse_sections(text)
+    _file_indexes[path] = (version, index)
+    return index
+
+
+def text_section_index(text: str) -> SectionIndex:
+    key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    index = _text_indexes.get(key)
+    if index is None:
+        index = parse_sections(text)
+        _text_indexes[key] = index
+        while len(_text_indexes) > _TEXT_INDEX_CAPACITY:
+            _text_indexes.popitem(last=False)
+    else:
+        _text_indexes.move_to_end(key)
+    return index
+
+
+def build_prontuario_context(patient_id: str, budget_tokens: int) -> Optional[str]:
+    index = get_section_index(patient_id)
+    if index is None:
+        return None
+    return build_context(index, budget_tokens)
+
+
+def build_context_from_text(text: str, budget_tokens: int) -> str:
+    return build_context(text_section_index(text), budget_tokens)
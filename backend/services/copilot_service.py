@@ -1,27 +1,53 @@
+import contextlib
 import json
-import os
-import time
+import logging
 from fastapi import HTTPException
-from typing import Dict, Any
-from openai import OpenAI
-
-def analyze_text(text: str) -> Dict[str, Any]:
-    # MOCK IMPLEMENTATION
-    # In a real scenario, this would send text to OpenAI GPT-4
-    
-    # Simulate processing time
-    time.sleep(1)
-    
-    return {
-        "alerts": [
-            {"type": "warning", "message": "Paciente hipertenso - monitorar PA."},
-            {"type": "info", "message": "Vacinação contra gripe pendente."}
+from typing import Any, AsyncIterator, Dict, List
+from backend.services import llm_gateway
+
+logger = logging.getLogger(__name__)
+
+ANALYZE_SYSTEM_PROMPT = """
+Você é um assistente médico que prepara a consulta a partir do prontuário e das anotações em rascunho.
+Aponte alertas clínicos (riscos, interações, pendências, exames alterados) e sugestões de conduta
+para o médico revisar antes da consulta.
+
+Regras:
+- Use apenas informações presentes no texto.
+- NÃO invente dados clínicos.
+- Seja conciso: no máximo 5 alertas e 5 sugestões.
+- Responda em JSON estrito, sem texto fora do JSON, no formato:
+{"alerts": [{"type": "warning|info", "message": ""}], "suggestions": [{"text": ""}]}
+"""
+
+async def analyze_text(text: str, purpose: str = "analyze") -> Dict[str, Any]:
+    """Pre-visit analysis of a patient's text: {"alerts": [...], "suggestions": [...]}."""
+    if not llm_gateway.is_configured():
+        raise RuntimeError("OPENAI_API_KEY não definido")
+
+    raw = await llm_gateway.chat_completion(
+        messages=[
+            {"role": "system", "content": ANALYZE_SYSTEM_PROMPT},
+            {"role": "user", "content": text},
         ],
-        "suggestions": [
-            {"id": "sug_1", "text": "Solicitar hemograma completo."},
-            {"id": "sug_2", "text": "Prescrever AAS 100mg."}
-        ]
-    }
+        response_format={"type": "json_object"},
+        purpose=purpose,
+    )
+    try:
+        data = json.loads(raw)
+    except ValueError as e:
+        raise RuntimeError("Resposta inválida do modelo na análise") from e
+    if not isinstance(data, dict):
+        raise RuntimeError("Resposta inválida do modelo na análise")
+    alerts = [
+        {"type": a.get("type") if a.get("type") in ("warning", "info") else "info", "message": a.get("message", "")}
+        for a in data.get("alerts") or [] if isinstance(a, dict) and a.get("message")
+    ]
+    suggestions = [
+        {"id": f"sug_{i}", "text": sg.get("text", "") if isinstance(sg, dict) else str(sg)}
+        for i, sg in enumerate(data.get("suggestions") or [], start=1)
+    ]
+    return {"alerts": alerts, "suggestions": [sg for sg in suggestions if sg["text"]]}
 
 def build_user_message(question: str, context: str) -> str:
     prontuario_texto = context.strip() if context else "Nenhum prontuário disponível."
@@ -39,8 +65,7 @@ Pergunta do médico:
 Com base no prontuário e na pergunta acima, forneça apenas uma resposta textual, clara e objetiva.
 """
 
-def chat_response(question: str, context: str) -> str:
-    SYSTEM_PROMPT = """
+CHAT_SYSTEM_PROMPT = """
     Você é um assistente médico que analisa o prontuário e responde perguntas sobre o paciente.
     Seu papel é auxiliar o médico, explicando seu raciocínio clínico de forma clara, objetiva e segura.
     Responda sempre em texto normal, sem JSON, sem listas obrigatórias, sem estrutura fixa.
@@ -54,26 +79,28 @@ def chat_response(question: str, context: str) -> str:
     - Responda sempre como texto corrido.
     """
 
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+def _chat_messages(question: str, context: str) -> List[Dict[str, str]]:
+    if not llm_gateway.is_configured():
         raise RuntimeError("OPENAI_API_KEY não definido")
+    return [
+        {"role": "system", "content": CHAT_SYSTEM_PROMPT},
+        {"role": "user", "content": build_user_message(question, context)},
+    ]
 
-    client = OpenAI(api_key=api_key)
-
-    user_message = build_user_message(question, context)
+async def chat_response(question: str, context: str) -> str:
+    messages = _chat_messages(question, context)
 
     try:
-        completion = client.chat.completions.create(
-            model=os.getenv("OPENAI_CLINICAL_MODEL") or "gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_message},
-            ],
-        )
-
-        resposta = completion.choices[0].message.content
+        resposta = await llm_gateway.chat_completion(messages=messages, purpose="chat")
         return resposta
 
-    except Exception as e:
-        print("Erro no agente clínico:", e)
+    except Exception:
+        logger.exception("chat completion failed")
         raise HTTPException(status_code=500, detail="Erro na análise clínica")
+
+async def chat_response_stream(question: str, context: str) -> AsyncIterator[str]:
+    """Same answer as chat_response, yielded as the model produces it."""
+    messages = _chat_messages(question, context)
+    async with contextlib.aclosing(llm_gateway.stream_chat_completion(messages=messages, purpose="chat")) as deltas:
+        async for delta in deltas:
+            yield delta
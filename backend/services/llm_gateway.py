@@ -0,0 +1,251 @@
+"""Shared async gateway for every LLM call made by the backend.
+
+One client (and one pooled HTTP connection pool) lives for the whole app
+lifespan. Set ``LLM_BACKEND=stub`` to answer locally without network access,
+which is what load tests should use. Every call is admitted by
+``llm_scheduler`` according to its purpose's priority class.
+"""
+import asyncio
+import contextlib
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from backend.services import llm_scheduler, metrics
+
+DEFAULT_CHAT_MODEL = "gpt-4.1-mini"
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def default_chat_model() -> str:
+    return os.getenv("OPENAI_CLINICAL_MODEL") or DEFAULT_CHAT_MODEL
+
+
+class OpenAIBackend:
+    """Async OpenAI client with keep-alive pooling, timeouts and retries."""
+
+    name = "openai"
+
+    def __init__(self, api_key: str):
+        timeout = httpx.Timeout(
+            _env_float("LLM_TIMEOUT_S", 60.0),
+            connect=_env_float("LLM_CONNECT_TIMEOUT_S", 5.0),
+        )
+        limits = httpx.Limits(
+            max_connections=_env_int("LLM_MAX_CONNECTIONS", 100),
+            max_keepalive_connections=_env_int("LLM_MAX_KEEPALIVE", 20),
+            keepalive_expiry=_env_float("LLM_KEEPALIVE_EXPIRY_S", 30.0),
+        )
+        self._http = httpx.AsyncClient(timeout=timeout, limits=limits)
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            timeout=timeout,
+            max_retries=_env_int("LLM_MAX_RETRIES", 2),
+            http_client=self._http,
+        )
+
+    async def chat_completion(
+        self,
+        *,
+        model: str,
+        messages: List[Dict[str, str]],
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        kwargs: Dict[str, Any] = {}
+        if response_format:
+            kwargs["response_format"] = response_format
+        completion = await self.client.chat.completions.create(model=model, messages=messages, **kwargs)
+        return completion.choices[0].message.content or ""
+
+    async def stream_chat_completion(self, *, model: str, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(model=model, messages=messages, stream=True)
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+
+    async def transcribe(self, *, file: Any, model: str, response_format: str) -> Any:
+        return await self.client.audio.transcriptions.create(
+            file=file,
+            model=model,
+            response_format=response_format,
+        )
+
+    async def aclose(self):
+        await self.client.close()
+
+
+class StubBackend:
+    """Local stand-in that answers after an artificial delay (LLM_STUB_LATENCY_MS)."""
+
+    name = "stub"
+
+    def __init__(self):
+        self.latency_s = _env_float("LLM_STUB_LATENCY_MS", 200.0) / 1000.0
+
+    async def chat_completion(
+        self,
+        *,
+        model: str,
+        messages: List[Dict[str, str]],
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        await asyncio.sleep(self.latency_s)
+        if response_format and response_format.get("type") == "json_object":
+            return json.dumps({
+                "critical_alerts": [],
+                "missing_questions": ["Resposta simulada (stub): perguntar sobre alergias."],
+                "recommended_conducts": ["Resposta simulada (stub): reavaliar sinais vitais."],
+                "alerts": [{"type": "info", "message": "Resposta simulada (stub): revisar medicações em uso."}],
+                "suggestions": [{"text": "Resposta simulada (stub): solicitar hemograma completo."}],
+            })
+        return "Resposta simulada (stub) do copiloto."
+
+    async def stream_chat_completion(self, *, model: str, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        # First token after the configured latency, then a steady trickle
+        await asyncio.sleep(self.latency_s)
+        for i, word in enumerate("Resposta simulada (stub) do copiloto.".split(" ")):
+            if i:
+                await asyncio.sleep(self.latency_s / 10)
+            yield word if not i else " " + word
+
+    async def transcribe(self, *, file: Any, model: str, response_format: str) -> Any:
+        await asyncio.sleep(self.latency_s)
+        return {
+            "text": "Transcrição simulada (stub).",
+            "segments": [
+                {"id": "seg_0", "start": 0.0, "end": 1.0, "speaker": "SPEAKER_0",
+                 "text": "Transcrição simulada (stub).", "type": "transcript.text.segment"},
+            ],
+        }
+
+    async def aclose(self):
+        pass
+
+
+_backend = None
+
+
+def _create_backend():
+    kind = (os.getenv("LLM_BACKEND") or "openai").lower()
+    if kind == "stub":
+        return StubBackend()
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY não definido")
+    return OpenAIBackend(api_key)
+
+
+def is_configured() -> bool:
+    """Whether an LLM backend can be built with the current environment."""
+    if _backend is not None:
+        return True
+    return (os.getenv("LLM_BACKEND") or "openai").lower() == "stub" or bool(os.getenv("OPENAI_API_KEY"))
+
+
+def get_backend():
+    """Return the shared backend, creating it lazily on first use."""
+    global _backend
+    if _backend is None:
+        _backend = _create_backend()
+    return _backend
+
+
+async def startup():
+    """Build the shared client at app startup (no-op without credentials)."""
+    if is_configured():
+        get_backend()
+
+
+async def shutdown():
+    """Close pooled connections at app shutdown."""
+    global _backend
+    if _backend is not None:
+        backend, _backend = _backend, None
+        await backend.aclose()
+
+
+class _track:
+    """Records latency, errors and in-flight count of one upstream call under `llm.*.<purpose>`."""
+
+    __slots__ = ("purpose", "start")
+
+    def __init__(self, purpose: str):
+        self.purpose = purpose
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        metrics.registry.add_gauge("llm.inflight", 1)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        metrics.registry.add_gauge("llm.inflight", -1)
+        metrics.registry.observe(f"llm.latency_s.{self.purpose}", time.perf_counter() - self.start)
+        if exc_type is not None and not issubclass(exc_type, asyncio.CancelledError):
+            metrics.registry.inc(f"llm.errors.{self.purpose}")
+        return False
+
+
+async def chat_completion(
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    response_format: Optional[Dict[str, Any]] = None,
+    purpose: str = "chat",
+) -> str:
+    """Run a chat completion and return the assistant message text."""
+    backend = get_backend()
+    async with await llm_scheduler.slot(purpose):
+        with _track(purpose):
+            return await backend.chat_completion(
+                model=model or default_chat_model(),
+                messages=messages,
+                response_format=response_format,
+            )
+
+
+async def stream_chat_completion(
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    purpose: str = "chat",
+) -> AsyncIterator[str]:
+    """Stream a chat completion as text deltas; time to first token goes to `llm.ttft_s.<purpose>`."""
+    backend = get_backend()
+    async with await llm_scheduler.slot(purpose) as admitted:
+        with _track(purpose) as tracked:
+            first = True
+            # Generators are only finalized by GC unless closed: close the upstream stream with this one
+            upstream = backend.stream_chat_completion(model=model or default_chat_model(), messages=messages)
+            async with contextlib.aclosing(upstream):
+                async for delta in upstream:
+                    if first:
+                        metrics.registry.observe(f"llm.ttft_s.{purpose}", time.perf_counter() - tracked.start)
+                        admitted.first_token()
+                        first = False
+                    yield delta
+
+
+async def transcribe(file: Any, model: str, response_format: str, purpose: str = "transcription") -> Any:
+    """Run an audio transcription through the shared backend."""
+    backend = get_backend()
+    async with await llm_scheduler.slot(purpose):
+        with _track(purpose):
+            return await backend.transcribe(file=file, model=model, response_format=response_format)
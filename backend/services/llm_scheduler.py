@@ -0,0 +1,303 @@
+"""Admission control in front of every upstream LLM call.
+
+Calls are admitted by priority class, highest first:
+
+    safety         live clinical checks (red flags during the consultation)
+    transcription  legacy chunk transcription
+    chat           copilot chat and single-patient analysis
+    batch          agenda-wide analysis and chart summaries
+
+Each class has an optional token bucket (LLM_RPM_<CLASS> requests per
+minute; 0 = no per-class cap), and all classes share one concurrency limit
+that adapts like TCP congestion control: +1 after a window of successful
+calls while the limit is in use, halved on an upstream 429, cut by 10% when
+the median of a class's recent calls stays well above its slow-moving
+baseline (a sustained rise, not one long answer). Growth pauses for
+LLM_INCREASE_HOLD_S after a cut, so the limit settles below the point where
+the upstream pushes back. The last LLM_SAFETY_RESERVE slots are kept for
+safety checks, so they never queue behind a full house of chat answers.
+
+Queue wait per class goes to `llm.queue_wait_s.<class>`.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import statistics
+import time
+from collections import deque
+from typing import List, Optional, Tuple
+
+from backend.services import metrics
+
+CLASSES = ("safety", "transcription", "chat", "batch")
+
+PURPOSE_CLASSES = {
+    "clinical_check": "safety",
+    "transcription": "transcription",
+    "chat": "chat",
+    "analyze": "chat",
+    "summary": "batch",
+    "batch": "batch",
+}
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def class_for(purpose: str) -> str:
+    return PURPOSE_CLASSES.get(purpose, "chat")
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    """Upstream 429, from the OpenAI SDK or a bare httpx response."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status == 429
+
+
+class TokenBucket:
+    """`rate_per_s` tokens per second, holding at most `burst`; rate 0 means unlimited."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate_per_s: float, burst: float):
+        self.rate = rate_per_s
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self, now: float) -> bool:
+        if not self.rate:
+            return True
+        self._refill(now)
+        return self.tokens >= 1.0
+
+    def take(self, now: float):
+        if self.rate:
+            self._refill(now)
+            self.tokens -= 1.0
+
+    def wait_s(self, now: float) -> float:
+        """Seconds until a token is available."""
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        return max(0.0, (1.0 - self.tokens) / self.rate)
+
+
+class LatencyTracker:
+    """Median of the last `window` latencies of one class, against a slow EWMA of that median.
+
+    A single slow call barely moves the median, and the baseline follows lasting changes
+    (e.g. a slower model) instead of staying pinned to the fastest call ever seen.
+    """
+
+    __slots__ = ("window", "alpha", "samples", "baseline")
+
+    def __init__(self, window: int = 20, alpha: float = 0.02):
+        self.window = window
+        self.alpha = alpha
+        self.samples: deque = deque(maxlen=window)
+        self.baseline: Optional[float] = None
+
+    def observe(self, latency_s: float, tolerance: float) -> bool:
+        """Record one call; True when the recent median is above `tolerance` x baseline."""
+        self.samples.append(latency_s)
+        if len(self.samples) < self.window:
+            return False
+        recent = statistics.median(self.samples)
+        if self.baseline is None:
+            self.baseline = recent
+            return False
+        risen = recent > tolerance * self.baseline
+        self.baseline += self.alpha * (recent - self.baseline)
+        return risen
+
+    def reset_window(self):
+        # After a cut, the next decision needs a full window of calls made under the new limit
+        self.samples.clear()
+
+
+class Slot:
+    """One admitted call; reports its outcome to the limiter when the block exits."""
+
+    __slots__ = ("scheduler", "cls", "granted_at", "first_token_s")
+
+    def __init__(self, scheduler: Optional["LLMScheduler"], cls: str):
+        self.scheduler = scheduler
+        self.cls = cls
+        self.granted_at = time.perf_counter()
+        self.first_token_s: Optional[float] = None
+
+    def first_token(self):
+        """Streaming calls: judge latency on time to first token, not on the whole answer."""
+        if self.first_token_s is None:
+            self.first_token_s = time.perf_counter() - self.granted_at
+
+    async def __aenter__(self) -> "Slot":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.scheduler is not None:
+            latency = self.first_token_s if self.first_token_s is not None else time.perf_counter() - self.granted_at
+            self.scheduler.release(self, exc, latency)
+        return False
+
+
+class LLMScheduler:
+    def __init__(self):
+        self.min_limit = max(1, int(_env_float("LLM_CONCURRENCY_MIN", 2)))
+        self.max_limit = max(self.min_limit, int(_env_float("LLM_CONCURRENCY_MAX", 64)))
+        self.limit = float(min(self.max_limit, max(self.min_limit, _env_float("LLM_CONCURRENCY_INITIAL", 16))))
+        self.safety_reserve = int(_env_float("LLM_SAFETY_RESERVE", 1))
+        self.latency_tolerance = _env_float("LLM_LATENCY_TOLERANCE", 2.5)
+        self.increase_hold_s = _env_float("LLM_INCREASE_HOLD_S", 5.0)
+        self.buckets = {
+            cls: TokenBucket(_env_float(f"LLM_RPM_{cls.upper()}", 120 if cls == "batch" else 0) / 60.0,
+                             _env_float(f"LLM_BURST_{cls.upper()}", 10))
+            for cls in CLASSES
+        }
+        self.inflight = 0
+        # Structure: [(priority, seq, class, enqueued_at, future)]
+        self._waiting: List[Tuple[int, int, str, float, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._last_decrease = 0.0
+        self._latency = {cls: LatencyTracker() for cls in CLASSES}
+        metrics.registry.set_gauge("llm.concurrency_limit", self.limit)
+
+    def _capacity(self, cls: str) -> int:
+        limit = int(self.limit)
+        return limit if cls == "safety" else max(1, limit - self.safety_reserve)
+
+    def queue_depth(self, cls: Optional[str] = None) -> int:
+        return sum(1 for w in self._waiting if cls is None or w[2] == cls)
+
+    async def acquire(self, purpose: str) -> Slot:
+        cls = class_for(purpose)
+        now = time.monotonic()
+        bucket = self.buckets[cls]
+        if not self._waiting and self.inflight < self._capacity(cls) and bucket.available(now):
+            bucket.take(now)
+            self.inflight += 1
+            metrics.registry.observe(f"llm.queue_wait_s.{cls}", 0.0)
+            return Slot(self, cls)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (CLASSES.index(cls), next(self._seq), cls, now, future))
+        metrics.registry.add_gauge(f"llm.queue_depth.{cls}", 1)
+        # Waiters ahead may only be short of tokens, in which case this call can go right away
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as the caller gave up: hand the slot back
+                self.inflight -= 1
+                self._dispatch()
+            else:
+                self._waiting = [w for w in self._waiting if w[4] is not future]
+                heapq.heapify(self._waiting)
+                metrics.registry.add_gauge(f"llm.queue_depth.{cls}", -1)
+            raise
+        return Slot(self, cls)
+
+    def _dispatch(self):
+        """Grant slots to waiters in priority order; a class out of tokens does not block the others."""
+        now = time.monotonic()
+        skipped = []
+        next_token_s = None
+        while self._waiting:
+            priority, seq, cls, enqueued_at, future = heapq.heappop(self._waiting)
+            if future.done():
+                continue
+            if self.inflight >= self._capacity(cls):
+                skipped.append((priority, seq, cls, enqueued_at, future))
+                # Lower classes have no more room than this one
+                if cls != "safety":
+                    break
+                continue
+            bucket = self.buckets[cls]
+            if not bucket.available(now):
+                skipped.append((priority, seq, cls, enqueued_at, future))
+                wait = bucket.wait_s(now)
+                next_token_s = wait if next_token_s is None else min(next_token_s, wait)
+                continue
+            bucket.take(now)
+            self.inflight += 1
+            metrics.registry.add_gauge(f"llm.queue_depth.{cls}", -1)
+            metrics.registry.observe(f"llm.queue_wait_s.{cls}", now - enqueued_at)
+            future.set_result(None)
+        for item in skipped:
+            heapq.heappush(self._waiting, item)
+        if next_token_s is not None:
+            loop = asyncio.get_running_loop()
+            due = loop.time() + next_token_s
+            # A bucket refilling sooner than the pending wake-up moves it earlier
+            if self._timer is None or due < self._timer.when():
+                if self._timer is not None:
+                    self._timer.cancel()
+                self._timer = loop.call_at(due, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def release(self, slot: Slot, exc: Optional[BaseException], latency_s: float):
+        saturated = self.inflight >= int(self.limit) - self.safety_reserve
+        self.inflight -= 1
+        if exc is not None and is_rate_limited(exc):
+            metrics.registry.inc(f"llm.rate_limited.{slot.cls}")
+            self._decrease(0.5)
+        elif exc is None:
+            tracker = self._latency[slot.cls]
+            if tracker.observe(latency_s, self.latency_tolerance):
+                if self._decrease(0.9):
+                    tracker.reset_window()
+            elif saturated and time.monotonic() - self._last_decrease >= self.increase_hold_s:
+                # Additive increase: about +1 per `limit` successful calls
+                self._set_limit(self.limit + 1.0 / self.limit)
+        self._dispatch()
+
+    def _decrease(self, factor: float) -> bool:
+        now = time.monotonic()
+        # One cut per second: a burst of 429s from the same overload counts once
+        if now - self._last_decrease < 1.0:
+            return False
+        self._last_decrease = now
+        self._set_limit(self.limit * factor)
+        return True
+
+    def _set_limit(self, value: float):
+        self.limit = min(float(self.max_limit), max(float(self.min_limit), value))
+        metrics.registry.set_gauge("llm.concurrency_limit", self.limit)
+
+
+_scheduler: Optional[LLMScheduler] = None
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler()
+    return _scheduler
+
+
+def enabled() -> bool:
+    return os.getenv("LLM_SCHEDULER", "1") == "1"
+
+
+async def slot(purpose: str) -> Slot:
+    """Wait for admission of one call of `purpose`; use the result as `async with`."""
+    if not enabled():
+        return Slot(None, class_for(purpose))
+    return await get_scheduler().acquire(purpose)
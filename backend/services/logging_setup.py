@@ -0,0 +1,62 @@
+
+import json
+import logging
+import os
+import time
+
+# Attributes every LogRecord has; anything else was passed through `extra=` and is emitted as a field
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg plus any `extra=` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Human-readable `time level logger msg key=value ...` lines."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = " ".join(
+            f"{k}={v}" for k, v in record.__dict__.items()
+            if k not in _RESERVED and not k.startswith("_")
+        )
+        line = f"{time.strftime('%H:%M:%S', time.localtime(record.created))} {record.levelname:<7} {record.name} {record.getMessage()}"
+        if fields:
+            line += " " + fields
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def configure_logging():
+    """Configure the `backend` loggers from LOG_LEVEL / LOG_FORMAT; wire tracing stays off unless REALTIME_TRACE=1."""
+    level = (os.getenv("LOG_LEVEL") or "INFO").upper()
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if (os.getenv("LOG_FORMAT") or "text") == "json" else KeyValueFormatter())
+
+    logger = logging.getLogger("backend")
+    logger.handlers[:] = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
+
+    # Frame-level tracing of the upstream realtime socket is very chatty
+    ws_logger = logging.getLogger("websockets")
+    if os.getenv("REALTIME_TRACE") == "1":
+        ws_logger.handlers[:] = [handler]
+        ws_logger.setLevel(logging.DEBUG)
+    else:
+        ws_logger.setLevel(logging.WARNING)
@@ -0,0 +1,142 @@
+"""In-process counters, gauges and fixed-bucket histograms.
+
+`registry` aggregates the whole process; each realtime session also keeps its
+own `SessionMetrics` while it is active. Both are served as JSON by /metrics.
+"""
+import bisect
+import itertools
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence
+
+# Upper bounds; the last implicit bucket is +Inf
+LATENCY_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is O(log buckets) and allocation free."""
+
+    __slots__ = ("bounds", "counts", "count", "sum", "min", "max")
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS_S):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (max for the +Inf bucket)."""
+        if not self.count:
+            return None
+        target = q * self.count
+        running = 0
+        for i, c in enumerate(self.counts):
+            running += c
+            if running >= target and c:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {("+Inf" if i == len(self.bounds) else str(b)): c
+                        for i, (b, c) in enumerate(zip(self.bounds + (None,), self.counts))},
+        }
+
+
+class MetricsRegistry:
+    """Named counters, gauges and histograms."""
+
+    def __init__(self):
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        self.gauges[name] = value
+
+    def add_gauge(self, name: str, delta: float):
+        self.gauges[name] = self.gauges.get(name, 0) + delta
+
+    def observe(self, name: str, value: float, bounds: Sequence[float] = LATENCY_BUCKETS_S):
+        hist = self.histograms.get(name)
+        if hist is None:
+            with self._lock:
+                hist = self.histograms.setdefault(name, Histogram(bounds))
+        hist.observe(value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "histograms": {name: h.snapshot() for name, h in list(self.histograms.items())},
+        }
+
+
+# Process-wide aggregate
+registry = MetricsRegistry()
+
+_session_ids = itertools.count(1)
+_sessions: Dict[str, "SessionMetrics"] = {}
+
+
+class SessionMetrics(MetricsRegistry):
+    """Per-session registry; every observation is mirrored into the aggregate registry."""
+
+    def __init__(self, kind: str, labels: Optional[Dict[str, Any]] = None):
+        super().__init__()
+        self.id = f"{kind}-{next(_session_ids)}"
+        self.kind = kind
+        self.labels = dict(labels or {})
+        self.started_at = time.time()
+        _sessions[self.id] = self
+        registry.add_gauge(f"{kind}.active_sessions", 1)
+
+    def inc(self, name: str, value: float = 1):
+        super().inc(name, value)
+        registry.inc(name, value)
+
+    def observe(self, name: str, value: float, bounds: Sequence[float] = LATENCY_BUCKETS_S):
+        super().observe(name, value, bounds)
+        registry.observe(name, value, bounds)
+
+    def close(self):
+        if _sessions.pop(self.id, None) is not None:
+            registry.add_gauge(f"{self.kind}.active_sessions", -1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        snap = super().snapshot()
+        snap.update({"kind": self.kind, "labels": self.labels, "started_at": self.started_at})
+        return snap
+
+
+def snapshot() -> Dict[str, Any]:
+    """Aggregate metrics plus one entry per active session."""
+    return {
+        "aggregate": registry.snapshot(),
+        "sessions": {sid: s.snapshot() for sid, s in list(_sessions.items())},
+    }
@@ -1,89 +1,526 @@
-
+import bisect
+import codecs
+import contextlib
+import hashlib
+import mmap
 import os
-from typing import List, Optional, Dict, Any
+import stat
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any, Iterator, Tuple
 from backend.models.patient import Patient
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "patients")
 
-def list_patients() -> List[Patient]:
-    """List all patients from the data directory."""
-    patients = []
-    if not os.path.exists(DATA_DIR):
-        return []
-    
-    for folder_name in os.listdir(DATA_DIR):
-        folder_path = os.path.join(DATA_DIR, folder_name)
-        if os.path.isdir(folder_path):
-            prontuario_path = os.path.join(folder_path, "Prontuario.md")
-            name = "Unknown"
-            if os.path.exists(prontuario_path):
-                with open(prontuario_path, "r", encoding="utf-8") as f:
-                    first_line = f.readline().strip()
-                    if first_line.startswith("# Prontuário - "):
-                        name_part = first_line.replace("# Prontuário - ", "")
-                        name = name_part.split("(")[0].strip()
-            
-            patients.append(Patient(id=folder_name, name=name, age=0, gender="Unknown"))
-            
-    return patients
 
-def get_patient_file_tree(patient_id: str) -> Optional[Dict[str, Any]]:
-    """Get the file tree structure for a patient."""
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _read_patient_name(prontuario_path: str) -> str:
+    name = "Unknown"
+    if os.path.exists(prontuario_path):
+        with open(prontuario_path, "r", encoding="utf-8") as f:
+            first_line = f.readline().strip()
+            if first_line.startswith("# Prontuário - "):
+                name_part = first_line.replace("# Prontuário - ", "")
+                name = name_part.split("(")[0].strip()
+    return name
+
+
+class _PatientEntry:
+    __slots__ = ("patient", "id_key", "name_key", "mtime_ns")
+
+    def __init__(self, patient: Patient, mtime_ns: int):
+        self.patient = patient
+        self.id_key = patient.id.lower()
+        self.name_key = _search_key(patient.name)
+        self.mtime_ns = mtime_ns
+
+
+def _search_key(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def _replace_sorted(items: list, old: Any, new: Any, key=None) -> list:
+    """Copy of the sorted `items` with `old` removed and `new` inserted in order (either may be None)."""
+    key = key or (lambda item: item)
+    items = list(items)
+    if old is not None:
+        i = bisect.bisect_left(items, key(old), key=key)
+        if i < len(items) and key(items[i]) == key(old):
+            del items[i]
+    if new is not None:
+        bisect.insort(items, new, key=key)
+    return items
+
+
+class PatientIndex:
+    """In-memory patient list, refreshed when DATA_DIR (or a chart) changes instead of on every request."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _PatientEntry] = {}
+        self._ordered: List[_PatientEntry] = []
+        self._ids: List[Tuple[str, str]] = []
+        self._names: List[Tuple[str, str]] = []
+        self._dir_mtime_ns: Optional[int] = None
+        self._checked_at = 0.0
+        self._rechecked_at = 0.0
+
+    def _load_entry(self, patient_id: str) -> Optional[_PatientEntry]:
+        folder_path = os.path.join(DATA_DIR, patient_id)
+        if not os.path.isdir(folder_path):
+            return None
+        prontuario_path = os.path.join(folder_path, "Prontuario.md")
+        try:
+            mtime_ns = os.stat(prontuario_path).st_mtime_ns
+        except OSError:
+            mtime_ns = 0
+        name = _read_patient_name(prontuario_path)
+        return _PatientEntry(Patient(id=patient_id, name=name, age=0, gender="Unknown"), mtime_ns)
+
+    def _reorder(self):
+        self._ordered = sorted(self._entries.values(), key=lambda e: e.patient.id)
+        self._ids = sorted((e.id_key, e.patient.id) for e in self._ordered)
+        self._names = sorted((e.name_key, e.patient.id) for e in self._ordered)
+
+    def rebuild(self):
+        """Full scan of DATA_DIR (startup)."""
+        with self._lock:
+            self._entries = {}
+            self._dir_mtime_ns = None
+            if os.path.exists(DATA_DIR):
+                self._dir_mtime_ns = os.stat(DATA_DIR).st_mtime_ns
+                for folder_name in os.listdir(DATA_DIR):
+                    entry = self._load_entry(folder_name)
+                    if entry is not None:
+                        self._entries[folder_name] = entry
+            self._reorder()
+            self._checked_at = self._rechecked_at = time.monotonic()
+
+    def refresh(self):
+        """Cheap freshness check: one stat of DATA_DIR, throttled; charts are re-stat'ed less often."""
+        now = time.monotonic()
+        if now - self._checked_at < _env_float("PATIENT_INDEX_CHECK_S", 1.0):
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                dir_mtime_ns = os.stat(DATA_DIR).st_mtime_ns
+            except OSError:
+                dir_mtime_ns = None
+            changed = False
+            if dir_mtime_ns != self._dir_mtime_ns:
+                # Patient folders were added or removed: only diff the listing
+                self._dir_mtime_ns = dir_mtime_ns
+                present = set(os.listdir(DATA_DIR)) if dir_mtime_ns is not None else set()
+                for patient_id in list(self._entries):
+                    if patient_id not in present:
+                        del self._entries[patient_id]
+                        changed = True
+                for patient_id in present - self._entries.keys():
+                    entry = self._load_entry(patient_id)
+                    if entry is not None:
+                        self._entries[patient_id] = entry
+                        changed = True
+            if now - self._rechecked_at >= _env_float("PATIENT_INDEX_RECHECK_S", 60.0):
+                # Catch charts edited outside the API (first line may carry a new name)
+                self._rechecked_at = now
+                for patient_id, entry in list(self._entries.items()):
+                    try:
+                        mtime_ns = os.stat(os.path.join(DATA_DIR, patient_id, "Prontuario.md")).st_mtime_ns
+                    except OSError:
+                        mtime_ns = 0
+                    if mtime_ns != entry.mtime_ns:
+                        fresh = self._load_entry(patient_id)
+                        if fresh is None:
+                            del self._entries[patient_id]
+                        else:
+                            self._entries[patient_id] = fresh
+                        changed = True
+            if changed:
+                self._reorder()
+
+    def invalidate(self, patient_id: str):
+        """Reload one patient after its chart changed through the API."""
+        with self._lock:
+            entry = self._load_entry(patient_id)
+            old = self._entries.pop(patient_id, None)
+            if entry is not None:
+                self._entries[patient_id] = entry
+            # Readers use the lists without the lock: patch copies (one entry moves, nothing is re-sorted)
+            # and swap them in
+            self._ordered = _replace_sorted(self._ordered, old, entry, lambda e: e.patient.id)
+            self._ids = _replace_sorted(self._ids, old and (old.id_key, patient_id),
+                                        entry and (entry.id_key, patient_id))
+            self._names = _replace_sorted(self._names, old and (old.name_key, patient_id),
+                                          entry and (entry.name_key, patient_id))
+
+    def search(self, q: Optional[str] = None, prefix: Optional[str] = None) -> List[_PatientEntry]:
+        self.refresh()
+        ordered = self._ordered
+        if prefix:
+            key = _search_key(prefix)
+            ids = self._ids
+            names = self._names
+            found = set()
+            i = bisect.bisect_left(ids, (key, ""))
+            while i < len(ids) and ids[i][0].startswith(key):
+                found.add(ids[i][1])
+                i += 1
+            j = bisect.bisect_left(names, (key, ""))
+            while j < len(names) and names[j][0].startswith(key):
+                found.add(names[j][1])
+                j += 1
+            ordered = [e for e in ordered if e.patient.id in found] if len(found) < len(ordered) else ordered
+        if q:
+            key = _search_key(q)
+            ordered = [e for e in ordered if key in e.id_key or key in e.name_key]
+        return ordered
+
+
+_patient_index = PatientIndex()
+
+
+def build_patient_index():
+    """Build the patient index (called at app startup)."""
+    _patient_index.rebuild()
+
+
+def page_patients(offset: int = 0, limit: Optional[int] = None,
+                  q: Optional[str] = None, prefix: Optional[str] = None) -> Tuple[List[Patient], int]:
+    """One page of matching patients and the total number of matches, from a single search."""
+    entries = _patient_index.search(q, prefix)
+    end = None if limit is None else offset + limit
+    return [e.patient for e in entries[offset:end]], len(entries)
+
+
+# File tree per patient, revalidated by the mtimes of its directories only
+# Structure: {patient_id: (((dir_path, mtime_ns), ...), tree, etag)}
+_tree_cache: Dict[str, Tuple[Tuple[Tuple[str, int], ...], Dict[str, Any], str]] = {}
+
+# Decoded content of small files, revalidated by (mtime_ns, size)
+# Structure: {full_path: ((mtime_ns, size), content)}
+_content_cache: "OrderedDict[str, Tuple[Tuple[int, int], str]]" = OrderedDict()
+_content_cache_bytes = 0
+_content_lock = threading.Lock()
+
+STREAM_CHUNK_BYTES = 256 * 1024
+
+
+def _file_cache_limits() -> Tuple[int, int]:
+    total = int(_env_float("FILE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+    per_file = int(_env_float("FILE_CACHE_MAX_FILE_BYTES", 1024 * 1024))
+    return total, per_file
+
+
+def stream_threshold_bytes() -> int:
+    """Files above this size are streamed instead of being decoded in one piece."""
+    return int(_env_float("FILE_STREAM_THRESHOLD_BYTES", 1024 * 1024))
+
+
+def file_etag(st: os.stat_result) -> str:
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def _tree_is_fresh(dir_mtimes: Tuple[Tuple[str, int], ...]) -> bool:
+    for path, mtime_ns in dir_mtimes:
+        try:
+            if os.stat(path).st_mtime_ns != mtime_ns:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def _build_file_tree(patient_dir: str, patient_id: str) -> Tuple[Dict[str, Any], Tuple[Tuple[str, int], ...]]:
+    dir_mtimes: List[Tuple[str, int]] = []
+
+    def build_tree(path: str, name: str) -> Dict[str, Any]:
+        """Recursively build file tree."""
+        children = []
+        try:
+            dir_mtimes.append((path, os.stat(path).st_mtime_ns))
+            # scandir reports the entry type without an extra stat per file
+            with os.scandir(path) as it:
+                for entry in it:
+                    # Hidden sidecars (append lock, version journal) are not patient documents
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_file():
+                        children.append({
+                            "name": entry.name,
+                            "type": "file",
+                            "path": os.path.relpath(entry.path, patient_dir).replace("\\", "/")
+                        })
+                    else:
+                        children.append(build_tree(entry.path, entry.name))
+        except PermissionError:
+            pass
+
+        return {
+            "name": name,
+            "type": "folder",
+            "path": os.path.relpath(path, patient_dir).replace("\\", "/"),
+            "children": children
+        }
+
+    tree = build_tree(patient_dir, patient_id)
+    return tree, tuple(dir_mtimes)
+
+
+def get_patient_file_tree_with_etag(patient_id: str) -> Optional[Tuple[Dict[str, Any], str]]:
+    """File tree of a patient plus its ETag, rebuilt only when one of its directories changed."""
     patient_dir = os.path.join(DATA_DIR, patient_id)
+    cached = _tree_cache.get(patient_id)
+    if cached is not None and _tree_is_fresh(cached[0]):
+        return cached[1], cached[2]
     if not os.path.exists(patient_dir):
+        _tree_cache.pop(patient_id, None)
         return None
-    
-    def build_tree(path: str, name: str) -> Dict[str, Any]:
-        """Recursively build file tree."""
-        if os.path.isfile(path):
-            return {
-                "name": name,
-                "type": "file",
-                "path": os.path.relpath(path, patient_dir).replace("\\", "/")
-            }
-        else:
-            children = []
-            try:
-                for item in os.listdir(path):
-                    item_path = os.path.join(path, item)
-                    children.append(build_tree(item_path, item))
-            except PermissionError:
-                pass
-            
-            return {
-                "name": name,
-                "type": "folder",
-                "path": os.path.relpath(path, patient_dir).replace("\\", "/"),
-                "children": children
-            }
-    
-    return build_tree(patient_dir, patient_id)
+    tree, dir_mtimes = _build_file_tree(patient_dir, patient_id)
+    digest = hashlib.sha1(repr(dir_mtimes).encode("utf-8")).hexdigest()[:16]
+    etag = f'"{digest}"'
+    _tree_cache[patient_id] = (dir_mtimes, tree, etag)
+    return tree, etag
 
-def get_file_content(patient_id: str, file_path: str) -> Optional[str]:
-    """Get content of a specific file within a patient's directory."""
+
+def get_patient_file_tree(patient_id: str) -> Optional[Dict[str, Any]]:
+    """Get the file tree structure for a patient."""
+    result = get_patient_file_tree_with_etag(patient_id)
+    return result[0] if result is not None else None
+
+
+def resolve_patient_file(patient_id: str, file_path: str) -> Optional[str]:
+    """Absolute path of a file inside the patient's directory, or None if it escapes it."""
     full_path = os.path.join(DATA_DIR, patient_id, file_path)
-    
+
     # Security check: ensure the path is within the patient directory
     if not os.path.abspath(full_path).startswith(os.path.abspath(os.path.join(DATA_DIR, patient_id))):
         return None
-    
-    if os.path.exists(full_path) and os.path.isfile(full_path):
+    return full_path
+
+
+def stat_patient_file(patient_id: str, file_path: str) -> Optional[Tuple[str, os.stat_result]]:
+    full_path = resolve_patient_file(patient_id, file_path)
+    if full_path is None:
+        return None
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return full_path, st
+
+
+def _read_cached(full_path: str, st: os.stat_result) -> Optional[str]:
+    global _content_cache_bytes
+    version = (st.st_mtime_ns, st.st_size)
+    with _content_lock:
+        cached = _content_cache.get(full_path)
+        if cached is not None and cached[0] == version:
+            _content_cache.move_to_end(full_path)
+            return cached[1]
+    try:
+        with open(full_path, "r", encoding="utf-8") as f:
+            content = f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+    total_limit, file_limit = _file_cache_limits()
+    if st.st_size <= file_limit:
+        with _content_lock:
+            previous = _content_cache.pop(full_path, None)
+            if previous is not None:
+                _content_cache_bytes -= previous[0][1]
+            _content_cache[full_path] = (version, content)
+            _content_cache_bytes += st.st_size
+            while _content_cache_bytes > total_limit and _content_cache:
+                _, (old_version, _) = _content_cache.popitem(last=False)
+                _content_cache_bytes -= old_version[1]
+    return content
+
+
+def iter_file_text(full_path: str, chunk_bytes: int = STREAM_CHUNK_BYTES) -> Iterator[str]:
+    """Decode a (large) UTF-8 file chunk by chunk from a memory map, never holding it whole as str."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    with open(full_path, "rb") as f:
         try:
-            with open(full_path, "r", encoding="utf-8") as f:
-                return f.read()
-        except:
-            return None
-    return None
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            return
+        with mm:
+            view = memoryview(mm)
+            try:
+                for offset in range(0, len(mm), chunk_bytes):
+                    text = decoder.decode(view[offset:offset + chunk_bytes])
+                    if text:
+                        yield text
+            finally:
+                view.release()
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def get_file_content(patient_id: str, file_path: str) -> Optional[str]:
+    """Get content of a specific file within a patient's directory."""
+    found = stat_patient_file(patient_id, file_path)
+    if found is None:
+        return None
+    full_path, st = found
+    return _read_cached(full_path, st)
 
 def get_prontuario(patient_id: str) -> Optional[str]:
     """Get prontuario content for a patient."""
     return get_file_content(patient_id, "Prontuario.md")
 
-def append_to_prontuario(patient_id: str, content: str) -> bool:
-    """Append content to a patient's prontuario."""
-    path = os.path.join(DATA_DIR, patient_id, "Prontuario.md")
-    if os.path.exists(path):
-        with open(path, "a", encoding="utf-8") as f:
-            f.write(f"\n\n{content}")
-        return True
-    return False
+# Hidden sidecars next to Prontuario.md: append lock and version journal.
+# Journal line per append: "<version> <byte offset> <byte length>"; an entry at offset 0
+# covering the whole previous file marks a chart edited outside the API (a reset).
+LOCK_NAME = ".prontuario.lock"
+JOURNAL_NAME = ".prontuario.journal"
+
+
+@contextlib.contextmanager
+def _append_lock(patient_dir: str, shared: bool = False) -> Iterator[None]:
+    """Per-patient lock, held across threads and worker processes.
+
+    Appends take it exclusive; readers take it `shared`, so they only wait for appends, not for
+    each other (msvcrt has no shared mode: exclusive there).
+    """
+    with open(os.path.join(patient_dir, LOCK_NAME), "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _read_journal(patient_dir: str) -> List[Tuple[int, int, int]]:
+    try:
+        with open(os.path.join(patient_dir, JOURNAL_NAME), "r", encoding="ascii") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    entries = []
+    for line in lines:
+        parts = line.split()
+        # A torn last line (crash mid-write) is ignored
+        if len(parts) == 3:
+            entries.append((int(parts[0]), int(parts[1]), int(parts[2])))
+    return entries
+
+
+def _journal_matches(entries: List[Tuple[int, int, int]], size: int) -> bool:
+    """Whether the file still ends where the last journaled append ended."""
+    return bool(entries) and entries[-1][1] + entries[-1][2] == size
+
+
+def append_to_prontuario(patient_id: str, content: str) -> Optional[Tuple[int, int]]:
+    """Append content to a patient's prontuario.
+
+    Appends are serialized per patient; returns (version, byte offset) of this
+    append, or None when the patient does not exist.
+    """
+    patient_dir = os.path.join(DATA_DIR, patient_id)
+    path = os.path.join(patient_dir, "Prontuario.md")
+    if not os.path.exists(path):
+        return None
+    data = f"\n\n{content}".encode("utf-8")
+    with _append_lock(patient_dir):
+        entries = _read_journal(patient_dir)
+        offset = os.path.getsize(path)
+        version = entries[-1][0] if entries else 0
+        new_entries = []
+        if entries and not _journal_matches(entries, offset):
+            # Edited outside the API since the last append: record the unknown history as a reset
+            version += 1
+            new_entries.append((version, 0, offset))
+        version += 1
+        new_entries.append((version, offset, len(data)))
+        with open(path, "ab") as f:
+            f.write(data)
+        with open(os.path.join(patient_dir, JOURNAL_NAME), "a", encoding="ascii") as f:
+            f.write("".join(f"{v} {o} {n}\n" for v, o, n in new_entries))
+    _patient_index.invalidate(patient_id)
+    return version, offset
+
+
+def _current_version(entries: List[Tuple[int, int, int]], size: int) -> int:
+    if not entries:
+        return 0
+    # Edited outside the API since the last append: the next append records a reset
+    return entries[-1][0] if _journal_matches(entries, size) else entries[-1][0] + 1
+
+
+def get_prontuario_with_version(patient_id: str) -> Optional[Tuple[str, int]]:
+    """Prontuario content and the version it corresponds to, read consistently."""
+    patient_dir = os.path.join(DATA_DIR, patient_id)
+    path = os.path.join(patient_dir, "Prontuario.md")
+    if not os.path.exists(path):
+        return None
+    with _append_lock(patient_dir, shared=True):
+        entries = _read_journal(patient_dir)
+        found = stat_patient_file(patient_id, "Prontuario.md")
+        if found is None:
+            return None
+        content = _read_cached(*found)
+        if content is None:
+            return None
+        return content, _current_version(entries, found[1].st_size)
+
+
+def get_prontuario_since(patient_id: str, since: int) -> Optional[Dict[str, Any]]:
+    """Text appended after version `since`.
+
+    `full` is True when the tail cannot be derived (unknown version, or the chart
+    changed outside the API) and `content` is then the whole prontuario.
+    """
+    patient_dir = os.path.join(DATA_DIR, patient_id)
+    path = os.path.join(patient_dir, "Prontuario.md")
+    if not os.path.exists(path):
+        return None
+    # Under the append lock (shared), so the file and the journal are read at the same version
+    with _append_lock(patient_dir, shared=True):
+        entries = _read_journal(patient_dir)
+        try:
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                known = not entries or _journal_matches(entries, size)
+                current = _current_version(entries, size)
+                if known and since <= current:
+                    newer = [e for e in entries if e[0] > since]
+                    offset = newer[0][1] if newer else size
+                    # A reset entry starts at 0: the tail is the whole chart
+                    full = bool(newer) and offset == 0
+                else:
+                    offset, full = 0, True
+                f.seek(offset)
+                data = f.read()
+        except OSError:
+            return None
+    return {"version": current, "since": since, "offset": offset, "full": full,
+            "content": data.decode("utf-8", errors="replace")}
@@ -0,0 +1,246 @@
+"""Local red-flag detector for consultation transcripts.
+
+A single Aho-Corasick pass over the accent-folded, lowercased text finds
+every lexicon term (chest pain, dyspnea, syncope, suicidal ideation...) and
+every negation cue at once. A term counts as negated when a cue precedes it
+within `negation_window_words` words of the same clause, with no break word
+("mas", "refere"...) in between: "nega dor no peito" is not an alert, "nega
+febre, mas refere dor no peito" is.
+
+The lexicon is JSON (backend/data/red_flags_pt.json, or RED_FLAGS_LEXICON)
+and is loaded once per process. Matching is deterministic and takes
+microseconds per transcript delta, so alerts can be raised before any LLM
+call; the LLM check only runs when a flag shows up for the first time.
+
+    python -m backend.services.red_flags "Paciente nega febre, mas refere dor no peito."
+"""
+import argparse
+import json
+import os
+import unicodedata
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+DEFAULT_LEXICON = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "red_flags_pt.json")
+
+CLAUSE_BREAKS = ".;:!?\n"
+
+
+def _fold_table() -> Dict[int, str]:
+    # Lowercase and drop accents one character at a time, so offsets in the folded text match the original
+    table = {}
+    for code in range(0x41, 0x250):
+        ch = chr(code)
+        base = "".join(c for c in unicodedata.normalize("NFKD", ch.lower()) if not unicodedata.combining(c))
+        if len(base) == 1 and base != ch:
+            table[code] = base
+    for ws in "\t\r\n ":
+        table[ord(ws)] = " "
+    return table
+
+
+_FOLD = _fold_table()
+
+
+def fold(text: str) -> str:
+    """Lowercase, accent-free copy of `text` with the same length."""
+    return text.translate(_FOLD)
+
+
+def enabled() -> bool:
+    return os.getenv("RED_FLAGS_ENABLED", "1") == "1"
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: one pass over the text reports every pattern occurrence."""
+
+    def __init__(self, patterns: Iterable[Tuple[str, Any]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Structure: per state, [(pattern length, payload)] of the patterns ending there
+        self._out: List[List[Tuple[int, Any]]] = [[]]
+        for pattern, payload in patterns:
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append((len(pattern), payload))
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0) if state else 0
+                self._out[nxt].extend(self._out[self._fail[nxt]])
+
+    def iter(self, text: str) -> Iterator[Tuple[int, int, Any]]:
+        """Yields (start, end, payload); runs of spaces match a single space in the patterns."""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        prev = ""
+        for i, ch in enumerate(text):
+            if ch == " " and prev == " ":
+                continue
+            prev = ch
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, payload in out[state]:
+                yield self._start(text, i + 1, length), i + 1, payload
+
+    @staticmethod
+    def _start(text: str, end: int, length: int) -> int:
+        # Walk back over `length` pattern characters, counting a run of spaces as one
+        i = end
+        while length:
+            i -= 1
+            if text[i] == " ":
+                while i and text[i - 1] == " ":
+                    i -= 1
+            length -= 1
+        return i
+
+
+class Match(NamedTuple):
+    flag_id: str
+    title: str
+    urgency: str
+    term: str
+    start: int
+    end: int
+    negated: bool
+
+    def to_dict(self, text: Optional[str] = None, context_chars: int = 60) -> Dict[str, Any]:
+        data = {"id": self.flag_id, "title": self.title, "urgency": self.urgency, "term": self.term}
+        if text is not None:
+            data["evidence"] = text[max(0, self.start - context_chars):self.end + context_chars].strip()
+        return data
+
+
+class Detector:
+    def __init__(self, lexicon: Dict[str, Any]):
+        self.window_words = int(lexicon.get("negation_window_words", 6))
+        self.breaks: Set[str] = {fold(w) for w in lexicon.get("negation_breaks", [])}
+        # Structure: {flag_id: {"title": ..., "urgency": ...}}
+        self.flags: Dict[str, Dict[str, str]] = {}
+        patterns = [(fold(cue).strip(), None) for cue in lexicon.get("negation_cues", [])]
+        for flag in lexicon.get("flags", []):
+            self.flags[flag["id"]] = {"title": flag.get("title", flag["id"]), "urgency": flag.get("urgency", "amarelo")}
+            patterns.extend((" ".join(fold(term).split()), flag["id"]) for term in flag.get("terms", []))
+        self.max_term_chars = max((len(p) for p, _ in patterns), default=0)
+        self._matcher = AhoCorasick(p for p in patterns if p[0])
+
+    @classmethod
+    def from_file(cls, path: str) -> "Detector":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def scan(self, text: str, partial: bool = False) -> List[Match]:
+        """All flag occurrences in `text`, in order. With `partial`, a term touching the end of the
+        text is left for the next scan, since the word may still be growing ("peito" -> "peitoral")."""
+        folded = fold(text)
+        n = len(folded)
+        cues: List[Tuple[int, int]] = []
+        matches: List[Match] = []
+        for start, end, flag_id in self._matcher.iter(folded):
+            if (start and folded[start - 1].isalnum()) or (end < n and folded[end].isalnum()):
+                continue
+            if flag_id is None:
+                cues.append((start, end))
+                continue
+            if partial and end == n:
+                continue
+            flag = self.flags[flag_id]
+            matches.append(Match(flag_id, flag["title"], flag["urgency"], text[start:end], start, end,
+                                 self._negated(text, folded, cues, start)))
+        return matches
+
+    def _negated(self, text: str, folded: str, cues: List[Tuple[int, int]], start: int) -> bool:
+        for cue_start, cue_end in reversed(cues):
+            if cue_end > start:
+                continue
+            between = text[cue_end:start]
+            if any(c in CLAUSE_BREAKS for c in between):
+                return False
+            words = folded[cue_end:start].replace(",", " ").split()
+            if len(words) > self.window_words:
+                return False
+            return not any(w in self.breaks for w in words)
+        return False
+
+    def affirmed(self, text: str) -> List[Match]:
+        """First non-negated occurrence of each flag in `text`."""
+        seen: Set[str] = set()
+        result = []
+        for m in self.scan(text):
+            if not m.negated and m.flag_id not in seen:
+                seen.add(m.flag_id)
+                result.append(m)
+        return result
+
+
+_detector: Optional[Detector] = None
+
+
+def get_detector() -> Detector:
+    global _detector
+    if _detector is None:
+        _detector = Detector.from_file(os.getenv("RED_FLAGS_LEXICON") or DEFAULT_LEXICON)
+    return _detector
+
+
+class RedFlagTracker:
+    """Streaming detection over one transcript: each flag is reported once, the first time it is affirmed.
+
+    `feed` takes text as it arrives (deltas); only a tail of earlier text is kept as context for terms
+    and negations split across deltas. `end_utterance` takes the finalized text of the utterance the
+    deltas belonged to, scans it whole and starts the next utterance from scratch.
+    """
+
+    def __init__(self, detector: Optional[Detector] = None):
+        self.detector = detector or get_detector()
+        self.context_chars = 2 * self.detector.max_term_chars + 20 * self.detector.window_words
+        # Affirmed flags, first occurrence each, with the text around it
+        self.alerts: List[Dict[str, Any]] = []
+        self._seen: Set[str] = set()
+        self._tail = ""
+
+    def _collect(self, text: str, partial: bool) -> List[Dict[str, Any]]:
+        new = []
+        for m in self.detector.scan(text, partial=partial):
+            if m.negated or m.flag_id in self._seen:
+                continue
+            self._seen.add(m.flag_id)
+            new.append(m.to_dict(text))
+        self.alerts.extend(new)
+        return new
+
+    def feed(self, text: str, partial: bool = True) -> List[Dict[str, Any]]:
+        """New flags affirmed by `text` appended to the transcript."""
+        if not text:
+            return []
+        window = self._tail + text
+        self._tail = window[-self.context_chars:]
+        return self._collect(window, partial)
+
+    def end_utterance(self, text: str) -> List[Dict[str, Any]]:
+        """New flags in the finalized `text`, which replaces the deltas fed since the last utterance."""
+        self._tail = ""
+        return self._collect(text, partial=False) if text else []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("text")
+    args = parser.parse_args()
+    for m in get_detector().scan(args.text):
+        print(json.dumps({**m.to_dict(args.text), "negated": m.negated}, ensure_ascii=False))
@@ -0,0 +1,97 @@
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+def content_key(*parts: str) -> str:
+    """Stable hash of the given text parts, used as a content-addressed cache key."""
+    h = hashlib.sha256()
+    for part in parts:
+        data = part.encode("utf-8")
+        # Length prefix keeps ("ab", "c") and ("a", "bc") apart
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.hexdigest()
+
+
+def _retrieve_exception(task: asyncio.Task):
+    # A failure nobody awaited any more must not log "exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+class AsyncResultCache:
+    """LRU/TTL cache for async results with singleflight coalescing of concurrent misses."""
+
+    def __init__(self, max_entries: int = 256, ttl_s: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _lookup(self, key: str) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def _store(self, key: str, value: Any):
+        if self.max_entries <= 0 or self.ttl_s <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_s, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for `key`, joining an in-flight computation if there is one."""
+        found, value = self._lookup(key)
+        if found:
+            self.hits += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        # The computation runs in its own task: a caller that goes away (client disconnect)
+        # stops waiting without cancelling it for the others
+        task = asyncio.create_task(self._compute(key, factory))
+        task.add_done_callback(_retrieve_exception)
+        self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _compute(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await factory()
+            self._store(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+        }
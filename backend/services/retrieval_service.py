@@ -0,0 +1,245 @@
+"""Local BM25 retrieval over the Markdown documents of each patient.
+
+Every `.md` file under the patient folder is split into chunks along the
+context builder's sections (long sections are cut further at line boundaries)
+and indexed in an in-memory inverted index. Files are re-chunked only when
+their (mtime_ns, size) changes, and the directory walk that checks them runs
+at most once per RETRIEVAL_CHECK_S (appends through the API refresh at once),
+so a query usually costs only the postings of the question terms. No
+embeddings or external service involved.
+"""
+import heapq
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from backend.services import context_builder, prontuario_service
+from backend.services.tokens import chars_for_tokens, estimate_tokens
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD = re.compile(r"\w+")
+
+STOPWORDS = frozenset("""
+a ao aos as com como da das de do dos e em entre esta este foi ha isso mais mas na nas no nos o os ou para
+pela pelo por qual quais que se sem ser sua seu tem um uma uns umas ja nao sim qual quando onde the of and
+""".split())
+
+
+def _chunk_max_tokens() -> int:
+    return int(os.getenv("RETRIEVAL_CHUNK_TOKENS", "300"))
+
+
+def _check_s() -> float:
+    return float(os.getenv("RETRIEVAL_CHECK_S", "5"))
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased, accent-free word terms without stopwords or single characters."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return [t for t in _WORD.findall(folded) if len(t) > 1 and t not in STOPWORDS]
+
+
+class Chunk:
+    __slots__ = ("id", "path", "title", "text", "length")
+
+    def __init__(self, chunk_id: int, path: str, title: str, text: str, length: int):
+        self.id = chunk_id
+        self.path = path
+        self.title = title
+        self.text = text
+        self.length = length
+
+
+def _split_section(text: str, max_chars: int) -> List[str]:
+    if len(text) <= max_chars:
+        return [text]
+    parts: List[str] = []
+    start = 0
+    while start < len(text):
+        end = start + max_chars
+        if end < len(text):
+            cut = text.rfind("\n", start, end)
+            if cut > start:
+                end = cut + 1
+        parts.append(text[start:end])
+        start = end
+    return parts
+
+
+def chunk_document(text: str) -> List[Tuple[str, str]]:
+    """(title, text) chunks of one document."""
+    index = context_builder.parse_sections(text)
+    max_chars = chars_for_tokens(_chunk_max_tokens())
+    chunks: List[Tuple[str, str]] = []
+    for section in index.sections:
+        body = text[section.start:section.end]
+        if not body.strip():
+            continue
+        for part in _split_section(body, max_chars):
+            if part.strip():
+                chunks.append((section.title, part))
+    return chunks
+
+
+class PatientRetrievalIndex:
+    """Inverted index over one patient's documents, updated file by file."""
+
+    def __init__(self, patient_id: str):
+        self.patient_id = patient_id
+        self._lock = threading.Lock()
+        self._next_id = 0
+        # Structure: {relative_path: ((mtime_ns, size), [chunk_id, ...])}
+        self._files: Dict[str, Tuple[Tuple[int, int], List[int]]] = {}
+        self._chunks: Dict[int, Chunk] = {}
+        # Structure: {term: {chunk_id: term_frequency}}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._total_length = 0
+        self._checked_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def _remove_file(self, rel_path: str):
+        _, chunk_ids = self._files.pop(rel_path)
+        for chunk_id in chunk_ids:
+            chunk = self._chunks.pop(chunk_id)
+            self._total_length -= chunk.length
+            for term in set(tokenize(chunk.text)):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self._postings[term]
+
+    def _add_file(self, rel_path: str, full_path: str, version: Tuple[int, int]):
+        try:
+            with open(full_path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError):
+            return
+        chunk_ids: List[int] = []
+        for title, body in chunk_document(text):
+            terms = Counter(tokenize(body))
+            length = sum(terms.values())
+            if not length:
+                continue
+            chunk_id = self._next_id
+            self._next_id += 1
+            self._chunks[chunk_id] = Chunk(chunk_id, rel_path, title, body, length)
+            self._total_length += length
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[chunk_id] = tf
+            chunk_ids.append(chunk_id)
+        self._files[rel_path] = (version, chunk_ids)
+
+    def refresh(self, force: bool = True):
+        """Re-chunk only the files whose (mtime_ns, size) changed; drop deleted ones.
+
+        Without `force`, nothing is checked if the last walk is more recent than RETRIEVAL_CHECK_S.
+        """
+        now = time.monotonic()
+        if not force and self._checked_at is not None and now - self._checked_at < _check_s():
+            return
+        patient_dir = os.path.join(prontuario_service.DATA_DIR, self.patient_id)
+        seen = set()
+        with self._lock:
+            self._checked_at = now
+            for root, dirs, files in os.walk(patient_dir):
+                dirs[:] = [d for d in dirs if not d.startswith(".")]
+                for name in files:
+                    if not name.endswith(".md") or name.startswith("."):
+                        continue
+                    full_path = os.path.join(root, name)
+                    rel_path = os.path.relpath(full_path, patient_dir).replace("\\", "/")
+                    try:
+                        st = os.stat(full_path)
+                    except OSError:
+                        continue
+                    seen.add(rel_path)
+                    version = (st.st_mtime_ns, st.st_size)
+                    known = self._files.get(rel_path)
+                    if known is not None and known[0] == version:
+                        continue
+                    if known is not None:
+                        self._remove_file(rel_path)
+                    self._add_file(rel_path, full_path, version)
+            for rel_path in [p for p in self._files if p not in seen]:
+                self._remove_file(rel_path)
+
+    def search(self, query: str, k: int) -> List[Tuple[float, Chunk]]:
+        """Top-k chunks by BM25 score for the query terms."""
+        with self._lock:
+            n = len(self._chunks)
+            if not n:
+                return []
+            avg_length = self._total_length / n
+            scores: Dict[int, float] = {}
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._chunks[chunk_id].length / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [(score, self._chunks[chunk_id]) for chunk_id, score in best]
+
+
+# Structure: {patient_id: PatientRetrievalIndex}
+_indexes: Dict[str, PatientRetrievalIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(patient_id: str, force: bool = False) -> Optional[PatientRetrievalIndex]:
+    """Retrieval index of a patient (built on first use), at most RETRIEVAL_CHECK_S stale unless `force`."""
+    if not os.path.isdir(os.path.join(prontuario_service.DATA_DIR, patient_id)):
+        _indexes.pop(patient_id, None)
+        return None
+    with _indexes_lock:
+        index = _indexes.get(patient_id)
+        if index is None:
+            index = _indexes[patient_id] = PatientRetrievalIndex(patient_id)
+    index.refresh(force)
+    return index
+
+
+def refresh(patient_id: str):
+    """Update the index after a document changed (e.g. prontuario append)."""
+    get_index(patient_id, force=True)
+
+
+def retrieve(patient_id: str, question: str, k: int, budget_tokens: int, skip_text: str = "") -> List[Chunk]:
+    """Top-k chunks for the question within `budget_tokens`, skipping chunks already present in `skip_text`."""
+    index = get_index(patient_id)
+    if index is None:
+        return []
+    chosen: List[Chunk] = []
+    remaining = budget_tokens
+    # Over-fetch so chunks already in the prompt do not eat into k
+    for _, chunk in index.search(question, k * 3):
+        if len(chosen) >= k:
+            break
+        if skip_text and chunk.text.strip() in skip_text:
+            continue
+        tokens = estimate_tokens(chunk.text)
+        if tokens > remaining:
+            continue
+        chosen.append(chunk)
+        remaining -= tokens
+    return chosen
+
+
+def format_chunks(chunks: List[Chunk]) -> str:
+    parts = []
+    for chunk in chunks:
+        label = f"{chunk.path} — {chunk.title}" if chunk.title else chunk.path
+        parts.append(f"[{label}]\n{chunk.text.strip()}")
+    return "\n\n".join(parts)
@@ -1,17 +1,277 @@
+"""Staging area (draft notes not yet appended to the prontuario).
 
-from typing import Dict, Optional
-from backend.models.staging import StagingData
+The storage is pluggable via STAGING_BACKEND:
+- ``sqlite`` (default): SQLite database in WAL mode, shared by every uvicorn
+  worker process and kept across restarts (STAGING_DB_PATH).
+- ``memory``: per-process dict, as in the original MVP.
+
+Every change is an operation stamped with a new revision and kept in a
+bounded per-patient op log, so clients can send and receive edits instead of
+the whole draft. Offsets count Unicode code points.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+STAGING_DB_PATH = os.getenv("STAGING_DB_PATH") or os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "data", "staging.db"
+)
+
+OP_TYPES = ("append", "insert", "delete", "replace")
+
+# (revision, op) pairs as stored in the op log
+LoggedOps = List[Tuple[int, Dict[str, Any]]]
+
+
+class StagingConflict(Exception):
+    """The client's base revision is stale and its ops cannot be rebased (not pure appends)."""
+
+    def __init__(self, revision: int):
+        super().__init__(f"staging is at revision {revision}")
+        self.revision = revision
+
+
+def _op_log_max() -> int:
+    return int(os.getenv("STAGING_OP_LOG_MAX", "1000"))
+
+
+def apply_op(content: str, op: Dict[str, Any]) -> str:
+    """Apply one op; raises ValueError for malformed ops or out-of-range offsets."""
+    kind = op.get("op")
+    if kind == "append":
+        text = op.get("text", "")
+        # Separator only between existing text and the new one (e.g. "\n\n" before a suggestion)
+        return content + (op.get("separator", "") if content else "") + text
+    if kind == "insert":
+        offset = op.get("offset")
+        if not isinstance(offset, int) or not 0 <= offset <= len(content):
+            raise ValueError(f"insert offset out of range: {offset}")
+        return content[:offset] + op.get("text", "") + content[offset:]
+    if kind == "delete":
+        offset, length = op.get("offset"), op.get("length")
+        if not isinstance(offset, int) or not isinstance(length, int) or length < 0 \
+                or not 0 <= offset <= offset + length <= len(content):
+            raise ValueError(f"delete range out of bounds: {offset}+{length}")
+        return content[:offset] + content[offset + length:]
+    if kind == "replace":
+        return op.get("text", "")
+    raise ValueError(f"unknown op: {kind}")
+
+
+def _apply_ops(content: str, revision: int, base_revision: Optional[int],
+               ops: List[Dict[str, Any]]) -> Tuple[str, LoggedOps]:
+    """New content and logged ops for `ops` applied on top of (content, revision)."""
+    if base_revision is not None and base_revision != revision:
+        # Appends commute with anything already applied; other ops would land on moved offsets
+        if not all(op.get("op") == "append" for op in ops):
+            raise StagingConflict(revision)
+    logged: LoggedOps = []
+    for op in ops:
+        content = apply_op(content, op)
+        revision += 1
+        logged.append((revision, op))
+    return content, logged
+
+
+class MemoryStagingBackend:
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Structure: {patient_id: content}
+        self._staging_db: Dict[str, str] = {}
+        self._revisions: Dict[str, int] = {}
+        # Structure: {patient_id: deque[(revision, op)]}
+        self._ops: Dict[str, Deque[Tuple[int, Dict[str, Any]]]] = {}
+
+    def get(self, patient_id: str) -> Tuple[str, int]:
+        with self._lock:
+            return self._staging_db.get(patient_id, ""), self._revisions.get(patient_id, 0)
+
+    def apply(self, patient_id: str, base_revision: Optional[int], ops: List[Dict[str, Any]]) -> int:
+        with self._lock:
+            content, revision = self._staging_db.get(patient_id, ""), self._revisions.get(patient_id, 0)
+            content, logged = _apply_ops(content, revision, base_revision, ops)
+            if not logged:
+                return revision
+            if content:
+                self._staging_db[patient_id] = content
+            else:
+                self._staging_db.pop(patient_id, None)
+            self._revisions[patient_id] = logged[-1][0]
+            self._ops.setdefault(patient_id, deque(maxlen=_op_log_max())).extend(logged)
+            return logged[-1][0]
+
+    def ops_since(self, patient_id: str, revision: int) -> Tuple[int, Optional[LoggedOps]]:
+        with self._lock:
+            current = self._revisions.get(patient_id, 0)
+            log = self._ops.get(patient_id, ())
+            if revision == current:
+                return current, []
+            if revision > current or not log or log[0][0] > revision + 1:
+                return current, None
+            return current, [(r, op) for r, op in log if r > revision]
+
+
+class SQLiteStagingBackend:
+    """One row per patient plus an op log, in a WAL-mode SQLite file.
+
+    WAL lets readers proceed while a writer commits; concurrent writers (threads
+    or worker processes) serialize on SQLite's lock and wait up to busy_timeout.
+    Connections are per thread and per process, never shared across a fork.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS staging ("
+            " patient_id TEXT PRIMARY KEY,"
+            " content TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(staging)")]
+        if "revision" not in columns:
+            conn.execute("ALTER TABLE staging ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS staging_ops ("
+            " patient_id TEXT NOT NULL,"
+            " revision INTEGER NOT NULL,"
+            " op TEXT NOT NULL,"
+            " PRIMARY KEY (patient_id, revision))"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        # isolation_level=None: autocommit, each statement is its own transaction
+        conn = sqlite3.connect(self.path, timeout=_busy_timeout_s(), isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, patient_id: str) -> Tuple[str, int]:
+        row = self._connect().execute(
+            "SELECT content, revision FROM staging WHERE patient_id = ?", (patient_id,)
+        ).fetchone()
+        return (row[0], row[1]) if row else ("", 0)
+
+    def apply(self, patient_id: str, base_revision: Optional[int], ops: List[Dict[str, Any]]) -> int:
+        conn = self._connect()
+        # IMMEDIATE takes the write lock up front, so the read-check-write below cannot interleave
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT content, revision FROM staging WHERE patient_id = ?", (patient_id,)
+            ).fetchone()
+            content, revision = (row[0], row[1]) if row else ("", 0)
+            content, logged = _apply_ops(content, revision, base_revision, ops)
+            if logged:
+                revision = logged[-1][0]
+                # The row stays (even when empty) to carry the revision
+                conn.execute(
+                    "INSERT INTO staging (patient_id, content, updated_at, revision) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT(patient_id) DO UPDATE SET content = excluded.content,"
+                    " updated_at = excluded.updated_at, revision = excluded.revision",
+                    (patient_id, content, time.time(), revision),
+                )
+                conn.executemany(
+                    "INSERT INTO staging_ops (patient_id, revision, op) VALUES (?, ?, ?)",
+                    [(patient_id, r, json.dumps(op, ensure_ascii=False)) for r, op in logged],
+                )
+                conn.execute(
+                    "DELETE FROM staging_ops WHERE patient_id = ? AND revision <= ?",
+                    (patient_id, revision - _op_log_max()),
+                )
+            conn.execute("COMMIT")
+            return revision
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def ops_since(self, patient_id: str, revision: int) -> Tuple[int, Optional[LoggedOps]]:
+        conn = self._connect()
+        # One read transaction, so the revision and the ops come from the same snapshot
+        conn.execute("BEGIN")
+        try:
+            _, current = self.get(patient_id)
+            if revision == current:
+                return current, []
+            rows = conn.execute(
+                "SELECT revision, op FROM staging_ops WHERE patient_id = ? AND revision > ? ORDER BY revision",
+                (patient_id, revision),
+            ).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        if revision > current or not rows or rows[0][0] != revision + 1:
+            return current, None
+        return current, [(r, json.loads(op)) for r, op in rows]
+
+
+def _busy_timeout_s() -> float:
+    return float(os.getenv("STAGING_BUSY_TIMEOUT_S", "5"))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _create_backend():
+    kind = (os.getenv("STAGING_BACKEND") or "sqlite").lower()
+    if kind == "memory":
+        return MemoryStagingBackend()
+    if kind == "sqlite":
+        return SQLiteStagingBackend(os.getenv("STAGING_DB_PATH") or STAGING_DB_PATH)
+    raise RuntimeError(f"STAGING_BACKEND desconhecido: {kind}")
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _create_backend()
+    return _backend
 
-# In-memory storage for MVP
-# Structure: {patient_id: content}
-_staging_db: Dict[str, str] = {}
 
 def get_staging(patient_id: str) -> str:
-    return _staging_db.get(patient_id, "")
+    return get_backend().get(patient_id)[0]
+
+def get_staging_with_revision(patient_id: str) -> Tuple[str, int]:
+    return get_backend().get(patient_id)
+
+def update_staging(patient_id: str, content: str) -> int:
+    return get_backend().apply(patient_id, None, [{"op": "replace", "text": content}])
+
+def clear_staging(patient_id: str) -> int:
+    return get_backend().apply(patient_id, None, [{"op": "replace", "text": ""}])
+
+def append_staging(patient_id: str, text: str, separator: str = "") -> int:
+    """Append without a base revision (never conflicts)."""
+    return get_backend().apply(patient_id, None, [{"op": "append", "text": text, "separator": separator}])
+
+def apply_staging_ops(patient_id: str, base_revision: int, ops: List[Dict[str, Any]]) -> int:
+    """Apply client ops made against `base_revision`; returns the new revision.
 
-def update_staging(patient_id: str, content: str):
-    _staging_db[patient_id] = content
+    Raises StagingConflict when the base is stale and the ops are not pure appends,
+    ValueError when an op is malformed.
+    """
+    for op in ops:
+        if op.get("op") not in OP_TYPES:
+            raise ValueError(f"unknown op: {op.get('op')}")
+    return get_backend().apply(patient_id, base_revision, ops)
 
-def clear_staging(patient_id: str):
-    if patient_id in _staging_db:
-        del _staging_db[patient_id]
+def get_staging_ops_since(patient_id: str, revision: int) -> Tuple[int, Optional[LoggedOps]]:
+    """(current revision, ops after `revision`), or None for the ops if the log no longer covers it."""
+    return get_backend().ops_since(patient_id, revision)
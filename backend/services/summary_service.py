@@ -0,0 +1,302 @@
+"""Condensed clinical summaries of prontuarios, shared by chat and clinical checks.
+
+A summary is computed once per prontuario content (keyed by its hash), kept in
+memory and on disk, and refreshed in the background after the chart changes.
+Callers never wait for one: while a summary is missing or being rebuilt they get
+the token-budgeted full text from the context builder instead.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from backend.services import context_builder, llm_gateway
+from backend.services.result_cache import content_key
+from backend.services.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_CACHE_DIR = os.getenv("SUMMARY_CACHE_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "data", "cache", "summaries"
+)
+
+# Bump when the prompt changes so old summaries are not reused
+SUMMARY_PROMPT_VERSION = "1"
+
+SUMMARY_SYSTEM_PROMPT = """
+Você resume prontuários médicos para uso como contexto de um copiloto clínico.
+Produza um resumo clínico condensado, em português, em texto com tópicos curtos, contendo:
+- Identificação (idade, sexo) e motivo de acompanhamento.
+- Alergias (sempre, mesmo que "nega alergias").
+- Problemas ativos e comorbidades, com datas quando houver.
+- Medicações em uso, com doses.
+- Antecedentes relevantes (cirurgias, internações, histórico familiar).
+- Exames e achados recentes importantes, com datas e valores.
+- Evolução das últimas consultas e condutas em andamento.
+Regras: não invente dados; preserve números, doses e datas exatamente; omita o que não estiver no prontuário.
+"""
+
+SUMMARY_UPDATE_PROMPT = """
+Você mantém o resumo clínico de um prontuário médico usado como contexto de um copiloto clínico.
+Recebe o resumo atual e as anotações acrescentadas ao prontuário desde então.
+Devolva o resumo completo atualizado, no mesmo formato: incorpore as novidades (novos problemas,
+medicações, alergias, exames, evolução), ajuste o que mudou e mantenha todo o resto.
+Regras: não invente dados; preserve números, doses e datas exatamente.
+"""
+
+SUMMARY_HEADER = "Resumo clínico do prontuário (gerado automaticamente a partir do prontuário completo):\n\n"
+
+# Structure: {key: summary}
+_memory: "OrderedDict[str, str]" = OrderedDict()
+_pending: Set[str] = set()
+# Keys with no summary on disk either, so request paths do not open the file on every miss
+# Structure: {key: monotonic time of the failed lookup}
+_missing: "OrderedDict[str, float]" = OrderedDict()
+# Background summary tasks, referenced until done so they are not garbage collected mid-run
+_tasks: Set[asyncio.Task] = set()
+_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+# Called with the patient id whenever a new summary of that patient's chart is stored
+_listeners: List[Callable[[str], None]] = []
+
+# Summary key of the last seen version of each patient's chart
+# Structure: {patient_id: (SectionIndex, key)}
+_patient_keys: Dict[str, Tuple[context_builder.SectionIndex, str]] = {}
+# The version before it, so an append can update the old summary instead of redoing it
+_previous_keys: Dict[str, Tuple[context_builder.SectionIndex, str]] = {}
+
+
+def enabled() -> bool:
+    return os.getenv("PRONTUARIO_SUMMARY", "1").lower() not in ("0", "false", "no")
+
+
+def _min_tokens() -> int:
+    # Charts smaller than this are sent as-is: a summary would save little and lose detail
+    return int(os.getenv("SUMMARY_MIN_TOKENS", "1500"))
+
+
+def _input_tokens() -> int:
+    return int(os.getenv("SUMMARY_INPUT_TOKENS", "60000"))
+
+
+def _incremental_max_tokens() -> int:
+    return int(os.getenv("SUMMARY_INCREMENTAL_MAX_TOKENS", "4000"))
+
+
+def _memory_entries() -> int:
+    return int(os.getenv("SUMMARY_MEMORY_ENTRIES", "256"))
+
+
+def _missing_ttl_s() -> float:
+    # Another worker may write the summary meanwhile; misses are rechecked on disk after this long
+    return float(os.getenv("SUMMARY_MISSING_TTL_S", "30"))
+
+
+def summary_key(text: str) -> str:
+    return content_key(SUMMARY_PROMPT_VERSION, llm_gateway.default_chat_model(), text)
+
+
+def _path_for(key: str) -> str:
+    return os.path.join(SUMMARY_CACHE_DIR, f"{key}.md")
+
+
+def _remember(key: str, summary: str):
+    with _lock:
+        _missing.pop(key, None)
+        _memory[key] = summary
+        _memory.move_to_end(key)
+        while len(_memory) > _memory_entries():
+            _memory.popitem(last=False)
+
+
+def cached_summary(key: str, recheck: bool = False) -> Optional[str]:
+    """Summary stored for `key` in memory or on disk, without computing anything.
+
+    A recent disk miss is answered from memory unless `recheck` is set.
+    """
+    with _lock:
+        summary = _memory.get(key)
+        if summary is not None:
+            _memory.move_to_end(key)
+            return summary
+        missed_at = _missing.get(key)
+        if not recheck and missed_at is not None and time.monotonic() - missed_at < _missing_ttl_s():
+            return None
+    try:
+        with open(_path_for(key), "r", encoding="utf-8") as f:
+            summary = f.read()
+    except OSError:
+        with _lock:
+            _missing[key] = time.monotonic()
+            _missing.move_to_end(key)
+            while len(_missing) > _memory_entries():
+                _missing.popitem(last=False)
+        return None
+    _remember(key, summary)
+    return summary
+
+
+def _store(key: str, summary: str):
+    _remember(key, summary)
+    try:
+        os.makedirs(SUMMARY_CACHE_DIR, exist_ok=True)
+        tmp = _path_for(key) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(summary)
+        os.replace(tmp, _path_for(key))
+    except OSError:
+        logger.warning("could not persist summary %s", key[:12], exc_info=True)
+
+
+def _incremental_base(index: context_builder.SectionIndex, patient_id: Optional[str]) -> Optional[Tuple[str, str]]:
+    """(previous summary, appended text) when this version only appends to an already summarized one."""
+    if patient_id is None:
+        return None
+    previous = _previous_keys.get(patient_id)
+    if previous is None or not index.text.startswith(previous[0].text):
+        return None
+    tail = index.text[len(previous[0].text):]
+    if not tail.strip() or estimate_tokens(tail) > _incremental_max_tokens():
+        return None
+    summary = cached_summary(previous[1])
+    return (summary, tail) if summary is not None else None
+
+
+async def _summarize(index: context_builder.SectionIndex, patient_id: Optional[str] = None) -> str:
+    base = _incremental_base(index, patient_id)
+    if base is not None:
+        summary, tail = base
+        return await llm_gateway.chat_completion(
+            messages=[
+                {"role": "system", "content": SUMMARY_UPDATE_PROMPT},
+                {"role": "user", "content": f"Resumo atual:\n\n{summary}\n\nAnotações acrescentadas:\n\n{tail.strip()}"},
+            ],
+            purpose="summary",
+        )
+    source = context_builder.build_context(index, _input_tokens())
+    return await llm_gateway.chat_completion(
+        messages=[
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": source},
+        ],
+        purpose="summary",
+    )
+
+
+def on_summary_ready(callback: Callable[[str], None]):
+    _listeners.append(callback)
+
+
+async def compute_summary(index: context_builder.SectionIndex, key: Optional[str] = None,
+                          patient_id: Optional[str] = None) -> Optional[str]:
+    """Summarize one prontuario version (no-op if already cached or being computed)."""
+    key = key or summary_key(index.text)
+    # Off the request path: look on disk again rather than trust a recent miss
+    summary = cached_summary(key, recheck=True)
+    if summary is not None:
+        return summary
+    with _lock:
+        if key in _pending:
+            return None
+        _pending.add(key)
+    try:
+        summary = (await _summarize(index, patient_id)).strip()
+        if summary:
+            _store(key, summary)
+            if patient_id is not None:
+                for callback in _listeners:
+                    callback(patient_id)
+        return summary or None
+    except Exception:
+        logger.exception("prontuario summary failed")
+        return None
+    finally:
+        with _lock:
+            _pending.discard(key)
+
+
+def _schedule(index: context_builder.SectionIndex, key: str, patient_id: Optional[str]):
+    """Compute a summary in the background, from the event loop or from a worker thread."""
+    if not llm_gateway.is_configured():
+        return
+    with _lock:
+        if key in _pending:
+            return
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        if _loop is not None and not _loop.is_closed():
+            _loop.call_soon_threadsafe(_start_task, index, key, patient_id)
+        return
+    _start_task(index, key, patient_id)
+
+
+def _start_task(index: context_builder.SectionIndex, key: str, patient_id: Optional[str]):
+    task = asyncio.get_running_loop().create_task(compute_summary(index, key, patient_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+def _summary_or_schedule(index: context_builder.SectionIndex, key: str,
+                         patient_id: Optional[str] = None) -> Optional[str]:
+    summary = cached_summary(key)
+    if summary is None:
+        _schedule(index, key, patient_id)
+        return None
+    return SUMMARY_HEADER + summary
+
+
+def _patient_key(patient_id: str) -> Optional[Tuple[context_builder.SectionIndex, str]]:
+    index = context_builder.get_section_index(patient_id)
+    if index is None:
+        return None
+    known = _patient_keys.get(patient_id)
+    # The index object only changes when the file does, so the hash is computed once per version
+    if known is None or known[0] is not index:
+        if known is not None:
+            _previous_keys[patient_id] = known
+        known = (index, summary_key(index.text))
+        _patient_keys[patient_id] = known
+    return known
+
+
+def prontuario_context(patient_id: str, budget_tokens: int) -> Optional[str]:
+    """Prompt context of a patient's chart: its summary when ready, else the budgeted full text."""
+    if enabled():
+        found = _patient_key(patient_id)
+        if found is None:
+            return None
+        index, key = found
+        if index.tokens > _min_tokens():
+            summary = _summary_or_schedule(index, key, patient_id)
+            if summary is not None:
+                return summary
+    return context_builder.build_prontuario_context(patient_id, budget_tokens)
+
+
+def context_from_text(text: str, budget_tokens: int) -> str:
+    """Same as prontuario_context, for a prontuario text posted by the client."""
+    if enabled() and estimate_tokens(text) > _min_tokens():
+        summary = _summary_or_schedule(context_builder.text_section_index(text), summary_key(text))
+        if summary is not None:
+            return summary
+    return context_builder.build_context_from_text(text, budget_tokens)
+
+
+async def refresh_summary(patient_id: str) -> Optional[str]:
+    """Rebuild the summary after the chart changed (run as a background task after an append)."""
+    if not enabled() or not llm_gateway.is_configured():
+        return None
+    found = _patient_key(patient_id)
+    if found is None or found[0].tokens <= _min_tokens():
+        return None
+    index, key = found
+    return await compute_summary(index, key, patient_id)
+
+
+def startup():
+    """Remember the app loop so sync endpoints (worker threads) can schedule summaries."""
+    global _loop
+    _loop = asyncio.get_running_loop()
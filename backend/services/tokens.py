@@ -0,0 +1,8 @@
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token), good enough for prompt budgeting."""
+    return (len(text) + 3) // 4
+
+
+def chars_for_tokens(tokens: int) -> int:
+    return max(0, tokens) * 4
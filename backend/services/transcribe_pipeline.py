@@ -0,0 +1,113 @@
+"""Ordered, concurrent pipeline for the legacy chunked transcription endpoint.
+
+Chunks of one recording session are uploaded concurrently and transcribed in
+parallel (bounded by LEGACY_TRANSCRIBE_CONCURRENCY across all sessions), then
+released strictly in `seq` order: chunk N waits until chunks < N were released,
+so timestamps can be offset by everything before it and stitched in order. A
+chunk that never arrives is skipped after LEGACY_SEQ_GAP_TIMEOUT_S; if it
+shows up later it is answered like a retry, without being stitched.
+
+Each session is one consultation with its own transcript store, closed (and
+persisted) when the session is ended or has been idle for LEGACY_SESSION_TTL_S.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from typing import AsyncIterator, Dict, Optional, Set
+from backend.services import transcript_store
+
+logger = logging.getLogger(__name__)
+
+_semaphore: Optional[asyncio.Semaphore] = None
+
+# Structure: {session_id: ChunkPipeline}
+_pipelines: Dict[str, "ChunkPipeline"] = {}
+
+
+def _gap_timeout_s() -> float:
+    return float(os.getenv("LEGACY_SEQ_GAP_TIMEOUT_S", "15"))
+
+
+def _session_ttl_s() -> float:
+    return float(os.getenv("LEGACY_SESSION_TTL_S", "600"))
+
+
+def transcribe_slot() -> asyncio.Semaphore:
+    """Shared bound on in-flight upstream transcriptions."""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(int(os.getenv("LEGACY_TRANSCRIBE_CONCURRENCY", "4")))
+    return _semaphore
+
+
+class ChunkPipeline:
+    """Release barrier and running time offset of one recording session."""
+
+    def __init__(self, session_id: str, consultation_id: str, offset_s: float = 0.0):
+        self.session_id = session_id
+        self.consultation_id = consultation_id
+        self.next_seq = 0
+        # Consultation-relative start of the next chunk
+        self.offset_s = offset_s
+        self.updated_at = time.monotonic()
+        self._cond = asyncio.Condition()
+        # Seqs given up on by the gap timeout, kept only to report late arrivals
+        self._skipped: Set[int] = set()
+
+    def already_released(self, seq: int) -> bool:
+        """Inside its turn: the chunk was released before (a retry) or skipped (late), so its
+        time is already accounted for and it must not be stitched again."""
+        return seq < self.next_seq
+
+    @contextlib.asynccontextmanager
+    async def turn(self, seq: int) -> AsyncIterator[None]:
+        """Hold the pipeline while chunk `seq` is stitched; entered only after all earlier chunks."""
+        async with self._cond:
+            try:
+                await asyncio.wait_for(self._cond.wait_for(lambda: self.next_seq >= seq), _gap_timeout_s())
+            except asyncio.TimeoutError:
+                logger.warning("legacy chunk gap skipped", extra={
+                    "session_id": self.session_id, "expected": self.next_seq, "received": seq,
+                })
+                self._skipped.update(range(self.next_seq, seq))
+            if seq in self._skipped:
+                logger.warning("legacy chunk arrived after its gap was skipped", extra={
+                    "session_id": self.session_id, "seq": seq,
+                })
+            try:
+                yield
+            finally:
+                if seq >= self.next_seq:
+                    self.next_seq = seq + 1
+                self._skipped.discard(seq)
+                self._skipped = {s for s in self._skipped if s > self.next_seq - 64}
+                self.updated_at = time.monotonic()
+                self._cond.notify_all()
+
+
+def get_pipeline(session_id: str, patient_id: Optional[str] = None) -> ChunkPipeline:
+    """Pipeline of a recording session; the first chunk starts a new consultation."""
+    _evict_idle()
+    pipeline = _pipelines.get(session_id)
+    if pipeline is None:
+        pipeline = _pipelines[session_id] = ChunkPipeline(session_id, transcript_store.new_consultation_id(patient_id))
+    pipeline.updated_at = time.monotonic()
+    return pipeline
+
+
+def close_pipeline(session_id: str) -> Optional[str]:
+    """End a recording session; returns its consultation id, whose transcript is persisted."""
+    pipeline = _pipelines.pop(session_id, None)
+    if pipeline is None:
+        return None
+    transcript_store.close_store(pipeline.consultation_id)
+    return pipeline.consultation_id
+
+
+def _evict_idle():
+    now = time.monotonic()
+    ttl = _session_ttl_s()
+    for session_id in [sid for sid, p in _pipelines.items() if now - p.updated_at > ttl]:
+        close_pipeline(session_id)
@@ -0,0 +1,232 @@
+
+import bisect
+import json
+import os
+import re
+import secrets
+import struct
+import time
+from array import array
+from typing import Any, Dict, Iterator, List, Optional
+from backend.services.tokens import estimate_tokens
+
+TRANSCRIPTS_DIR = os.getenv("TRANSCRIPTS_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "data", "transcripts"
+)
+
+_MAGIC = b"STTR1\n"
+
+# In-memory stores of the consultations in progress
+# Structure: {consultation_id: TranscriptStore}
+_stores: Dict[str, "TranscriptStore"] = {}
+
+
+class TranscriptStore:
+    """Column-oriented transcript of one consultation.
+
+    Each segment is one row across typed arrays (start, end, speaker id, text
+    offset, cumulative tokens); the text itself lives in a single UTF-8 buffer.
+    Appends are O(1) amortized, time-range lookups bisect the end column, and
+    windows only decode the bytes they cover.
+    """
+
+    __slots__ = ("_start", "_end", "_speaker", "_offsets", "_tokens", "_text",
+                 "_speakers", "_speaker_ids", "_by_speaker", "_monotonic")
+
+    def __init__(self):
+        self._start = array("d")
+        self._end = array("d")
+        self._speaker = array("H")
+        # offsets/tokens carry one extra leading 0, so row i spans [off[i], off[i+1])
+        self._offsets = array("q", [0])
+        self._tokens = array("q", [0])
+        self._text = bytearray()
+        self._speakers: List[str] = [""]
+        self._speaker_ids: Dict[str, int] = {"": 0}
+        self._by_speaker: Dict[int, array] = {}
+        self._monotonic = True
+
+    def __len__(self) -> int:
+        return len(self._start)
+
+    @property
+    def duration(self) -> float:
+        return self._end[-1] if len(self._end) else 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self._tokens[-1]
+
+    def append(self, start: float, end: float, speaker: Optional[str], text: str) -> int:
+        """Add a segment; returns its row index."""
+        row = len(self._start)
+        if row and end < self._end[-1]:
+            self._monotonic = False
+        speaker = speaker or ""
+        sid = self._speaker_ids.get(speaker)
+        if sid is None:
+            sid = len(self._speakers)
+            self._speakers.append(speaker)
+            self._speaker_ids[speaker] = sid
+        self._start.append(float(start))
+        self._end.append(float(end))
+        self._speaker.append(sid)
+        # A trailing space separates segments, so windows are plain slices of the buffer
+        self._text += text.strip().encode("utf-8") + b" "
+        self._offsets.append(len(self._text))
+        self._tokens.append(self._tokens[-1] + estimate_tokens(text))
+        self._by_speaker.setdefault(sid, array("q")).append(row)
+        return row
+
+    def _slice_text(self, first: int, last: int) -> str:
+        """Text of rows [first, last) decoded straight from the shared buffer."""
+        if first >= last:
+            return ""
+        return str(memoryview(self._text)[self._offsets[first]:self._offsets[last]], "utf-8").rstrip()
+
+    def segment(self, row: int) -> Dict[str, Any]:
+        return {
+            "id": row,
+            "start": self._start[row],
+            "end": self._end[row],
+            "speaker": self._speakers[self._speaker[row]] or None,
+            "text": self._slice_text(row, row + 1),
+        }
+
+    def segments(self, first: int = 0, last: Optional[int] = None) -> List[Dict[str, Any]]:
+        last = len(self) if last is None else last
+        return [self.segment(i) for i in range(first, last)]
+
+    def text(self, first: int = 0, last: Optional[int] = None) -> str:
+        return self._slice_text(first, len(self) if last is None else last)
+
+    def speakers(self) -> List[str]:
+        return [s for s in self._speakers if s]
+
+    def rows_by_speaker(self, speaker: Optional[str]) -> array:
+        sid = self._speaker_ids.get(speaker or "")
+        return self._by_speaker.get(sid, array("q")) if sid is not None else array("q")
+
+    def rows_in_range(self, t0: float, t1: float) -> Iterator[int]:
+        """Rows overlapping [t0, t1)."""
+        if not self._monotonic:
+            return (i for i in range(len(self)) if self._end[i] > t0 and self._start[i] < t1)
+        first = bisect.bisect_right(self._end, t0)
+        return (i for i in range(first, len(self)) if self._start[i] < t1) if first < len(self) else iter(())
+
+    def query(self, speaker: Optional[str] = None, t0: Optional[float] = None, t1: Optional[float] = None) -> List[Dict[str, Any]]:
+        if t0 is None and t1 is None:
+            rows: Any = range(len(self)) if speaker is None else self.rows_by_speaker(speaker)
+            return [self.segment(i) for i in rows]
+        rows = self.rows_in_range(t0 if t0 is not None else float("-inf"), t1 if t1 is not None else float("inf"))
+        if speaker is not None:
+            wanted = self._speaker_ids.get(speaker)
+            if wanted is None:
+                return []
+            rows = (i for i in rows if self._speaker[i] == wanted)
+        return [self.segment(i) for i in rows]
+
+    def first_row_after(self, t: float) -> int:
+        """First row that ends after `t` (start of a 'last N seconds' window)."""
+        if self._monotonic:
+            return bisect.bisect_right(self._end, t)
+        for i in range(len(self)):
+            if self._end[i] > t:
+                return i
+        return len(self)
+
+    def last_seconds(self, seconds: float) -> str:
+        return self._slice_text(self.first_row_after(self.duration - seconds), len(self))
+
+    def last_tokens(self, tokens: int) -> str:
+        """Whole segments from the end whose estimated tokens fit in `tokens` (at least the last one)."""
+        n = len(self)
+        if not n:
+            return ""
+        first = bisect.bisect_left(self._tokens, self._tokens[-1] - tokens)
+        return self._slice_text(min(first, n - 1), n)
+
+    def save(self, path: str):
+        """Write the columns and the text buffer as-is (no per-segment encoding)."""
+        header = json.dumps({"rows": len(self), "speakers": self._speakers, "monotonic": self._monotonic}).encode("utf-8")
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            for col in (self._start, self._end, self._speaker, self._offsets, self._tokens):
+                col.tofile(f)
+            f.write(self._text)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "TranscriptStore":
+        store = cls()
+        with open(path, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"not a transcript store file: {path}")
+            (header_len,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_len))
+            rows = header["rows"]
+            store._start = array("d")
+            store._start.fromfile(f, rows)
+            store._end = array("d")
+            store._end.fromfile(f, rows)
+            store._speaker = array("H")
+            store._speaker.fromfile(f, rows)
+            store._offsets = array("q")
+            store._offsets.fromfile(f, rows + 1)
+            store._tokens = array("q")
+            store._tokens.fromfile(f, rows + 1)
+            store._text = bytearray(f.read())
+        store._speakers = header["speakers"]
+        store._speaker_ids = {s: i for i, s in enumerate(store._speakers)}
+        store._monotonic = header["monotonic"]
+        for row, sid in enumerate(store._speaker):
+            store._by_speaker.setdefault(sid, array("q")).append(row)
+        return store
+
+
+def new_consultation_id(patient_id: Optional[str] = None) -> str:
+    """Id of a new consultation (one recording session): patient, start time and a random suffix."""
+    prefix = re.sub(r"[^A-Za-z0-9_-]", "", patient_id or "") or "anon"
+    return f"{prefix}_{time.strftime('%Y%m%dT%H%M%S')}_{secrets.token_hex(3)}"
+
+
+def _path_for(consultation_id: str) -> str:
+    return os.path.join(TRANSCRIPTS_DIR, f"{os.path.basename(consultation_id)}.transcript")
+
+
+def get_store(consultation_id: str, create: bool = True) -> Optional[TranscriptStore]:
+    """Store of a consultation, reloaded from disk if it was persisted before.
+
+    With `create=False` (read-only lookups) an archived transcript is loaded but not registered:
+    only live sessions, which close their store when they end, are kept in memory.
+    """
+    store = _stores.get(consultation_id)
+    if store is None:
+        path = _path_for(consultation_id)
+        if os.path.exists(path):
+            store = TranscriptStore.load(path)
+            if not create:
+                return store
+        elif create:
+            store = TranscriptStore()
+        else:
+            return None
+        _stores[consultation_id] = store
+    return store
+
+
+def persist_store(consultation_id: str):
+    store = _stores.get(consultation_id)
+    if store is None or not len(store):
+        return
+    os.makedirs(TRANSCRIPTS_DIR, exist_ok=True)
+    store.save(_path_for(consultation_id))
+
+
+def close_store(consultation_id: str, persist: bool = True):
+    if persist:
+        persist_store(consultation_id)
+    _stores.pop(consultation_id, None)
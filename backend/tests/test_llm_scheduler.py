@@ -0,0 +1,73 @@
+"""LLM admission: priority between classes, the safety reserve and token-bucket wake-ups."""
+import asyncio
+
+import pytest
+
+from backend.services import llm_scheduler
+
+
+@pytest.fixture
+def make_scheduler(monkeypatch):
+    def make(limit: int = 3, **rates):
+        # Fixed limit, the last slot kept for safety checks; no per-class rate caps unless given
+        env = {"LLM_CONCURRENCY_MIN": limit, "LLM_CONCURRENCY_MAX": limit, "LLM_CONCURRENCY_INITIAL": limit,
+               "LLM_SAFETY_RESERVE": 1, "LLM_RPM_BATCH": 0, **rates}
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        return llm_scheduler.LLMScheduler()
+    return make
+
+
+def test_safety_reserve_admits_safety_checks_past_a_full_house(make_scheduler):
+    async def run():
+        s = make_scheduler()
+        await s.acquire("chat")
+        await s.acquire("analyze")
+        waiting = asyncio.create_task(s.acquire("chat"))
+        await asyncio.sleep(0.01)
+        assert not waiting.done(), "chat must not take the reserved slot"
+        await asyncio.wait_for(s.acquire("clinical_check"), 1)
+        assert s.inflight == 3
+        waiting.cancel()
+
+    asyncio.run(run())
+
+
+def test_released_slot_goes_to_the_highest_priority_waiter(make_scheduler):
+    async def run():
+        s = make_scheduler()
+        held = await s.acquire("chat")
+        await s.acquire("chat")
+        granted = []
+
+        async def wait(purpose):
+            slot = await s.acquire(purpose)
+            granted.append(purpose)
+            async with slot:
+                await asyncio.sleep(0)
+
+        # Queued lowest priority first
+        tasks = [asyncio.create_task(wait(p)) for p in ("summary", "chat", "transcription")]
+        await asyncio.sleep(0.01)
+        assert not granted
+        async with held:
+            pass
+        await asyncio.wait_for(asyncio.gather(*tasks), 1)
+        assert granted == ["transcription", "chat", "summary"]
+
+    asyncio.run(run())
+
+
+def test_bucket_refilling_sooner_moves_the_wake_up_earlier(make_scheduler):
+    async def run():
+        s = make_scheduler(limit=8, LLM_RPM_BATCH=6, LLM_BURST_BATCH=1, LLM_RPM_CHAT=600, LLM_BURST_CHAT=1)
+        # Empty both buckets: the next batch token is 10 s away, the next chat token 0.1 s
+        await s.acquire("summary")
+        await s.acquire("chat")
+        batch = asyncio.create_task(s.acquire("summary"))
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(s.acquire("chat"), 1)
+        assert not batch.done()
+        batch.cancel()
+
+    asyncio.run(run())
@@ -0,0 +1,52 @@
+"""Prontuario append journal: versions, incremental tails and edits made outside the API."""
+import os
+
+import pytest
+
+from backend.services import prontuario_service
+
+PATIENT = "pac_test"
+HEADER = "# Prontuário - Teste (45 anos)\n"
+
+
+@pytest.fixture
+def chart(tmp_path, monkeypatch):
+    monkeypatch.setattr(prontuario_service, "DATA_DIR", str(tmp_path))
+    os.makedirs(tmp_path / PATIENT)
+    path = tmp_path / PATIENT / "Prontuario.md"
+    path.write_text(HEADER, encoding="utf-8")
+    return path
+
+
+def test_appends_are_versioned_and_tails_start_after_the_version(chart):
+    assert prontuario_service.append_to_prontuario(PATIENT, "Consulta 1: HAS.") == (1, len(HEADER.encode()))
+    version, _ = prontuario_service.append_to_prontuario(PATIENT, "Consulta 2: DM2, metformina 850 mg.")
+    assert version == 2
+    tail = prontuario_service.get_prontuario_since(PATIENT, 1)
+    assert tail["version"] == 2 and not tail["full"]
+    assert tail["content"] == "\n\nConsulta 2: DM2, metformina 850 mg."
+    assert prontuario_service.get_prontuario_since(PATIENT, 2)["content"] == ""
+    content, version = prontuario_service.get_prontuario_with_version(PATIENT)
+    assert version == 2 and content == chart.read_text(encoding="utf-8")
+
+
+def test_unknown_version_gets_the_whole_chart(chart):
+    prontuario_service.append_to_prontuario(PATIENT, "Consulta 1.")
+    tail = prontuario_service.get_prontuario_since(PATIENT, 7)
+    assert tail["full"] and tail["offset"] == 0
+    assert tail["content"] == chart.read_text(encoding="utf-8")
+
+
+def test_edit_outside_the_api_is_recorded_as_a_reset(chart):
+    prontuario_service.append_to_prontuario(PATIENT, "Consulta 1.")
+    with open(chart, "a", encoding="utf-8") as f:
+        f.write("\nEditado à mão.")
+    # Until the next append, the edit shows as a version the journal cannot describe
+    tail = prontuario_service.get_prontuario_since(PATIENT, 1)
+    assert tail["full"] and tail["version"] == 2
+    version, _ = prontuario_service.append_to_prontuario(PATIENT, "Consulta 2.")
+    assert version == 3
+    # The reset entry covers everything up to the edit; after it, tails are incremental again
+    assert prontuario_service.get_prontuario_since(PATIENT, 1)["full"]
+    tail = prontuario_service.get_prontuario_since(PATIENT, 2)
+    assert not tail["full"] and tail["content"] == "\n\nConsulta 2."
@@ -0,0 +1,50 @@
+"""RealtimeRelay recovery against the stub upstream that drops connections (bench_reconnect --kill-every)."""
+import argparse
+import asyncio
+
+from backend.api import realtime_transcribe
+from backend.bench import bench_reconnect
+
+
+def _args(**overrides) -> argparse.Namespace:
+    args = argparse.Namespace(duration=20.0, speed=4.0, kill_every=1.5, chunk_ms=100, no_vad=False,
+                              commit_every=2.0, pause_ms=700, upstream_latency_ms=80.0, settle=15.0, seed=7)
+    for key, value in overrides.items():
+        setattr(args, key, value)
+    return args
+
+
+def _check(result):
+    assert result["upstream_kills"] > 0, "the stub never dropped a connection"
+    assert result["uncovered"] == 0, f"{result['uncovered']} turn(s) never got a final transcript"
+    assert result["problems"] == [], result["problems"]
+
+
+def test_vad_relay_survives_upstream_kills():
+    _check(asyncio.run(bench_reconnect.main(_args())))
+
+
+def test_client_commit_relay_survives_upstream_kills():
+    _check(asyncio.run(bench_reconnect.main(_args(no_vad=True))))
+
+
+class _ClientSocket:
+    def __init__(self, texts):
+        self.messages = [{"type": "websocket.receive", "text": t} for t in texts]
+        self.messages.append({"type": "websocket.disconnect"})
+        self.sent = []
+
+    async def receive(self):
+        return self.messages.pop(0)
+
+    async def send_text(self, text: str):
+        self.sent.append(text)
+
+
+def test_malformed_client_frames_do_not_end_the_session():
+    ws = _ClientSocket(["[1]", '"x"', "3", "null", "{not json",
+                        '{"type": "input_audio_buffer.append", "audio": "@@not base64@@"}'])
+    relay = realtime_transcribe.RealtimeRelay(ws, "test")
+    asyncio.run(relay.client_pump())
+    assert not ws.messages, "the pump stopped before the client disconnected"
+    assert relay.metrics.counters["realtime.malformed_frames"] == 1
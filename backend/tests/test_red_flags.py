@@ -0,0 +1,34 @@
+"""Red-flag detector: negation cues, words that end a negation, and streaming detection."""
+from backend.services import red_flags
+
+
+def _affirmed(text):
+    return [m.flag_id for m in red_flags.get_detector().affirmed(text)]
+
+
+def test_negated_terms_are_not_alerts():
+    assert _affirmed("Paciente nega dor no peito.") == []
+    assert _affirmed("Sem febre e sem rigidez de nuca.") == []
+    # Accents and case are folded on both sides
+    assert _affirmed("NÃO TEM FALTA DE AR.") == []
+    assert _affirmed("Refere DOR TORÁCICA ao esforço.") == ["dor_toracica"]
+
+
+def test_break_words_and_clause_ends_close_the_negation():
+    assert _affirmed("Nega febre, mas refere dor no peito.") == ["dor_toracica"]
+    assert _affirmed("Sem febre, refere falta de ar") == ["dispneia"]
+    assert _affirmed("Nega febre. Dor no peito desde ontem.") == ["dor_toracica"]
+    # A cue covers a list within its window, not a term further along the sentence
+    assert _affirmed("Nega tabagismo, etilismo ou desmaio.") == []
+    assert _affirmed("Nega dor de cabeça forte nos últimos dias de calor intenso e desmaio.") == ["sincope"]
+
+
+def test_tracker_reports_a_term_split_across_deltas_once():
+    tracker = red_flags.RedFlagTracker()
+    assert tracker.feed("Conta que teve dor no pei") == []
+    # "peito" may still grow while it touches the end of a partial delta
+    assert tracker.feed("to") == []
+    assert [a["id"] for a in tracker.feed(" ontem à noite.")] == ["dor_toracica"]
+    assert tracker.end_utterance("Conta que teve dor no peito ontem à noite.") == []
+    assert tracker.feed("Nega falta de ar.") == []
+    assert [a["id"] for a in tracker.alerts] == ["dor_toracica"]
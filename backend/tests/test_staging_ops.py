@@ -0,0 +1,55 @@
+"""Staging edit ops over HTTP: stale appends are rebased, other stale edits get a 409."""
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.main import app
+from backend.services import staging_service
+
+PATIENT = "pac_test"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("STAGING_BACKEND", "memory")
+    monkeypatch.setattr(staging_service, "_backend", None)
+    return TestClient(app)
+
+
+def _ops(client, base_revision, *ops):
+    return client.post(f"/patients/{PATIENT}/staging/ops", json={"base_revision": base_revision, "ops": list(ops)})
+
+
+def _replay(content, ops):
+    for op in ops:
+        content = staging_service.apply_op(content, {k: v for k, v in op.items() if k != "revision"})
+    return content
+
+
+def test_stale_append_is_rebased_and_returns_the_intervening_ops(client):
+    assert _ops(client, 0, {"op": "append", "text": "hello"}).json()["revision"] == 1
+    # A second client still at revision 0
+    body = _ops(client, 0, {"op": "append", "text": " world"}).json()
+    assert body["rebased"] is True and body["revision"] == 2
+    assert [op["revision"] for op in body["ops"]] == [1, 2]
+    content = client.get(f"/patients/{PATIENT}/staging").json()["content"]
+    assert content == "hello world"
+    # Replaying the answer over the client's base reproduces the server draft
+    assert _replay("", body["ops"]) == content
+
+
+def test_stale_edit_that_is_not_an_append_conflicts(client):
+    _ops(client, 0, {"op": "append", "text": "abc"})
+    _ops(client, 1, {"op": "append", "text": "def"})
+    response = _ops(client, 1, {"op": "delete", "offset": 0, "length": 1})
+    assert response.status_code == 409
+    assert response.json()["detail"]["revision"] == 2
+    assert client.get(f"/patients/{PATIENT}/staging").json() == {"content": "abcdef", "revision": 2}
+
+
+def test_rebase_past_the_op_log_resets_to_the_content(client, monkeypatch):
+    monkeypatch.setenv("STAGING_OP_LOG_MAX", "2")
+    for i in range(4):
+        _ops(client, i, {"op": "append", "text": str(i)})
+    body = _ops(client, 0, {"op": "append", "text": "!"}).json()
+    assert body["rebased"] is True and body["reset"] is True
+    assert body["content"] == "0123!" and body["revision"] == 5
@@ -1,6 +1,6 @@
 "use client";
 
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import Sidebar from "@/components/Sidebar";
 import MainPanel from "@/components/MainPanel";
 import RightPanel from "@/components/RightPanel";
@@ -36,6 +36,47 @@ interface LiveAlert {
   recommended_actions: string[];
 }
 
+interface StagingOp {
+  op: "append" | "insert" | "delete" | "replace";
+  text?: string;
+  offset?: number;
+  length?: number;
+  separator?: string;
+}
+
+// Offsets are in Unicode code points, like on the server (Array.from splits by code point)
+const applyStagingOp = (content: string, op: StagingOp): string => {
+  const chars = Array.from(content);
+  switch (op.op) {
+    case "append":
+      return content + (content ? op.separator || "" : "") + (op.text || "");
+    case "insert":
+      return chars.slice(0, op.offset).join("") + (op.text || "") + chars.slice(op.offset).join("");
+    case "delete":
+      return chars.slice(0, op.offset).join("") + chars.slice((op.offset || 0) + (op.length || 0)).join("");
+    case "replace":
+      return op.text || "";
+  }
+};
+
+// Minimal ops turning `before` into `after`: one delete and/or one insert around the common prefix/suffix
+const diffStagingOps = (before: string, after: string): StagingOp[] => {
+  if (before === after) return [];
+  const a = Array.from(before);
+  const b = Array.from(after);
+  let prefix = 0;
+  while (prefix < a.length && prefix < b.length && a[prefix] === b[prefix]) prefix++;
+  let suffix = 0;
+  while (suffix < a.length - prefix && suffix < b.length - prefix && a[a.length - 1 - suffix] === b[b.length - 1 - suffix]) suffix++;
+  const removed = a.length - prefix - suffix;
+  const inserted = b.slice(prefix, b.length - suffix).join("");
+  if (!removed && prefix === a.length) return [{ op: "append", text: inserted }];
+  const ops: StagingOp[] = [];
+  if (removed) ops.push({ op: "delete", offset: prefix, length: removed });
+  if (inserted) ops.push({ op: "insert", offset: prefix, text: inserted });
+  return ops;
+};
+
 export default function Home() {
   // Data State
   const [patients, setPatients] = useState<Patient[]>([]);
@@ -48,6 +89,8 @@ export default function Home() {
   const [liveAlerts, setLiveAlerts] = useState<LiveAlert[]>([]);
   const [liveMissingQuestions, setLiveMissingQuestions] = useState<string[]>([]);
   const [liveRecommendedConducts, setLiveRecommendedConducts] = useState<string[]>([]);
+  // Version of the Prontuario.md currently shown, to fetch only appended text afterwards
+  const prontuarioVersionRef = useRef<number | null>(null);
 
   // UI State
   const [isSidebarOpen, setIsSidebarOpen] = useState(true); // Desktop default
@@ -78,6 +121,13 @@ export default function Home() {
   // Fetch File Content
   const fetchFileContent = async (patientId: string, filePath: string) => {
     try {
+      if (filePath === "Prontuario.md") {
+        const response = await axios.get(`${API_URL}/patients/${patientId}/prontuario`);
+        prontuarioVersionRef.current = response.data.version;
+        setFileContent(response.data.content);
+        return;
+      }
+      prontuarioVersionRef.current = null;
       const response = await axios.get(`${API_URL}/patients/${patientId}/file`, {
         params: { path: filePath }
       });
@@ -88,28 +138,113 @@ export default function Home() {
     }
   };
 
+  // Fetch only what was appended to the prontuario since the shown version
+  const fetchProntuarioTail = async (patientId: string) => {
+    const since = prontuarioVersionRef.current;
+    if (since === null) {
+      fetchFileContent(patientId, "Prontuario.md");
+      return;
+    }
+    try {
+      const response = await axios.get(`${API_URL}/patients/${patientId}/prontuario`, { params: { since } });
+      const { content, full, version } = response.data;
+      prontuarioVersionRef.current = version;
+      setFileContent((current) => (full ? content : current + content));
+    } catch (error) {
+      console.error("Error fetching prontuario tail:", error);
+      fetchFileContent(patientId, "Prontuario.md");
+    }
+  };
+
+  // Staging sync state: server revision and the content it corresponds to
+  const stagingRevisionRef = useRef(0);
+  const syncedStagingRef = useRef("");
+  // Latest draft in the editor, which may be ahead of the synced one
+  const localStagingRef = useRef("");
+  const stagingSyncRef = useRef<Promise<void>>(Promise.resolve());
+
+  const setSyncedStaging = (content: string, revision: number) => {
+    syncedStagingRef.current = content;
+    stagingRevisionRef.current = revision;
+    localStagingRef.current = content;
+    setStaging(content);
+  };
+
   // Fetch Staging
   const fetchStaging = async (patientId: string) => {
     try {
       const response = await axios.get(`${API_URL}/patients/${patientId}/staging`);
-      setStaging(response.data.content);
+      setSyncedStaging(response.data.content, response.data.revision);
     } catch (error) {
       console.error("Error fetching staging:", error);
     }
   };
 
+  // Fetch only the staging ops applied since our revision
+  const fetchStagingOps = async (patientId: string) => {
+    try {
+      const response = await axios.get(`${API_URL}/patients/${patientId}/staging`, {
+        params: { since_revision: stagingRevisionRef.current },
+      });
+      const data = response.data;
+      const content = data.reset ? data.content : data.ops.reduce(applyStagingOp, syncedStagingRef.current);
+      setSyncedStaging(content, data.revision);
+    } catch (error) {
+      console.error("Error fetching staging ops:", error);
+      fetchStaging(patientId);
+    }
+  };
+
+  const syncStaging = async (patientId: string, content: string) => {
+    const base = syncedStagingRef.current;
+    const ops = diffStagingOps(base, content);
+    if (!ops.length) return;
+    try {
+      const response = await axios.post(`${API_URL}/patients/${patientId}/staging/ops`, {
+        base_revision: stagingRevisionRef.current,
+        ops,
+      });
+      const data = response.data;
+      if (!data.rebased) {
+        syncedStagingRef.current = content;
+        stagingRevisionRef.current = data.revision;
+        return;
+      }
+      // Our appends landed after someone else's edits (e.g. an accepted suggestion):
+      // rebuild the server's draft, then carry over what was typed while this request ran
+      const server = data.reset ? data.content : data.ops.reduce(applyStagingOp, base);
+      const local = localStagingRef.current;
+      const rebased = local.startsWith(content) ? server + local.slice(content.length) : local;
+      syncedStagingRef.current = server;
+      stagingRevisionRef.current = data.revision;
+      localStagingRef.current = rebased;
+      setStaging(rebased);
+    } catch (error: any) {
+      if (error?.response?.status !== 409) {
+        console.error("Error updating staging:", error);
+        return;
+      }
+      // Changed elsewhere: fall back to writing the whole draft (last writer wins, as before)
+      const response = await axios.post(`${API_URL}/patients/${patientId}/staging`, {
+        patient_id: patientId,
+        content,
+      });
+      syncedStagingRef.current = content;
+      stagingRevisionRef.current = response.data.revision;
+    }
+  };
+
   // Handlers
   const handleStagingChange = async (content: string) => {
     setStaging(content);
+    localStagingRef.current = content;
     if (selectedPatientId) {
-      try {
-        await axios.post(`${API_URL}/patients/${selectedPatientId}/staging`, {
-          patient_id: selectedPatientId,
-          content,
-        });
-      } catch (error) {
-        console.error("Error updating staging:", error);
-      }
+      const patientId = selectedPatientId;
+      // One sync in flight at a time, each diffing the latest draft (rebased if needed) against the last synced one
+      stagingSyncRef.current = stagingSyncRef.current
+        .then(() => syncStaging(patientId, localStagingRef.current))
+        .catch((error) => console.error("Error updating staging:", error));
+      await stagingSyncRef.current;
     }
   };
 
@@ -122,9 +257,10 @@ export default function Home() {
         content: staging,
       });
       alert("Nota adicionada ao prontuário!");
-      setStaging("");
+      // The server cleared the staging: pick up its new revision
+      fetchStaging(selectedPatientId);
       if (selectedFilePath === "Prontuario.md") {
-        fetchFileContent(selectedPatientId, selectedFilePath);
+        fetchProntuarioTail(selectedPatientId);
       }
     } catch (error) {
       console.error("Error saving note:", error);
@@ -166,7 +302,7 @@ export default function Home() {
         `${API_URL}/patients/${selectedPatientId}/suggestions/${suggestionId}/accept`,
         { suggestion_text: text }
       );
-      fetchStaging(selectedPatientId);
+      fetchStagingOps(selectedPatientId);
     } catch (error) {
       console.error("Error accepting suggestion:", error);
     }
@@ -62,7 +62,6 @@ export default function MainPanel({
   const liveTranscriptRef = useRef<string>("");
   const segmentsRef = useRef<DiarizedSegment[]>([]);
   const stagingRef = useRef<string>("");
-  const prontuarioRef = useRef<string>("");
 
   const [isSafetyCheckLoading, setIsSafetyCheckLoading] = useState(false);
   const safetyInFlightRef = useRef<boolean>(false);
@@ -129,18 +128,48 @@ export default function MainPanel({
   useEffect(() => { liveTranscriptRef.current = liveTranscript; }, [liveTranscript]);
   useEffect(() => { segmentsRef.current = segments; }, [segments]);
   useEffect(() => { stagingRef.current = staging; }, [staging]);
-  useEffect(() => { prontuarioRef.current = prontuario; }, [prontuario]);
 
   // --- Live Clinical Analysis Logic ---
   // Use ref for onLiveClinicalUpdate to avoid resetting the interval when parent re-renders
   const onLiveClinicalUpdateRef = useRef(onLiveClinicalUpdate);
   useEffect(() => { onLiveClinicalUpdateRef.current = onLiveClinicalUpdate; }, [onLiveClinicalUpdate]);
 
+  // Server-side consultation session: the prontuario is loaded on the server once,
+  // and each tick only sends the transcript text appended since the previous one.
+  const sessionSeqRef = useRef<number | null>(null);
+  const sentTranscriptRef = useRef<string>("");
+  // Legacy chunk pipeline: chunks of one recording share a session and are numbered,
+  // so they can be uploaded concurrently and still come back in order
+  const chunkSessionRef = useRef<string>("");
+  const chunkSeqRef = useRef(0);
+  // Uploads still in flight; the session is ended only after the last one is answered
+  const pendingChunksRef = useRef<Set<Promise<void>>>(new Set());
+
+  useEffect(() => {
+    sessionSeqRef.current = null;
+    sentTranscriptRef.current = "";
+  }, [patientId]);
+
+  const openSafetySession = useCallback(async (): Promise<boolean> => {
+    if (!patientId) return false;
+    const res = await fetch(`${API_BASE}/api/live-clinical-check/sessions/${encodeURIComponent(patientId)}`, {
+      method: "POST",
+    });
+    if (!res.ok) {
+      console.error("live-clinical-check session failed:", res.status);
+      sessionSeqRef.current = null;
+      return false;
+    }
+    const data = await res.json();
+    sessionSeqRef.current = typeof data?.seq === "number" ? data.seq : 0;
+    sentTranscriptRef.current = "";
+    return true;
+  }, [patientId, API_BASE]);
+
   const runSafetyCheck = useCallback(async () => {
     console.log("runSafetyCheck called. PatientId:", patientId, "Staging length:", stagingRef.current?.length);
     if (!patientId) return;
     const text = stagingRef.current || "";
-    const pront = prontuarioRef.current || "";
 
     // Only run if we have some content
     if (!text || text.trim().length < 10) {
@@ -154,21 +183,28 @@ export default function MainPanel({
 
     safetyInFlightRef.current = true;
     try {
-      console.log("Sending live-clinical-check request...");
+      // First tick, or the draft was edited rather than appended to: restart the session
+      if (sessionSeqRef.current === null || !text.startsWith(sentTranscriptRef.current)) {
+        if (!(await openSafetySession())) return;
+      }
+      const seq = sessionSeqRef.current ?? 0;
+      const delta = text.slice(sentTranscriptRef.current.length);
+
+      console.log("Sending live-clinical-check request...", { seq, deltaLength: delta.length });
       setIsSafetyCheckLoading(true);
-      const res = await fetch(`${API_BASE}/api/live-clinical-check`, {
+      const res = await fetch(`${API_BASE}/api/live-clinical-check/sessions/${encodeURIComponent(patientId)}/check`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
-          patient_id: patientId,
-          prontuario: pront,
-          transcript_partial: text,
-        }),
+        body: JSON.stringify({ seq, text: delta }),
       });
       if (!res.ok) {
         console.error("live-clinical-check failed:", res.status);
+        // Session lost or out of sync: the next tick reopens it and resends the full draft
+        sessionSeqRef.current = null;
         return;
       }
+      sessionSeqRef.current = seq + 1;
+      sentTranscriptRef.current = text;
       const data = await res.json();
       console.log("live-clinical-check success:", data);
       const alerts: AlertType[] = data?.critical_alerts || [];
@@ -184,7 +220,7 @@ export default function MainPanel({
       safetyInFlightRef.current = false;
       setIsSafetyCheckLoading(false);
     }
-  }, [patientId, API_BASE]);
+  }, [patientId, API_BASE, openSafetySession]);
 
   // Periodic analysis loop
   useEffect(() => {
@@ -201,12 +237,33 @@ export default function MainPanel({
 
 
   // --- Audio Chunk Handling ---
-  const handleAudioChunk = async (blob: Blob) => {
+  const handleAudioChunk = (blob: Blob, durationMs: number) => {
+    const upload = uploadAudioChunk(blob, durationMs);
+    pendingChunksRef.current.add(upload);
+    upload.finally(() => pendingChunksRef.current.delete(upload));
+  };
+
+  // Recording finished: once every chunk is answered, close the consultation on the server
+  // (its transcript is persisted and released from memory)
+  const handleRecordingComplete = async () => {
+    const sessionId = chunkSessionRef.current;
+    await Promise.allSettled(Array.from(pendingChunksRef.current));
+    try {
+      await fetch(`${API_BASE}/api/transcribe-legacy/live/${encodeURIComponent(sessionId)}`, { method: "DELETE" });
+    } catch (err) {
+      console.error("Error ending transcription session:", err);
+    }
+  };
+
+  const uploadAudioChunk = async (blob: Blob, durationMs: number) => {
     try {
       const form = new FormData();
       // Ensure we send a filename with extension so backend recognizes it
       const file = new File([blob], `chunk_${Date.now()}.webm`, { type: blob.type });
       form.append("file", file);
+      form.append("session_id", chunkSessionRef.current);
+      form.append("seq", String(chunkSeqRef.current++));
+      form.append("duration_ms", String(Math.round(durationMs)));
 
       const res = await fetch(`${API_BASE}/api/transcribe-legacy/live`, {
         method: "POST",
@@ -249,6 +306,14 @@ export default function MainPanel({
     }
   };
 
+  const handleRecordingStateChange = (recording: boolean) => {
+    if (recording) {
+      chunkSessionRef.current = `rec_${Date.now()}_${Math.random().toString(36).slice(2, 8)}`;
+      chunkSeqRef.current = 0;
+    }
+    setIsRecording(recording);
+  };
+
   const handleChatSubmit = () => {
     if (chatInput.trim()) {
       onChat(chatInput);
@@ -369,7 +434,8 @@ export default function MainPanel({
             <div className="flex items-center justify-center p-1">
               <VoiceRecorder
                 onChunk={handleAudioChunk}
-                onStateChange={setIsRecording}
+                onStateChange={handleRecordingStateChange}
+                onRecordingComplete={handleRecordingComplete}
               />
             </div>
           </div>
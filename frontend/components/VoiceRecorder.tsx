@@ -4,7 +4,7 @@ import { useState, useRef, useEffect } from "react";
 import { Mic, Square, Loader2 } from "lucide-react";
 
 interface VoiceRecorderProps {
-    onChunk?: (blob: Blob) => void;
+    onChunk?: (blob: Blob, durationMs: number) => void;
     onStateChange?: (isRecording: boolean) => void;
     onRecordingComplete?: (blob: Blob) => void;
 }
@@ -68,6 +68,7 @@ const VoiceRecorder = ({ onChunk, onStateChange, onRecordingComplete }: VoiceRec
         mediaRecorderRef.current = recorder;
 
         const chunks: Blob[] = [];
+        let startedAt = 0;
 
         recorder.ondataavailable = (e) => {
             if (e.data.size > 0) {
@@ -80,7 +81,7 @@ const VoiceRecorder = ({ onChunk, onStateChange, onRecordingComplete }: VoiceRec
 
             // Emit the full valid file chunk
             if (onChunkRef.current) {
-                onChunkRef.current(blob);
+                onChunkRef.current(blob, performance.now() - startedAt);
             }
 
             // If still recording, start next segment
@@ -96,6 +97,7 @@ const VoiceRecorder = ({ onChunk, onStateChange, onRecordingComplete }: VoiceRec
         };
 
         recorder.start();
+        startedAt = performance.now();
 
         // Stop this segment after 3 seconds to finalize the file
         setTimeout(() => {